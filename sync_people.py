@@ -1,17 +1,47 @@
+from typing import Any, Optional
+from contextvars import ContextVar
+import asyncio
 import json
 import logging
+import os
 import sys
-from utils.config import get_settings, ConfigurationError, DataType, TestMode, OutputType
+import time
+from utils.config import get_settings, load_jobs, use_settings, ConfigurationError, DataType, Settings, SyncJob, TestMode, OutputType
 from utils import workday
 from utils import glean
+from utils import pipeline
+from utils import preflight
+from utils import quarantine
+from utils import report_cache
+from utils import staging
+from utils import metrics
+from utils import http_client
+from utils import profiling
+from utils.records import to_builtin
+from itertools import chain
 import argparse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
 logger = logging.getLogger(__name__)
 
+# Name of the sync job run in the current context, when several jobs run in one process (see run_jobs_async)
+_job_name: ContextVar[Optional[str]] = ContextVar('job_name', default=None)
 
-def main(mode: DataType = DataType.PEOPLE):
+class _JobLogFilter(logging.Filter):
+    """Prefix log messages with the name of the sync job that logged them."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        job_name = _job_name.get()
+        if job_name and not hasattr(record, 'job_name'):
+            record.job_name = job_name
+            record.msg = f"[{job_name.replace('%', '%%')}] {record.msg}"
+        return True
+
+for handler in logging.getLogger().handlers:
+    handler.addFilter(_JobLogFilter())
+
+
+def main(mode: DataType = DataType.PEOPLE, from_staging: bool = False, profile_dir: Optional[str] = None):
     """
     Synchronize people/employee/teams data from Workday to Glean.
 
@@ -35,23 +65,93 @@ def main(mode: DataType = DataType.PEOPLE):
     You will also need to customize the field mapping file (mapping.json) to map the fields from Workday to the fields expected by the Glean API.
     See the README for more information.
 
+    Set WORKDAY_REPORT_FORMAT to fetch the Workday report in CSV or XML format instead of JSON (see utils.report_formats).
+    Set STREAMING_MODE=True to parse the Workday report incrementally, so that the full report is never held in memory.
+    Set PIPELINE_MODE=True to also run the fetch, transform and upload stages concurrently, connected by bounded queues.
+    Set TRANSFORM_PROCESSES to transform large reports in a pool of worker processes (not used in streaming mode).
+    Set REPORT_CACHE_FILE to skip the run when the Workday report has not changed since the last successful sync.
+    Set METRICS_FILE and/or METRICS_PROMETHEUS_FILE to write a summary of the run (time per stage, bytes, retries, etc).
+    Set STAGING_DIR to stage the transformed records on disk and upload them from there. If from_staging is set, the
+    records staged by an earlier run are uploaded again, without fetching or transforming the report.
+    If profile_dir is set, the CPU time and memory allocations of each stage of the run are profiled, and the profiles
+    are written to profile_dir (see utils.profiling).
+
+    The sync runs on an event loop (see main_async), with the Workday report fetched and the data uploaded by a shared
+    async HTTP client. To run it from an existing event loop (e.g. in an async service), await main_async instead.
+
     Run the script `python sync_people.py` to synchronize people data from Workday to Glean.
     Run the script with the --teamsonly flag to only process teams data and memberships (no employee data).
+    Run the script with the --from-staging flag to upload the records staged in STAGING_DIR by an earlier run.
+    Run the script with the --all flag to process people and teams data from a single fetch of the Workday report.
+    Run the script with the --profile PROFILE_DIR option to profile each stage of the run.
     """
     try:
-        # Load settings from environment variables
-        settings = get_settings()
+        # An unchanged report (status 'unchanged') is a successful run too, so it also exits with status 0
+        http_client.run(main_async(mode, from_staging, profile_dir))
+
+    except ConfigurationError as e:
+        logger.error(str(e))
+        exit(1)
+    
+    except Exception as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+    else:
+        sys.exit(0)
+
+def run_warm(mode: DataType = DataType.PEOPLE) -> str:
+    """
+    Synchronize data from a long-lived process, e.g. the handler of a serverless function, and return the status of
+    the run (see main_async). Errors are raised rather than exiting the process.
 
+    Later runs in the same process (e.g. warm invocations of the function) reuse the settings, the compiled field
+    mapping and the event loop, with its HTTP client and idle connections, rather than setting them up again.
+    """
+    return http_client.run_warm(main_async(mode))
+
+async def main_async(mode: DataType = DataType.PEOPLE, from_staging: bool = False, profile_dir: Optional[str] = None) -> str:
+    """
+    Synchronize people/employee/teams data from Workday to Glean, from an event loop. See main for the settings used.
+
+    The Workday report is fetched and the data is uploaded with the shared async HTTP client, and the CPU-bound stages
+    (parsing, transforming, CSV export) run in threads, so the event loop is free to run other tasks meanwhile.
+    Streamed reports and the report cache download the Workday report with the blocking HTTP client, in a thread.
+
+    Returns the status of the run ('success', or 'unchanged' if the report cache found no changes). Unlike main, errors
+    are raised rather than exiting the process.
+    """
+    # Load settings from environment variables
+    settings = get_settings()
+
+    # Set data type to 'teams' or 'all' if requested via cli argument. The settings are cached for later runs in this
+    # process, so the data type is set on a copy.
+    if mode in (DataType.TEAMS, DataType.ALL) and settings.DATA_TYPE != mode:
+        settings = settings.model_copy(update={'DATA_TYPE': mode})
+
+    with use_settings(settings):
+        if not profile_dir:
+            return await _sync(settings, from_staging)
+
+        # Work handed to threads with asyncio.to_thread is profiled as part of the stage it was handed over from
+        asyncio.get_running_loop().set_default_executor(profiling.ProfilingExecutor())
+        with profiling.profile(profile_dir):
+            return await _sync(settings, from_staging)
+
+async def _sync(settings: Settings, from_staging: bool) -> str:
+    run_metrics = metrics.reset_metrics()
+    status = 'failed'
+    # Quarantine entries of the records with problems, once the report is transformed (see QUARANTINE_FILE)
+    quarantined = None
+    try:
         # Adjust logging level based on settings
         logger.setLevel(logging.DEBUG if settings.DEBUG_MODE else logging.INFO)
-        
-        # Set data type to 'teams' if requested via cli argument
-        if mode == DataType.TEAMS:
-            settings.DATA_TYPE = DataType.TEAMS
 
         # Log the data type that will be processed.
         if settings.DATA_TYPE == DataType.TEAMS:
             logger.debug("Data type set to 'teams'. Only processing teams data and memberships.")
+        elif settings.DATA_TYPE == DataType.ALL:
+            logger.debug("Data type set to 'all'. Processing people and teams data from a single fetch of the Workday report.")
 
         # Warn if test mode is enabled
         if settings.TEST_MODE:
@@ -62,57 +162,326 @@ def main(mode: DataType = DataType.PEOPLE):
 
         # Load the field mapping file (Glean API <-> Workday field mapping)
         logger.info(f"Loading mapping file: {settings.FIELD_MAPPING_FILE}")
-        mapping = glean.load_mapping(settings.FIELD_MAPPING_FILE)
-
-        # Fetch the initial data
-        if settings.TEST_MODE == TestMode.PUSH:
-            # Push test mode == Test Glean API only, so load data from local file
-            logger.info(f"Loading test data from: {settings.TEST_DATA_FILE}")
-            with open(f'{settings.TEST_DATA_FILE}', 'r') as f:
-                response_data = json.load(f)
-            logger.debug(f"Test data loaded: {json.dumps(response_data)}")
-        else:
-            # Fetch data from Workday
-            logger.info(f"Fetching data from Workday: {settings.WORKDAY_REPORT_URL}")
-            response_data = workday.get_report_data()
-            #logger.debug(f"Workday data fetched: {json.dumps(response_data)}")
+        mapping = glean.load_mapping(settings.FIELD_MAPPING_FILE, compact=settings.COMPACT_RECORDS, validate=settings.SCHEMA_VALIDATION)
 
-        # Transform the Workday data to Glean API format using the field mapping
-        logger.info("Transforming Workday data to Glean API format...")
-        if settings.DATA_TYPE == DataType.TEAMS:
-            transformed_data = workday.transform_teams(response_data["Report_Entry"], mapping)
+        # Pipeline mode is streaming mode with each stage running in its own thread
+        streaming = settings.STREAMING_MODE or settings.PIPELINE_MODE
+        prefetch = settings.PIPELINE_QUEUE_SIZE if settings.PIPELINE_MODE else 0
+
+        # Only set when the report is fetched with the report cache enabled. Saved once the sync has succeeded.
+        new_cache_entry = None
+
+        if from_staging:
+            # Upload the records staged by an earlier run, without fetching and transforming the report again
+            if not settings.STAGING_DIR:
+                raise ValueError("STAGING_DIR must be set to upload staged records.")
+            if settings.DATA_TYPE == DataType.ALL:
+                transformed_data = staging.load(settings.STAGING_DIR, DataType.PEOPLE.value)
+                transformed_teams = staging.load(settings.STAGING_DIR, DataType.TEAMS.value)
+            else:
+                transformed_data = staging.load(settings.STAGING_DIR, settings.DATA_TYPE.value)
         else:
-            transformed_data = workday.transform_people(response_data["Report_Entry"], mapping)
-        logger.debug(f"Transformed data: {json.dumps(transformed_data)}")
+            # Fetch the initial data
+            if settings.TEST_MODE == TestMode.PUSH:
+                # Push test mode == Test Glean API only, so load data from local file
+                logger.info(f"Loading test data from: {settings.TEST_DATA_FILE}")
+                if streaming:
+                    report_entries = workday.load_report_file(settings.TEST_DATA_FILE)
+                else:
+                    with run_metrics.stage('parse'):
+                        response_data = await asyncio.to_thread(_load_json_file, settings.TEST_DATA_FILE)
+                    _log_sample("Test data loaded", response_data["Report_Entry"])
+                    report_entries = response_data["Report_Entry"]
+            elif settings.REPORT_CACHE_FILE:
+                # Fetch data from Workday, unless it is unchanged since the last successful sync
+                logger.info(f"Fetching data from Workday: {settings.WORKDAY_REPORT_URL}")
+                report_url = workday.report_url()
+                current_mapping_hash = report_cache.mapping_hash(mapping.mapping)
+                current_output = report_cache.output_target(settings.OUTPUT_TYPE.value, settings.GLEAN_BACKEND_DOMAIN)
+                cache_entry = report_cache.load_cache(settings.REPORT_CACHE_FILE, settings.DATA_TYPE.value)
+                if cache_entry and not cache_entry.matches(report_url, current_mapping_hash, current_output):
+                    cache_entry = None
+
+                download = await asyncio.to_thread(
+                    workday.download_report,
+                    etag=cache_entry.etag if cache_entry else None,
+                    last_modified=cache_entry.last_modified if cache_entry else None,
+                    dedupe_key=mapping.mapping.get('id')
+                )
+                if download.not_modified or (cache_entry and download.body_hash == cache_entry.body_hash):
+                    logger.info("The Workday report has not changed since the last successful sync. Skipping transform and upload.")
+                    status = 'unchanged'
+                    return status
+
+                new_cache_entry = report_cache.ReportCacheEntry(
+                    url=report_url,
+                    mapping_hash=current_mapping_hash,
+                    body_hash=download.body_hash,
+                    etag=download.etag,
+                    last_modified=download.last_modified,
+                    output_target=current_output
+                )
+                if streaming:
+                    report_entries = workday.read_report_entries(download.body, download.report_format)
+                else:
+                    with run_metrics.stage('parse'):
+                        report_entries = await asyncio.to_thread(workday.read_report, download.body, download.report_format)
+            else:
+                # Fetch data from Workday
+                logger.info(f"Fetching data from Workday: {settings.WORKDAY_REPORT_URL}")
+                if streaming:
+                    report_entries = workday.stream_report_data(prefetch_chunks=prefetch, dedupe_key=mapping.mapping.get('id'))
+                else:
+                    response_data = await workday.get_report_data_async(dedupe_key=mapping.mapping.get('id'))
+                    #logger.debug(f"Workday data fetched: {json.dumps(response_data)}")
+                    report_entries = response_data["Report_Entry"]
+
+            # Transform the Workday data to Glean API format using the field mapping
+            # In streaming mode, people records are fetched, transformed and uploaded one page at a time (so the time spent
+            # fetching and transforming them is part of the upload stage)
+            logger.info("Transforming Workday data to Glean API format...")
+            quarantined = []
+            with run_metrics.stage('transform'):
+                if settings.DATA_TYPE == DataType.ALL:
+                    # Teams are only complete once every record has been read, so both outputs are built in full
+                    transformed_data, transformed_teams = await asyncio.to_thread(workday.transform_people_and_teams, report_entries, mapping,
+                                                                                  processes=settings.TRANSFORM_PROCESSES, rejected=quarantined)
+                    logger.info(f"Transformed {len(transformed_data)} people and {len(transformed_teams)} teams.")
+                elif settings.DATA_TYPE == DataType.TEAMS:
+                    transformed_data = await asyncio.to_thread(workday.transform_teams, report_entries, mapping, rejected=quarantined)
+                elif streaming:
+                    transformed_data = workday.iter_transform_people(report_entries, mapping, rejected=quarantined)
+                    if settings.PIPELINE_MODE:
+                        # Parse and transform in a background thread, handing over full pages to the upload stage
+                        pages = pipeline.batched(transformed_data, settings.BATCH_SIZE)
+                        transformed_data = chain.from_iterable(pipeline.threaded(pages, prefetch, name='transform'))
+                else:
+                    transformed_data = await asyncio.to_thread(workday.transform_people, report_entries, mapping, processes=settings.TRANSFORM_PROCESSES,
+                                                              rejected=quarantined)
+
+            # Check the people for problems that would make Glean reject the upload, before any of them is sent
+            if settings.PREFLIGHT_CHECK and settings.DATA_TYPE != DataType.TEAMS:
+                if isinstance(transformed_data, list):
+                    with run_metrics.stage('preflight'):
+                        transformed_data = await asyncio.to_thread(preflight.run_checks, transformed_data, settings.PREFLIGHT_CHECK, quarantined,
+                                                                   teams=transformed_teams if settings.DATA_TYPE == DataType.ALL else None)
+                else:
+                    logger.warning("PREFLIGHT_CHECK is ignored in streaming mode, as people are uploaded as they are transformed.")
+
+            # Release the report once it has been transformed (in streaming mode, it is still referenced by the transform).
+            # With COMPACT_RECORDS, the transformed records share strings rather than keeping the report's copies alive.
+            report_entries = response_data = None
+
+            if settings.DATA_TYPE == DataType.ALL:
+                _log_sample("Transformed data", transformed_data)
+                _log_sample("Transformed teams data", transformed_teams)
+            elif not streaming:
+                _log_sample("Transformed data", transformed_data)
+
+        # Stage the transformed records on disk, so that they are uploaded from there (and can be uploaded again with
+        # --from-staging). A stream of records is fetched and transformed as it is staged.
+        if settings.STAGING_DIR and not from_staging and settings.OUTPUT_TYPE != OutputType.CSV:
+            with run_metrics.stage('staging'):
+                if settings.DATA_TYPE == DataType.ALL:
+                    transformed_data = await asyncio.to_thread(glean.stage_entities, transformed_data, DataType.PEOPLE.value)
+                    transformed_teams = await asyncio.to_thread(glean.stage_entities, transformed_teams, DataType.TEAMS.value)
+                else:
+                    transformed_data = await asyncio.to_thread(glean.stage_entities, transformed_data, settings.DATA_TYPE.value)
 
         # Export the transformed data to CSV files or push to Glean API
-        if settings.OUTPUT_TYPE == OutputType.CSV:
-            # CSV output mode
-            logger.info("Exporting data to CSV files...")
-            glean.create_csv(transformed_data, 'people.csv' if settings.DATA_TYPE == DataType.PEOPLE else 'teams.csv', settings.DATA_TYPE.value)
-        elif settings.TEST_MODE != TestMode.PULL:
-            # Push to Glean API
-            # Skipped if in pull test mode (testing Workday data fetch only)
-            result = glean.bulk_upload_entities(transformed_data, type=settings.DATA_TYPE)
-            if result.warnings:
-                logger.warning("The following warnings were encountered during the upload:")
-                for warning in result.warnings:
-                    logger.warning(f" - {warning}")
+        with run_metrics.stage('export' if settings.OUTPUT_TYPE == OutputType.CSV else 'upload'):
+            if settings.OUTPUT_TYPE == OutputType.CSV:
+                # CSV output mode
+                # In streaming mode, records are written as they are transformed, so the export uses constant memory
+                logger.info("Exporting data to CSV files...")
+                extension = '.csv.gz' if settings.CSV_GZIP else '.csv'
+                if settings.DATA_TYPE == DataType.ALL:
+                    await asyncio.to_thread(glean.create_csv, transformed_data, f'people{extension}', DataType.PEOPLE.value, mapping, compress=settings.CSV_GZIP)
+                    await asyncio.to_thread(glean.create_csv, transformed_teams, f'teams{extension}', DataType.TEAMS.value, mapping, compress=settings.CSV_GZIP)
+                else:
+                    await asyncio.to_thread(glean.create_csv, transformed_data, f'{settings.DATA_TYPE.value}{extension}', settings.DATA_TYPE.value, mapping,
+                                            compress=settings.CSV_GZIP)
+            elif settings.TEST_MODE != TestMode.PULL:
+                # Push to Glean API
+                # Skipped if in pull test mode (testing Workday data fetch only)
+                if settings.DATA_TYPE == DataType.ALL:
+                    # Both uploads run at the same time, and processing of both is requested once at the end
+                    results = await glean.upload_people_and_teams_async(transformed_data, transformed_teams, delta_sync=settings.DELTA_SYNC)
+                elif settings.DELTA_SYNC:
+                    results = [await glean.delta_upload_entities_async(transformed_data, type=settings.DATA_TYPE)]
+                else:
+                    results = [await glean.bulk_upload_entities_async(transformed_data, type=settings.DATA_TYPE)]
+                warnings = [warning for result in results for warning in result.warnings]
+                if warnings:
+                    logger.warning("The following warnings were encountered during the upload:")
+                    for warning in warnings:
+                        logger.warning(f" - {warning}")
+                if settings.STAGING_DIR:
+                    staged = [transformed_data, transformed_teams] if settings.DATA_TYPE == DataType.ALL else [transformed_data]
+                    for records, result in zip(staged, results):
+                        staging.mark_uploaded(records, result.upload_id)
+            elif streaming and settings.DATA_TYPE != DataType.ALL and not settings.STAGING_DIR:
+                # Pull test mode: nothing is fetched until the stream is consumed, so drain it (staging already has)
+                count = await asyncio.to_thread(sum, (1 for _ in transformed_data))
+                logger.info(f"Fetched and transformed {count} records.")
+
+        # Pull test mode doesn't push any data, so the report must not be treated as synced
+        if new_cache_entry and settings.TEST_MODE != TestMode.PULL:
+            report_cache.save_cache(settings.REPORT_CACHE_FILE, settings.DATA_TYPE.value, new_cache_entry)
+
+        status = 'success'
+        return status
+
+    finally:
+        # In streaming mode, invalid records are only all known once the upload has consumed the stream
+        if quarantined is not None and settings.QUARANTINE_FILE:
+            try:
+                quarantine.write(settings.QUARANTINE_FILE, quarantined)
+            except OSError as e:
+                logger.warning(f"Could not write the quarantine file: {e}")
+        write_run_summary(run_metrics, status)
+
+def _log_sample(description: str, records: list[Any]):
+    """
+    Log an evenly spaced sample of DEBUG_LOG_SAMPLE_SIZE records at debug level. Only the sampled records are
+    serialized, and only if debug logging is enabled, so debug logging costs little however large the data is.
+    """
+    sample_size = get_settings().DEBUG_LOG_SAMPLE_SIZE
+    if not records or sample_size <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return
+    sample = records[::max(1, len(records) // sample_size)][:sample_size]
+    logger.debug(f"{description} ({len(sample)} of {len(records)} records): {json.dumps(sample, default=to_builtin)}")
+
+def _load_json_file(file_path: str) -> Any:
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+
+def write_run_summary(run_metrics: metrics.RunMetrics, status: str):
+    """Log a summary of the run and write it to METRICS_FILE/METRICS_PROMETHEUS_FILE, if set."""
+    try:
+        settings = get_settings()
+    except ConfigurationError:
+        return
+
+    summary = run_metrics.summary(status, settings.DATA_TYPE.value)
+    stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in summary['stages'].items())
+    peak_rss = f" Peak memory: {summary['peak_rss_bytes'] / (1024 * 1024):.0f} MiB." if summary['peak_rss_bytes'] else ""
+    fetched = summary['counters'].get('workday_bytes_fetched')
+    transferred = summary['counters'].get('workday_bytes_transferred')
+    # The size of the report as fetched and as transferred, to compare report formats and compression
+    report_size = (f" Workday report ({settings.WORKDAY_REPORT_FORMAT.value}): {fetched / (1024 * 1024):.1f} MiB, "
+                   f"{transferred / (1024 * 1024):.1f} MiB transferred." if fetched and transferred is not None else "")
+    logger.info(f"Run finished ({status}) in {summary['duration_seconds']:.2f}s" + (f": {stages}." if stages else ".") + report_size + peak_rss)
+
+    try:
+        if settings.METRICS_FILE:
+            metrics.write_json(settings.METRICS_FILE, summary)
+        if settings.METRICS_PROMETHEUS_FILE:
+            metrics.write_prometheus(settings.METRICS_PROMETHEUS_FILE, summary)
+    except OSError as e:
+        logger.warning(f"Could not write the run metrics: {e}")
+
+def _job_output_files(settings: Settings) -> list[str]:
+    """Return the files a sync job writes to: its state, cache, checkpoint, metrics, quarantine and CSV files, and its staging directory."""
+    files = [settings.REPORT_CACHE_FILE, settings.UPLOAD_CHECKPOINT_FILE, settings.METRICS_FILE, settings.METRICS_PROMETHEUS_FILE,
+             settings.STAGING_DIR, settings.QUARANTINE_FILE]
+    if settings.DELTA_SYNC:
+        files.append(settings.DELTA_SYNC_STATE_FILE)
+    if settings.OUTPUT_TYPE == OutputType.CSV:
+        extension = '.csv.gz' if settings.CSV_GZIP else '.csv'
+        data_types = [DataType.PEOPLE, DataType.TEAMS] if settings.DATA_TYPE == DataType.ALL else [settings.DATA_TYPE]
+        files.extend(f'{data_type.value}{extension}' for data_type in data_types)
+    return [os.path.abspath(file) for file in files if file]
 
+async def run_jobs_async(jobs: list[SyncJob]) -> dict[str, str]:
+    """
+    Run several sync jobs (e.g. of different Workday reports or Glean tenants) concurrently in this process.
+
+    Each job runs main_async with its own settings and metrics, and its log messages are prefixed with its name. A job
+    that fails, or whose settings are invalid, does not stop the others. No two jobs may write to the same file (e.g.
+    DELTA_SYNC_STATE_FILE or METRICS_FILE).
+
+    All jobs share one HTTP client, with a connection pool of the sum of their HTTP_MAX_CONNECTIONS. Jobs that upload
+    to the same Glean tenant share its GLEAN_MAX_CONCURRENT_REQUESTS and GLEAN_MAX_REQUESTS_PER_SECOND limits (the
+    lowest value set by any of them).
+
+    Returns the status of each job by name: 'success', 'unchanged' or 'failed'.
+    """
+    statuses = {job.name: 'failed' for job in jobs}
+    job_settings: dict[str, Settings] = {}
+    output_files: dict[str, str] = {}
+    for job in jobs:
+        try:
+            settings = job.load_settings()
+            files = _job_output_files(settings)
+            for file in files:
+                if file in output_files:
+                    raise ConfigurationError(f"Sync jobs '{output_files[file]}' and '{job.name}' both write to {file}.")
+        except ConfigurationError as e:
+            logger.error(str(e))
+            continue
+        output_files.update(dict.fromkeys(files, job.name))
+        job_settings[job.name] = settings
+
+    if not job_settings:
+        return statuses
+
+    http_client.open_async_client(sum(settings.HTTP_MAX_CONNECTIONS for settings in job_settings.values()),
+                                  max(settings.HTTP_KEEPALIVE_EXPIRY for settings in job_settings.values()))
+    tenants: dict[str, list[Settings]] = {}
+    for settings in job_settings.values():
+        tenants.setdefault(settings.GLEAN_BACKEND_DOMAIN, []).append(settings)
+    for domain, tenant_settings in tenants.items():
+        glean.set_tenant_limits(domain,
+                                min((settings.GLEAN_MAX_CONCURRENT_REQUESTS for settings in tenant_settings if settings.GLEAN_MAX_CONCURRENT_REQUESTS), default=None),
+                                min((settings.GLEAN_MAX_REQUESTS_PER_SECOND for settings in tenant_settings if settings.GLEAN_MAX_REQUESTS_PER_SECOND), default=None))
+
+    async def run_job(name: str, settings: Settings) -> str:
+        # Each job runs in its own task, so the job name and settings set here are only seen by this job
+        _job_name.set(name)
+        with use_settings(settings):
+            try:
+                return await main_async(settings.DATA_TYPE)
+            except Exception as e:
+                logger.error(f"{e}")
+                return 'failed'
+
+    logger.info(f"Running {len(job_settings)} sync jobs: {', '.join(job_settings)}")
+    results = await asyncio.gather(*(run_job(name, settings) for name, settings in job_settings.items()))
+    statuses.update(zip(job_settings, results))
+    return statuses
+
+def run_jobs(jobs_file: str):
+    """Run the sync jobs listed in a JSON file concurrently (see load_jobs and run_jobs_async), and exit with status 1 if any failed."""
+    started = time.perf_counter()
+    try:
+        statuses = http_client.run(run_jobs_async(load_jobs(jobs_file)))
     except ConfigurationError as e:
         logger.error(str(e))
-        exit(1)
-    
-    except Exception as e:
-        logger.error(f"{e}")
         sys.exit(1)
 
-    else:
-        sys.exit(0)
+    failed = [name for name, status in statuses.items() if status == 'failed']
+    logger.info(f"Finished {len(statuses)} sync jobs in {time.perf_counter() - started:.2f}s: " +
+                ', '.join(f"{name} ({status})" for name, status in statuses.items()) + ".")
+    sys.exit(1 if failed else 0)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--teamsonly", action="store_true", help="Only process teams data and memberships.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--teamsonly", action="store_true", help="Only process teams data and memberships.")
+    group.add_argument("--all", action="store_true", help="Process people and teams data from a single fetch of the Workday report.")
+    group.add_argument("--jobs", metavar="JOBS_FILE", help="Run the sync jobs listed in this JSON file concurrently, each with its own settings.")
+    parser.add_argument("--from-staging", action="store_true", help="Upload the records staged in STAGING_DIR by an earlier run, without fetching the Workday report.")
+    parser.add_argument("--profile", metavar="PROFILE_DIR", help="Profile the CPU time and memory allocations of each stage of the run, writing the profiles to this directory.")
     args = parser.parse_args()
+    if args.jobs and args.profile:
+        parser.error("--profile cannot be used with --jobs.")
+    if args.jobs and args.from_staging:
+        parser.error("--from-staging cannot be used with --jobs.")
 
-    main(mode=DataType.TEAMS if args.teamsonly else DataType.PEOPLE)
\ No newline at end of file
+    if args.jobs:
+        run_jobs(args.jobs)
+    else:
+        main(mode=DataType.TEAMS if args.teamsonly else DataType.ALL if args.all else DataType.PEOPLE, from_staging=args.from_staging,
+             profile_dir=args.profile)
\ No newline at end of file
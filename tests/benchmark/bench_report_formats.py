@@ -0,0 +1,80 @@
+# Benchmark of the Workday report formats (see WORKDAY_REPORT_FORMAT): the size of a synthetic report in each format,
+# as sent with and without gzip compression, and the time taken to parse it into Report_Entry items.
+# Run from the repository root: python tests/benchmark/bench_report_formats.py [--workers 50000] [--repeat 3]
+
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_report import DEFAULT_MAPPING, generate_entries, report_columns, write_csv_report, write_report, write_xml_report
+from utils import workday
+from utils.config import ReportFormat
+
+MIB = 1024 * 1024
+
+
+def render(report_format: ReportFormat, entries: list[dict], mapping: dict) -> bytes:
+    f = io.StringIO(newline='')
+    if report_format == ReportFormat.CSV:
+        write_csv_report(f, iter(entries), report_columns(mapping))
+    elif report_format == ReportFormat.XML:
+        write_xml_report(f, iter(entries))
+    else:
+        write_report(f, iter(entries))
+    return f.getvalue().encode('utf-8')
+
+
+def parse(report_format: ReportFormat, body: bytes) -> list[dict]:
+    # Parsed from chunks of the size read from a streamed response, as in STREAMING_MODE
+    chunks = (body[i:i + workday.STREAM_CHUNK_SIZE] for i in range(0, len(body), workday.STREAM_CHUNK_SIZE))
+    return list(workday.parse_report_entries(chunks, report_format))
+
+
+def best_time(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the size and parse time of the Workday report formats.')
+    parser.add_argument('--workers', type=int, default=50000, help='Number of workers in the synthetic report.')
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING, help='Mapping file that defines the fields of the report.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times each report is parsed (best is reported).')
+    args = parser.parse_args()
+
+    with open(args.mapping, 'r') as f:
+        mapping = json.load(f)
+    entries = list(generate_entries(args.workers, mapping))
+    plan = workday.compile_mapping(mapping)
+    expected = None
+
+    print(f"{'format':<8}{'size':>12}{'gzipped':>12}{'gunzip':>10}{'parse':>10}{'records/s':>12}  transformed")
+    for report_format in ReportFormat:
+        body = render(report_format, entries, mapping)
+        compressed = gzip.compress(body, compresslevel=6)
+        gunzip_seconds = best_time(lambda: gzip.decompress(compressed), args.repeat)
+        parse_seconds = best_time(lambda: parse(report_format, body), args.repeat)
+
+        # The people and teams transformed from each format are compared with those transformed from the JSON report
+        parsed = parse(report_format, body)
+        transformed = (workday.transform_people(parsed, plan), workday.transform_teams(parsed, plan))
+        expected = expected or transformed
+        same = 'same as json' if transformed == expected else 'DIFFERENT from json'
+
+        print(f"{report_format.value:<8}{len(body) / MIB:>9.1f} MiB{len(compressed) / MIB:>8.1f} MiB"
+              f"{gunzip_seconds:>9.2f}s{parse_seconds:>9.2f}s{len(parsed) / parse_seconds:>12.0f}  {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Benchmark of the start-up time of the connector: the import time of sync_people, checked against a budget, and the
+# time of a cold run (first run in a process) against that of warm runs (later runs in the same process, see run_warm).
+# Run from the repository root: python tests/benchmark/bench_startup.py [--budget-ms 400] [--repeat 5] [--runs 3]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+# Import time of sync_people above which the check fails (also checked by tests/test_startup.py)
+IMPORT_BUDGET_MS = 400
+
+# Dependencies that must not be imported by `import sync_people`, as only some runs need them (see utils.lazy)
+LAZY_MODULES = ['httpx', 'requests']
+
+IMPORT_SCRIPT = f'''
+import json, sys, time
+start = time.perf_counter()
+import sync_people
+seconds = time.perf_counter() - start
+loaded = [name for name in {LAZY_MODULES!r} if name in sys.modules]
+print(json.dumps({{'seconds': seconds, 'loaded': loaded}}))
+'''
+
+RUN_SCRIPT = '''
+import json, logging, os, sys, threading, time
+sys.path.insert(0, os.path.join('tests', 'glean'))
+import server as standin
+
+glean = standin.make_server('127.0.0.1', 0, standin.StandInConfig())
+threading.Thread(target=glean.serve_forever, daemon=True).start()
+os.environ.update({
+    'TEST_MODE': 'push',
+    'TEST_DATA_FILE': os.path.join('tests', 'sample_data.json'),
+    'GLEAN_BACKEND_DOMAIN': f'http://127.0.0.1:{glean.server_address[1]}',
+    'GLEAN_API_KEY': 'benchmark',
+})
+logging.disable(logging.INFO)
+
+from sync_people import run_warm
+runs = []
+for _ in range(int(sys.argv[1])):
+    run_start = time.perf_counter()
+    run_warm()
+    runs.append(time.perf_counter() - run_start)
+print(json.dumps({'runs': runs}))
+'''
+
+
+def run_child(script: str, *args: str) -> dict:
+    output = subprocess.run([sys.executable, '-c', script, *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the connector and its cold and warm run times.')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS, help='Import time of sync_people above which the check fails.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of fresh processes the import is timed in (best is reported).')
+    parser.add_argument('--runs', type=int, default=3, help='Number of runs of the sample report in one process (the first is cold).')
+    args = parser.parse_args()
+
+    imports = [run_child(IMPORT_SCRIPT) for _ in range(args.repeat)]
+    import_ms = min(result['seconds'] for result in imports) * 1000
+    loaded = sorted({name for result in imports for name in result['loaded']})
+    print(f"import sync_people: {import_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    runs = run_child(RUN_SCRIPT, str(args.runs))['runs']
+    for i, seconds in enumerate(runs):
+        print(f"{'cold' if i == 0 else 'warm'} run {i + 1}: {seconds * 1000:.0f} ms")
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"importing sync_people took {import_ms:.0f} ms, more than the budget of {args.budget_ms:.0f} ms")
+    if loaded:
+        failures.append(f"importing sync_people loaded {', '.join(loaded)}, which must only be imported when used")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Benchmark suite measuring throughput and peak memory of the connector on synthetic Workday reports.
+# Run from the repository root: python tests/benchmark/bench_suite.py [--workers 10000 100000] [--json results.json]
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_report import DEFAULT_MAPPING, generate_entries
+from utils import glean, workday
+from utils.config import get_settings
+
+CASES = ['transform_people', 'transform_teams', 'create_csv', 'bulk_upload_entities']
+
+
+@contextlib.contextmanager
+def glean_standin(server_args: list[str]):
+    """Run the local Glean Indexing API stand-in and point the connector at it."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'tests', 'glean', 'server.py'), '--port', str(port), *server_args],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        server.stdout.readline()  # Wait until the server is listening
+        os.environ.update({
+            'TEST_MODE': 'push',
+            'TEST_DATA_FILE': 'unused',
+            'GLEAN_BACKEND_DOMAIN': f'http://127.0.0.1:{port}',
+            'GLEAN_API_KEY': 'benchmark',
+        })
+        get_settings.cache_clear()
+        yield
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure(func: Callable[[], Any], repeat: int, memory: bool) -> tuple[float, float]:
+    """Return the best run time in seconds and, if measured, the peak memory allocated in MiB during a separate run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    peak = float('nan')
+    if memory:
+        # Tracing slows allocations down, so peak memory is measured in its own run
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure throughput and peak memory of the connector on synthetic Workday reports.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[10000, 100000], help='Report sizes to benchmark.')
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES, help='Cases to run.')
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING, help='Mapping file that defines the fields of the report.')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of timed runs per case (best run is reported).')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic report.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the (slower) peak memory measurement.')
+    parser.add_argument('--glean-latency', type=float, default=0.0, help='Seconds the Glean API stand-in adds to every request.')
+    parser.add_argument('--glean-rate-429', type=float, default=0.0, help='Fraction of requests the Glean API stand-in fails with HTTP 429.')
+    parser.add_argument('--compact-records', action='store_true', help='Transform into compact records (COMPACT_RECORDS=true).')
+    parser.add_argument('--json', help='Also write the results to this file, e.g. to compare runs before and after a change.')
+    args = parser.parse_args()
+
+    with open(args.mapping, 'r') as f:
+        mapping = json.load(f)
+    plan = workday.compile_mapping(mapping, compact=args.compact_records)
+
+    # The connector logs every uploaded page, which would be measured too
+    logging.disable(logging.INFO)
+
+    results = []
+    print(f"{'case':<22} {'workers':>9} {'seconds':>9} {'rec/s':>11} {'peak MiB':>9}")
+    server_args = ['--latency', str(args.glean_latency), '--rate-429', str(args.glean_rate_429), '--retry-after', '0']
+    with glean_standin(server_args), tempfile.TemporaryDirectory() as temp_dir:
+        for workers in args.workers:
+            report = list(generate_entries(workers, mapping, seed=args.seed))
+            people = workday.transform_people(report, plan)
+            teams = workday.transform_teams(report, plan)
+
+            cases = {
+                'transform_people': lambda: workday.transform_people(report, plan),
+                'transform_teams': lambda: workday.transform_teams(report, plan),
+                'create_csv': lambda: glean.create_csv(people, os.path.join(temp_dir, 'people.csv'), 'people', plan),
+                'bulk_upload_entities': lambda: glean.bulk_upload_entities(people, 'people'),
+            }
+            for case in args.cases:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    seconds, peak = measure(cases[case], args.repeat, not args.no_memory)
+                print(f"{case:<22} {workers:>9,} {seconds:>9.2f} {workers / seconds:>11,.0f} {peak:>9.1f}")
+                results.append({'case': case, 'workers': workers, 'teams': len(teams), 'seconds': seconds,
+                                'records_per_second': workers / seconds, 'peak_mib': None if args.no_memory else peak})
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# Benchmark of the compiled transform plan against the original per-record mapping walk.
+# Run from the repository root: python tests/benchmark/bench_transform.py [--records 50000] [--repeat 3]
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from utils import workday
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test_people_sync')
+
+
+def legacy_transform_people(input_data: list[dict[str, Any]], mapping: dict[str, Any]) -> list[dict[str, Any]]:
+    """transform_people as it was before the mapping was compiled into a transform plan."""
+    transformed_data = []
+    all_additional_fields = set()
+
+    for item in input_data:
+        for field in mapping.get('additionalFields', []):
+            if field in item:
+                all_additional_fields.add(field)
+
+    for item in input_data:
+        transformed_item = {}
+        social_networks = []
+        additional_fields = []
+
+        for api_key, customer_key in mapping.items():
+            if api_key == 'additionalFields':
+                continue
+            elif api_key.endswith('Url') and api_key not in ['photoUrl', 'profileUrl']:
+                network_name = api_key[:-3].lower()
+                profile_name = {'linkedin': 'LinkedIn', 'whatsapp': 'WhatsApp', 'imessage': 'iMessage'}.get(network_name, network_name.title())
+                url = item.get(customer_key)
+                if url:
+                    social_networks.append({'name': network_name, 'profileName': profile_name, 'profileUrl': url})
+            elif isinstance(customer_key, dict):
+                transformed_item[api_key] = {sub_api_key: item.get(sub_customer_key) for sub_api_key, sub_customer_key in customer_key.items()}
+            elif isinstance(customer_key, list):
+                source_list = item.get(customer_key[0]['__sourceField'], [])
+                transformed_item[api_key] = [{sub_api_key: source_item.get(sub_customer_key)
+                                              for sub_api_key, sub_customer_key in customer_key[0].items()
+                                              if not sub_api_key.startswith('__')}
+                                             for source_item in source_list] if isinstance(source_list, list) else []
+            else:
+                transformed_item[api_key] = item.get(customer_key)
+
+        for field in all_additional_fields:
+            value = item.get(field)
+            if value:
+                if not isinstance(value, list):
+                    value = [str(value)]
+                additional_fields.append({'key': field, 'value': value})
+
+        transformed_item['additionalFields'] = additional_fields
+
+        workday.handle_missing_name(transformed_item)
+        workday.process_status(transformed_item)
+        workday.process_type(transformed_item)
+
+        if social_networks:
+            transformed_item['socialNetworks'] = social_networks
+
+        transformed_data.append(transformed_item)
+
+    return transformed_data
+
+
+def legacy_transform_teams(input_data: list[dict[str, Any]], mapping: dict[str, Any]) -> list[dict[str, Any]]:
+    """transform_teams as it was before the mapping was compiled into a transform plan."""
+    teams = {}
+    team_field = mapping['teams'][0]['__sourceField']
+    team_name_key = mapping['teams'][0]['name']
+    team_id_key = mapping['teams'][0]['id']
+    email_key = mapping['email']
+
+    for item in input_data:
+        email = item.get(email_key)
+        for team in item.get(team_field, []):
+            team_id = team.get(team_id_key)
+            if team_id:
+                if team_id not in teams:
+                    teams[team_id] = {'id': team_id, 'name': team.get(team_name_key), 'members': []}
+                    for key, value in mapping['teams'][0].items():
+                        if not key.startswith('__') and key not in ['id', 'name']:
+                            teams[team_id][key] = team.get(value)
+                teams[team_id]['members'].append(dict(email=email))
+
+    return list(teams.values())
+
+
+def build_report(records: int) -> list[dict[str, Any]]:
+    """Build a report of the requested size by cloning the sample workers with unique ids, emails and teams."""
+    with open(os.path.join(SAMPLE_DIR, 'input_data.json'), 'r') as f:
+        sample = json.load(f)['Report_Entry']
+
+    report = []
+    for i in range(records):
+        item = copy.deepcopy(sample[i % len(sample)])
+        item['workerID'] = str(i)
+        item['workerEmail'] = f'worker{i}@example.com'
+        item['languages'] = ['English']
+        item['DOB'] = '1990-01-01'
+        for team in item.get('workerTeams', []):
+            team['teamID'] = f"{team['teamID']}-{i % 500}"
+        report.append(item)
+    return report
+
+
+def measure(func, report: list[dict[str, Any]], mapping: Any, repeat: int) -> float:
+    """Return the best records/sec over a number of runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(report, mapping)
+        best = min(best, time.perf_counter() - start)
+    return len(report) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the compiled transform plan against the original per-record mapping walk.')
+    parser.add_argument('--records', type=int, default=50000, help='Number of workers in the synthetic report.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per case (best run is reported).')
+    parser.add_argument('--processes', type=int, default=0, help='Also measure transform_people in this many worker processes.')
+    args = parser.parse_args()
+
+    with open(os.path.join(SAMPLE_DIR, 'mapping.json'), 'r') as f:
+        mapping = json.load(f)
+    plan = workday.compile_mapping(mapping)
+    report = build_report(args.records)
+
+    cases = [
+        ('transform_people', legacy_transform_people, workday.transform_people),
+        ('transform_teams', legacy_transform_teams, workday.transform_teams),
+    ]
+
+    print(f"{'function':<18} {'legacy rec/s':>14} {'compiled rec/s':>16} {'speedup':>9}")
+    for name, legacy, compiled in cases:
+        legacy_rate = measure(legacy, report, mapping, args.repeat)
+        compiled_rate = measure(compiled, report, plan, args.repeat)
+        print(f"{name:<18} {legacy_rate:>14,.0f} {compiled_rate:>16,.0f} {compiled_rate / legacy_rate:>8.2f}x")
+
+    if args.processes > 1:
+        if args.records < workday.PARALLEL_TRANSFORM_MIN_RECORDS:
+            print(f"Note: fewer than {workday.PARALLEL_TRANSFORM_MIN_RECORDS} records are always transformed in-process.")
+        single_rate = measure(workday.transform_people, report, plan, args.repeat)
+        parallel_rate = measure(lambda report, plan: workday.transform_people(report, plan, processes=args.processes), report, plan, args.repeat)
+        print(f"\ntransform_people in {args.processes} processes: {parallel_rate:,.0f} rec/s ({parallel_rate / single_rate:.2f}x of a single process)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# Generator of synthetic Workday reports for benchmarking the connector at scale.
+# Run from the repository root:
+#   python tests/benchmark/generate_report.py --workers 100000 --output /tmp/report.json [--mapping mapping.json] [--format json]
+
+import argparse
+import csv
+import json
+import os
+import random
+from typing import IO, Any, Iterator
+from xml.sax.saxutils import escape
+
+DEFAULT_MAPPING = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'mapping.json')
+
+FIRST_NAMES = ['James', 'Mary', 'Wei', 'Priya', 'Carlos', 'Fatima', 'Olga', 'Kenji', 'Amara', 'Liam', 'Sofia', 'Noah',
+               'Aisha', 'Mateo', 'Yuki', 'Elena', 'Omar', 'Chloe', 'Arjun', 'Hana', 'Lucas', 'Zara', 'Ivan', 'Maya']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Okafor', 'Kowalski', 'Nguyen', 'Müller', 'Silva', 'Kim', 'Haddad',
+              'Johansson', 'Rossi', 'Tanaka', 'Dubois', "O'Brien", 'Singh', 'Ivanova', 'Cohen', 'Mensah', 'Lopez']
+DEPARTMENTS = ['Engineering', 'Sales', 'Marketing', 'Finance', 'People', 'Legal', 'Support', 'Operations', 'Product', 'Design']
+TITLES = ['Engineer', 'Senior Engineer', 'Manager', 'Director', 'Analyst', 'Specialist', 'Coordinator', 'Consultant']
+WORKER_TYPES = ['Full-time'] * 8 + ['Contractor', 'Non-employee']
+PRONOUNS = ['He/Him', 'She/Her', 'They/Them', None]
+LOCATIONS = [
+    ('San Francisco', 'California', 'United States', 'North America', 'US', 'America/Los_Angeles', '94107'),
+    ('New York', 'New York', 'United States', 'North America', 'US', 'America/New_York', '10001'),
+    ('London', 'England', 'United Kingdom', 'EMEA', 'GB', 'Europe/London', 'EC1A 1BB'),
+    ('Berlin', 'Berlin', 'Germany', 'EMEA', 'DE', 'Europe/Berlin', '10115'),
+    ('Bangalore', 'Karnataka', 'India', 'APAC', 'IN', 'Asia/Kolkata', '560001'),
+    ('Sydney', 'New South Wales', 'Australia', 'APAC', 'AU', 'Australia/Sydney', '2000'),
+]
+LANGUAGES = ['English', 'Spanish', 'Mandarin', 'Hindi', 'French', 'German', 'Japanese', 'Portuguese']
+SKILLS = ['Python', 'SQL', 'Negotiation', 'Public Speaking', 'Kubernetes', 'Accounting', 'Figma', 'Salesforce', 'Go', 'Excel']
+
+
+def worker_name(i: int) -> tuple[str, str]:
+    """Return the first and last name of worker i. Names are derived from the index so managers can be referenced."""
+    return FIRST_NAMES[i * 7 % len(FIRST_NAMES)], LAST_NAMES[i * 13 % len(LAST_NAMES)]
+
+
+def worker_email(i: int) -> str:
+    first, last = worker_name(i)
+    return f"{first}.{last.replace(' ', '').replace(chr(39), '')}{i}@example.com".lower()
+
+
+def additional_field_value(field: str, rng: random.Random) -> Any:
+    """Return a plausible value for an additional field, based on its name."""
+    if field == 'languages':
+        return rng.sample(LANGUAGES, rng.randint(1, 3))
+    if field == 'skills':
+        return rng.sample(SKILLS, rng.randint(1, 5))
+    if field in ('certifications', 'education', 'awards', 'patents'):
+        return [f"{field[:-1].title()} {rng.randint(1, 500)}" for _ in range(rng.randint(1, 3))]
+    if field == 'DOB':
+        return f"{rng.randint(1955, 2004)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if field in ('backgroundCheck', 'inProbation'):
+        return rng.choice(['true', 'false'])
+    return f"{field} value {rng.randint(1, 1000)}"
+
+
+def generate_entries(workers: int, mapping: dict[str, Any], seed: int = 0, span: int = 8, teams_per_worker: float = 2.0,
+                     additional_density: float = 0.4) -> Iterator[dict[str, Any]]:
+    """
+    Yield synthetic Report_Entry items for the given mapping.
+
+    Each Workday field named in the mapping is filled with a value suited to the Glean field it is mapped to. Workers
+    form a single management tree with about span direct reports per manager. Team sizes follow a long-tailed
+    distribution (a few large teams and many small ones), with teams_per_worker memberships per worker on average.
+    Each additional field is present on a worker with probability additional_density.
+    """
+    rng = random.Random(seed)
+    team_mapping = (mapping.get('teams') or [{}])[0]
+    team_count = max(1, int(workers * teams_per_worker / 12))
+    additional_fields = mapping.get('additionalFields', [])
+    location_keys = mapping.get('structuredLocation', {})
+
+    for i in range(workers):
+        first, last = worker_name(i)
+        department = DEPARTMENTS[i % len(DEPARTMENTS)]
+        city, state, country, region, country_code, timezone, zip_code = LOCATIONS[rng.randrange(len(LOCATIONS))]
+        terminated = rng.random() < 0.03
+        hire_year = rng.randint(2005, 2025)
+        values = {
+            'id': str(100000 + i),
+            'email': worker_email(i),
+            'firstName': first,
+            'lastName': last,
+            'preferredName': f"{first} {last}",
+            'pronoun': rng.choice(PRONOUNS),
+            'title': f"{rng.choice(TITLES)}, {department}",
+            'department': department,
+            # Manager of worker i is one of the workers at the level above, so chains are about log(workers, span) long
+            'managerEmail': worker_email(rng.randint(max(0, (i - 1) // span - 2), (i - 1) // span)) if i else None,
+            'businessUnit': f"{department} {region}",
+            'type': rng.choice(WORKER_TYPES),
+            'startDate': f"{hire_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'endDate': f"{hire_year + rng.randint(0, 1)}-12-31" if terminated else None,
+            'bio': ' '.join([f"{first} works in {department} in {city}."] * rng.randint(1, 4)),
+            'phoneNumber': f"+1 (555) {rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+            'photoUrl': f"https://example.com/photos/{i}.jpg",
+            'profileUrl': f"https://example.com/people/{i}",
+        }
+        location = {'address': f"{rng.randint(1, 999)} Main St, {city}", 'city': city, 'state': state, 'country': country,
+                    'region': region, 'zipCode': zip_code, 'timezone': timezone, 'deskLocation': f"{rng.randint(1, 40)}-{rng.randint(1, 200)}",
+                    'countryCode': country_code}
+
+        entry = {}
+        for api_key, customer_key in mapping.items():
+            if isinstance(customer_key, str):
+                if api_key in values:
+                    entry[customer_key] = values[api_key]
+                elif api_key.endswith('Url'):
+                    entry[customer_key] = f"https://{api_key[:-3].lower()}.example.com/{first.lower()}{i}" if rng.random() < 0.5 else None
+            elif api_key == 'structuredLocation':
+                for location_key, source_key in location_keys.items():
+                    entry[source_key] = location.get(location_key)
+
+        if team_mapping.get('__sourceField'):
+            memberships = min(team_count, max(1, round(rng.expovariate(1 / teams_per_worker))))
+            teams = []
+            for _ in range(memberships):
+                # Most memberships are spread evenly, the rest favour low team numbers, giving a few very large teams
+                team = (int((rng.paretovariate(1.0) - 1) * 20) if rng.random() < 0.3 else rng.randrange(team_count)) % team_count
+                team_values = {'id': f"team-{team}", 'name': f"Team {team}", 'url': f"https://example.com/teams/{team}"}
+                teams.append({source_key: team_values.get(key, f"{key} {team}")
+                              for key, source_key in team_mapping.items() if not key.startswith('__')})
+            entry[team_mapping['__sourceField']] = teams
+
+        for field in additional_fields:
+            if rng.random() < additional_density:
+                entry[field] = additional_field_value(field, rng)
+
+        yield entry
+
+
+def write_report(f: IO[str], entries: Iterator[dict[str, Any]]):
+    """Write entries as a Workday report, one entry at a time so large reports are never held in memory."""
+    f.write('{"Report_Entry": [\n')
+    for i, entry in enumerate(entries):
+        if i:
+            f.write(',\n')
+        f.write(json.dumps(entry))
+    f.write('\n]}\n')
+
+
+def report_columns(mapping: dict[str, Any]) -> list[str]:
+    """Return the CSV columns of a report for the mapping, with the fields of the teams group named group/field."""
+    columns = []
+    for api_key, customer_key in mapping.items():
+        if api_key == 'additionalFields':
+            columns.extend(customer_key)
+        elif isinstance(customer_key, str):
+            columns.append(customer_key)
+        elif isinstance(customer_key, dict):
+            columns.extend(customer_key.values())
+        elif isinstance(customer_key, list) and customer_key and customer_key[0].get('__sourceField'):
+            group = customer_key[0]['__sourceField']
+            columns.extend(f"{group}/{source_key}" for key, source_key in customer_key[0].items() if not key.startswith('__'))
+    return list(dict.fromkeys(columns))
+
+
+def write_csv_report(f: IO[str], entries: Iterator[dict[str, Any]], columns: list[str]):
+    """
+    Write entries as a Workday report in CSV format (see workday.report_formats.parse_csv_entries). Each field of a
+    group is written one line per instance of the group, and a field with several values one line per value.
+    """
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(columns)
+    for entry in entries:
+        row = []
+        for column in columns:
+            group, separator, field = column.partition('/')
+            if separator:
+                value = '\n'.join(instance.get(field) or '' for instance in entry.get(group) or [])
+            else:
+                value = entry.get(column)
+                value = '\n'.join(value) if isinstance(value, list) else value
+            row.append(value or '')
+        writer.writerow(row)
+
+
+def write_xml_report(f: IO[str], entries: Iterator[dict[str, Any]]):
+    """Write entries as a Workday report in the simple XML format (format=simplexml), one element per value."""
+    def elements(name: str, value: Any) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, list):
+            return ''.join(elements(name, item) for item in value)
+        if isinstance(value, dict):
+            return f"<{name}>{''.join(elements(key, item) for key, item in value.items())}</{name}>"
+        return f"<{name}>{escape(str(value))}</{name}>"
+
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<Report_Data>\n')
+    for entry in entries:
+        f.write(elements('Report_Entry', entry) + '\n')
+    f.write('</Report_Data>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Workday report for benchmarking.')
+    parser.add_argument('--workers', type=int, default=10000, help='Number of workers in the report.')
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING, help='Mapping file that defines the fields of the report.')
+    parser.add_argument('--output', required=True, help='File to write the report to.')
+    parser.add_argument('--format', choices=['json', 'csv', 'xml'], default='json', help='Format of the report (see WORKDAY_REPORT_FORMAT).')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. The same seed always produces the same report.')
+    parser.add_argument('--span', type=int, default=8, help='Average number of direct reports per manager.')
+    parser.add_argument('--teams-per-worker', type=float, default=2.0, help='Average number of teams per worker.')
+    parser.add_argument('--additional-density', type=float, default=0.4, help='Fraction of additional fields present on each worker.')
+    args = parser.parse_args()
+
+    with open(args.mapping, 'r') as f:
+        mapping = json.load(f)
+
+    entries = generate_entries(args.workers, mapping, args.seed, args.span, args.teams_per_worker, args.additional_density)
+    with open(args.output, 'w', encoding='utf-8', newline='') as f:
+        if args.format == 'csv':
+            write_csv_report(f, entries, report_columns(mapping))
+        elif args.format == 'xml':
+            write_xml_report(f, entries)
+        else:
+            write_report(f, entries)
+    print(f"Wrote {args.workers} workers to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
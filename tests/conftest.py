@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# Tests import the connector's modules (e.g. utils.workday) from the repository root
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests', 'glean'))
+
+import server as glean_server
+from utils.config import Settings
+
+# Field mapping of the sample report in tests/test_people_sync
+MAPPING_FILE = os.path.join(ROOT, 'tests', 'test_people_sync', 'mapping.json')
+
+
+def sample_entries() -> list[dict[str, Any]]:
+    with open(os.path.join(ROOT, 'tests', 'test_people_sync', 'input_data.json')) as f:
+        return json.load(f)['Report_Entry']
+
+
+class WorkdayStandIn:
+    """
+    A Workday report served over HTTP with an ETag (answering conditional requests with HTTP 304). A report sharded by
+    a prompt is served by prompt value, and failures can be injected into the requests for a shard.
+    """
+    def __init__(self):
+        self.entries: list[dict[str, Any]] = sample_entries()
+        # Prompt -> prompt value -> Report_Entry items of the shard, for a sharded report
+        self.shard_prompt: Optional[str] = None
+        self.shards: dict[str, list[dict[str, Any]]] = {}
+        # Prompt value -> number of requests for the shard still to fail with HTTP 503
+        self.failures: dict[str, int] = {}
+        self.version = 1
+        self.requests: list[dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def etag(self) -> str:
+        return f'"v{self.version}"'
+
+    def respond(self, path: str, headers: dict[str, str]) -> tuple[int, dict[str, str], bytes]:
+        query = parse_qs(urlsplit(path).query)
+        shard = query.get(self.shard_prompt, [None])[0] if self.shard_prompt else None
+        with self.lock:
+            self.requests.append({'shard': shard, 'if_none_match': headers.get('If-None-Match')})
+            if self.failures.get(shard):
+                self.failures[shard] -= 1
+                return 503, {}, b'{"error": "Service unavailable"}'
+        if headers.get('If-None-Match') == self.etag:
+            return 304, {'ETag': self.etag}, b''
+        entries = self.shards[shard] if shard is not None else self.entries
+        return 200, {'ETag': self.etag, 'Content-Type': 'application/json'}, json.dumps({'Report_Entry': entries}).encode('utf-8')
+
+
+class WorkdayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status, headers, body = self.server.standin.respond(self.path, dict(self.headers))
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(server: ThreadingHTTPServer) -> str:
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+@pytest.fixture
+def workday():
+    """A local stand-in for the Workday report (see WorkdayStandIn), with its URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WorkdayHandler)
+    server.standin = WorkdayStandIn()
+    server.standin.url = serve(server) + '/report'
+    yield server.standin
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def glean():
+    """A local stand-in for the Glean Indexing API (see tests/glean/server.py), with its URL."""
+    server = glean_server.make_server('127.0.0.1', 0, glean_server.StandInConfig())
+    server.standin.url = serve(server)
+    yield server.standin
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sync_settings(tmp_path, workday, glean):
+    """Return the settings of a sync from the Workday stand-in to the Glean stand-in, with the given overrides."""
+    def make(**overrides: Any) -> Settings:
+        values = {
+            'WORKDAY_REPORT_URL': workday.url,
+            'WORKDAY_AUTH_TYPE': 'basic',
+            'WORKDAY_USERNAME': 'user',
+            'WORKDAY_PASSWORD': 'password',
+            'GLEAN_BACKEND_DOMAIN': glean.url,
+            'GLEAN_API_KEY': 'key',
+            'FIELD_MAPPING_FILE': MAPPING_FILE,
+            'DELTA_SYNC_STATE_FILE': str(tmp_path / 'sync_state.json'),
+        }
+        values.update(overrides)
+        return Settings(**values)
+    return make
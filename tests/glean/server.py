@@ -0,0 +1,271 @@
+# Local stand-in for the Glean Indexing API, for testing and benchmarking uploads without a Glean tenant.
+# Run from the repository root: python tests/glean/server.py [--port 8080] [--latency 0.05] [--rate-429 0.05] ...
+# Then set GLEAN_BACKEND_DOMAIN=http://localhost:8080 (and any value for GLEAN_API_KEY).
+
+import argparse
+import gzip
+import json
+import random
+import signal
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+API_PREFIX = '/api/index/v1/'
+
+# Bulk upload endpoints, with the key of the records in the request body and the field that identifies each record
+BULK_ENDPOINTS = {
+    'bulkindexemployees': ('employees', 'email'),
+    'bulkindexteams': ('teams', 'id'),
+}
+# Single-entity endpoints used by delta sync, with the key that must be present in the request body
+ENTITY_ENDPOINTS = {
+    'indexemployee': 'employee',
+    'deleteemployee': 'employeeEmail',
+    'indexteam': 'team',
+    'deleteteam': 'id',
+}
+PROCESS_ENDPOINT = 'processallemployeesandteams'
+
+
+@dataclass
+class StandInConfig:
+    """Behaviour of the stand-in. Failures are injected at random, from a seeded generator so runs are reproducible."""
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    rate_429: float = 0.0
+    rate_503: float = 0.0
+    retry_after: Optional[float] = None
+    rate_limit: Optional[int] = None
+    max_body_bytes: Optional[int] = None
+    seed: int = 0
+
+
+@dataclass
+class Upload:
+    """A bulk upload in progress, identified by its upload ID."""
+    endpoint: str
+    pages: int = 0
+    records: dict[str, Any] = field(default_factory=dict)
+    started: float = field(default_factory=time.time)
+
+
+class GleanStandIn:
+    """State shared by all requests: uploads in progress, the data of completed uploads, and request metrics."""
+
+    def __init__(self, config: StandInConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+        self.uploads: dict[str, Upload] = {}
+        self.completed_upload_ids: set[str] = set()
+        self.indexed: dict[str, dict[str, Any]] = {endpoint: {} for endpoint in BULK_ENDPOINTS}
+        self.request_times: deque[float] = deque()
+        self.metrics = {
+            'requests': defaultdict(int),
+            'status_codes': defaultdict(lambda: defaultdict(int)),
+            'bytes_received': defaultdict(int),
+            'records_received': defaultdict(int),
+            'latency_seconds': defaultdict(float),
+            'uploads_completed': 0,
+            'process_requests': 0,
+        }
+
+    def injected_failure(self) -> Optional[int]:
+        """Return the status code of a failure to inject into this request, if any."""
+        with self.lock:
+            now = time.monotonic()
+            if self.config.rate_limit:
+                while self.request_times and now - self.request_times[0] > 1.0:
+                    self.request_times.popleft()
+                if len(self.request_times) >= self.config.rate_limit:
+                    return 429
+                self.request_times.append(now)
+            roll = self.random.random()
+            if roll < self.config.rate_429:
+                return 429
+            if roll < self.config.rate_429 + self.config.rate_503:
+                return 503
+        return None
+
+    def bulk_upload(self, endpoint: str, body: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+        """Apply a page of a bulk upload, following the uploadId/isFirstPage/isLastPage semantics of the Glean API."""
+        key, id_field = BULK_ENDPOINTS[endpoint]
+        upload_id = body.get('uploadId')
+        records = body.get(key)
+        if not upload_id or not isinstance(records, list):
+            return 400, {'error': f"Request must have an uploadId and a list of {key}."}
+        missing = sum(1 for record in records if not record.get(id_field))
+        if missing:
+            return 400, {'error': f"{missing} {key} are missing the '{id_field}' field."}
+
+        with self.lock:
+            self.metrics['records_received'][endpoint] += len(records)
+            upload = self.uploads.get(upload_id)
+            if body.get('isFirstPage'):
+                if upload_id in self.completed_upload_ids:
+                    return 409, {'error': f"Upload {upload_id} has already been completed."}
+                if upload and not body.get('forceRestartUpload'):
+                    return 409, {'error': f"Upload {upload_id} is already in progress."}
+                if body.get('forceRestartUpload'):
+                    # A restart abandons any other upload in progress to the same endpoint
+                    for other_id in [id for id, other in self.uploads.items() if other.endpoint == endpoint]:
+                        del self.uploads[other_id]
+                upload = self.uploads[upload_id] = Upload(endpoint)
+            elif upload is None:
+                return 400, {'error': f"Upload {upload_id} has not been started. The first page must have isFirstPage set."}
+            elif upload.endpoint != endpoint:
+                return 400, {'error': f"Upload {upload_id} was started on {upload.endpoint}."}
+
+            upload.pages += 1
+            for record in records:
+                upload.records[record[id_field]] = record
+
+            if body.get('isLastPage'):
+                # The data of a completed upload replaces all data previously uploaded to the endpoint
+                self.indexed[endpoint] = upload.records
+                self.completed_upload_ids.add(upload_id)
+                del self.uploads[upload_id]
+                self.metrics['uploads_completed'] += 1
+        return 200, {}
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the request metrics and a summary of the uploaded data."""
+        with self.lock:
+            metrics = json.loads(json.dumps(self.metrics))
+            metrics['indexed'] = {endpoint: len(records) for endpoint, records in self.indexed.items()}
+            metrics['uploads_in_progress'] = {upload_id: {'endpoint': upload.endpoint, 'pages': upload.pages, 'records': len(upload.records)}
+                                              for upload_id, upload in self.uploads.items()}
+            return metrics
+
+
+class GleanHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, so without this each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    @property
+    def standin(self) -> GleanStandIn:
+        return self.server.standin
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.respond(200, self.standin.snapshot())
+        else:
+            self.respond(404, {'error': f'Unknown path: {self.path}'})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        config = self.standin.config
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length)
+        endpoint = self.path[len(API_PREFIX):] if self.path.startswith(API_PREFIX) else self.path
+
+        if config.latency or config.latency_jitter:
+            time.sleep(config.latency + random.uniform(0, config.latency_jitter))
+
+        status, body, headers = self.handle_request(endpoint, data)
+        self.respond(status, body, headers)
+
+        metrics = self.standin.metrics
+        with self.standin.lock:
+            metrics['requests'][endpoint] += 1
+            metrics['status_codes'][endpoint][str(status)] += 1
+            metrics['bytes_received'][endpoint] += length
+            metrics['latency_seconds'][endpoint] += time.perf_counter() - started
+
+    def handle_request(self, endpoint: str, data: bytes) -> tuple[int, dict[str, Any], dict[str, str]]:
+        config = self.standin.config
+        if endpoint not in BULK_ENDPOINTS and endpoint not in ENTITY_ENDPOINTS and endpoint != PROCESS_ENDPOINT:
+            return 404, {'error': f'Unknown endpoint: {self.path}'}, {}
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return 401, {'error': 'Unauthorized'}, {}
+        if config.max_body_bytes and len(data) > config.max_body_bytes:
+            return 413, {'error': f'Request body of {len(data)} bytes is larger than {config.max_body_bytes} bytes.'}, {}
+
+        failure = self.standin.injected_failure()
+        if failure == 429:
+            return 429, {'error': 'Rate limit exceeded'}, {'Retry-After': str(config.retry_after)} if config.retry_after is not None else {}
+        if failure:
+            return failure, {'error': 'Service unavailable'}, {}
+
+        if endpoint == PROCESS_ENDPOINT:
+            with self.standin.lock:
+                self.standin.metrics['process_requests'] += 1
+            return 200, {}, {}
+
+        try:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            body = json.loads(data)
+        except (OSError, ValueError) as e:
+            return 400, {'error': f'Invalid request body: {e}'}, {}
+
+        if endpoint in BULK_ENDPOINTS:
+            status, response = self.standin.bulk_upload(endpoint, body)
+            return status, response, {}
+        if not body.get(ENTITY_ENDPOINTS[endpoint]):
+            return 400, {'error': f"Request must have '{ENTITY_ENDPOINTS[endpoint]}'."}, {}
+        return 200, {}, {}
+
+    def respond(self, status: int, body: dict[str, Any], headers: Optional[dict[str, str]] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host: str, port: int, config: StandInConfig) -> ThreadingHTTPServer:
+    """Create a stand-in server. Call serve_forever() on it, e.g. in a thread."""
+    server = ThreadingHTTPServer((host, port), GleanHandler)
+    server.daemon_threads = True
+    server.standin = GleanStandIn(config)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Glean Indexing API.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request.')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='Up to this many seconds added to every request at random.')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests that fail with HTTP 429.')
+    parser.add_argument('--rate-503', type=float, default=0.0, help='Fraction of requests that fail with HTTP 503.')
+    parser.add_argument('--retry-after', type=float, help='Retry-After header (in seconds) sent with HTTP 429 responses.')
+    parser.add_argument('--rate-limit', type=int, help='Requests per second above which requests fail with HTTP 429.')
+    parser.add_argument('--max-body-bytes', type=int, help='Requests with a larger body fail with HTTP 413.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for failure injection.')
+    parser.add_argument('--metrics-file', help='Write the request metrics to this file when the server stops.')
+    args = parser.parse_args()
+
+    config = StandInConfig(latency=args.latency, latency_jitter=args.latency_jitter, rate_429=args.rate_429, rate_503=args.rate_503,
+                           retry_after=args.retry_after, rate_limit=args.rate_limit, max_body_bytes=args.max_body_bytes, seed=args.seed)
+    server = make_server(args.host, args.port, config)
+    print(f"Glean Indexing API stand-in listening on http://{args.host}:{args.port}", flush=True)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.metrics_file:
+            with open(args.metrics_file, 'w') as f:
+                json.dump(server.standin.snapshot(), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
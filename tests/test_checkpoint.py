@@ -0,0 +1,43 @@
+import json
+import time
+
+from utils import checkpoint
+
+RECORDS = [{'email': 'a@example.com'}, {'email': 'b@example.com'}]
+
+
+def upload_checkpoint(last_page=3, timestamp=None):
+    return checkpoint.UploadCheckpoint('upload-1', checkpoint.data_hash(RECORDS), 100, None, last_page,
+                                       time.time() if timestamp is None else timestamp)
+
+
+def test_checkpoint_round_trip_and_clear(tmp_path):
+    checkpoint_file = str(tmp_path / 'checkpoint.json')
+    people, teams = upload_checkpoint(), upload_checkpoint(last_page=0)
+    checkpoint.save_checkpoint(checkpoint_file, 'people', people)
+    checkpoint.save_checkpoint(checkpoint_file, 'teams', teams)
+    assert checkpoint.load_checkpoint(checkpoint_file, 'people') == people
+    checkpoint.clear_checkpoint(checkpoint_file, 'people')
+    assert checkpoint.load_checkpoint(checkpoint_file, 'people') is None
+    assert checkpoint.load_checkpoint(checkpoint_file, 'teams') == teams
+
+
+def test_checkpoint_is_only_resumable_for_the_same_data_and_paging():
+    current = upload_checkpoint()
+    data_hash = checkpoint.data_hash(RECORDS)
+    assert current.is_resumable(data_hash, 100, None, max_age=3600)
+    assert not current.is_resumable(checkpoint.data_hash(RECORDS[:1]), 100, None, max_age=3600)
+    assert not current.is_resumable(data_hash, 50, None, max_age=3600)
+    assert not current.is_resumable(data_hash, 100, 1024, max_age=3600)
+    assert not upload_checkpoint(timestamp=time.time() - 7200).is_resumable(data_hash, 100, None, max_age=3600)
+
+
+def test_unreadable_or_invalid_checkpoint_is_ignored(tmp_path):
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    checkpoint_file.write_text('not json')
+    assert checkpoint.load_checkpoint(str(checkpoint_file), 'people') is None
+    checkpoint_file.write_text(json.dumps({'people': {'upload_id': 'upload-1'}}))
+    assert checkpoint.load_checkpoint(str(checkpoint_file), 'people') is None
+    # Saving replaces the unusable checkpoint
+    checkpoint.save_checkpoint(str(checkpoint_file), 'people', upload_checkpoint())
+    assert checkpoint.load_checkpoint(str(checkpoint_file), 'people') is not None
@@ -0,0 +1,80 @@
+import json
+
+from utils import delta, workday
+
+MAPPING = {'email': 'workerEmail', 'teams': [{'__sourceField': 'workerTeams', 'id': 'teamID', 'name': 'teamName'}]}
+
+
+def worker(email, *team_ids):
+    return {'workerEmail': email, 'workerTeams': [{'teamID': team_id, 'teamName': team_id.title()} for team_id in team_ids]}
+
+
+def test_teams_have_deduplicated_members():
+    report = [worker('a@example.com', 'web', 'ops'), worker('b@example.com', 'web'), worker('a@example.com', 'web'),
+              worker(None, 'web')]
+    index = workday.TeamIndex(workday.compile_mapping(MAPPING))
+    list(index.collect(report))
+    assert index.teams() == [
+        {'id': 'web', 'name': 'Web', 'members': [{'email': 'a@example.com'}, {'email': 'b@example.com'}]},
+        {'id': 'ops', 'name': 'Ops', 'members': [{'email': 'a@example.com'}]},
+    ]
+    assert index.duplicate_memberships == 1
+    assert index.memberships_without_email == 1
+    assert index.teams_of('a@example.com') == ['web', 'ops']
+    assert index.teams_of('c@example.com') == []
+
+
+def test_team_fingerprint_ignores_member_order():
+    team = {'id': 'web', 'name': 'Web', 'members': [{'email': 'a@example.com'}, {'email': 'b@example.com'}]}
+    reordered = dict(team, members=list(reversed(team['members'])))
+    assert delta.team_fingerprint(team) == delta.team_fingerprint(reordered)
+    assert delta.team_fingerprint(team) != delta.team_fingerprint(dict(team, name='Web Team'))
+
+
+def test_state_round_trip(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    teams = [{'id': 'web', 'name': 'Web', 'members': [{'email': 'a@example.com'}]}]
+    state = delta.build_state(teams, 'teams')
+    delta.save_state(state_file, 'teams', state)
+    assert delta.load_state(state_file, 'teams') == state
+    assert delta.load_state(state_file, 'people') is None
+
+
+def test_state_of_an_older_version_is_ignored(tmp_path):
+    state_file = tmp_path / 'state.json'
+    state_file.write_text(json.dumps({'version': delta.STATE_VERSION - 1, 'teams': {'web': ['hash', 'web']}}))
+    assert delta.load_state(str(state_file), 'teams') is None
+
+
+def test_unchanged_records_are_not_uploaded_again():
+    people = [{'email': 'a@example.com', 'id': '1'}, {'email': 'b@example.com', 'id': '2'}]
+    previous = delta.build_state(people, 'people')
+    changed = [people[0], {'email': 'c@example.com', 'id': '3'}]
+    changes = delta.diff_state(changed, delta.build_state(changed, 'people'), previous)
+    assert [record['email'] for record in changes.upserts] == ['c@example.com']
+    assert len(changes.deletes) == 1
+
+
+def test_unreadable_state_falls_back_to_a_full_upload_and_is_replaced(tmp_path):
+    state_file = tmp_path / 'state.json'
+    state_file.write_text('{"version": ')
+    assert delta.load_state(str(state_file), 'people') is None
+    state = delta.build_state([{'email': 'a@example.com'}], 'people')
+    delta.save_state(str(state_file), 'people', state)
+    assert delta.load_state(str(state_file), 'people') == state
+
+
+def test_changed_email_deletes_the_old_one():
+    previous = delta.build_state([{'id': '1', 'email': 'old@example.com'}, {'id': '2', 'email': 'b@example.com'}], 'people')
+    people = [{'id': '1', 'email': 'new@example.com'}, {'id': '2', 'email': 'b@example.com'}]
+    changes = delta.diff_state(people, delta.build_state(people, 'people'), previous)
+    assert [record['email'] for record in changes.upserts] == ['new@example.com']
+    assert changes.deletes == ['old@example.com']
+
+
+def test_email_taken_over_by_another_person_is_not_deleted():
+    previous = delta.build_state([{'id': '1', 'email': 'a@example.com'}, {'id': '2', 'email': 'b@example.com'}], 'people')
+    people = [{'id': '1', 'email': 'b@example.com'}, {'id': '2', 'email': 'a@example.com'}]
+    changes = delta.diff_state(people, delta.build_state(people, 'people'), previous)
+    assert len(changes.upserts) == 2
+    assert changes.deletes == []
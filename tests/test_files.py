@@ -0,0 +1,27 @@
+import pytest
+
+from utils import files
+
+
+def test_interrupted_write_keeps_the_previous_file(tmp_path):
+    path = tmp_path / 'state.json'
+    files.write_json(str(path), {'version': 1})
+    with pytest.raises(RuntimeError):
+        with files.atomic_write(str(path)) as f:
+            f.write('{"version": ')
+            raise RuntimeError('interrupted')
+    assert files.read_json(str(path), 'state file') == {'version': 1}
+    assert [p.name for p in tmp_path.iterdir()] == ['state.json']
+
+
+@pytest.mark.parametrize('content', ['{"version": ', '[1, 2]'])
+def test_unreadable_file_is_read_as_empty(tmp_path, caplog, content):
+    path = tmp_path / 'state.json'
+    path.write_text(content)
+    assert files.read_json(str(path), 'state file', 'Starting again.') == {}
+    assert 'Could not read state file' in caplog.text and 'Starting again.' in caplog.text
+
+
+def test_missing_file_is_read_as_empty(tmp_path, caplog):
+    assert files.read_json(str(tmp_path / 'missing.json'), 'state file') == {}
+    assert caplog.text == ''
@@ -0,0 +1,121 @@
+import asyncio
+import csv
+import gzip
+from datetime import datetime
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from conftest import MAPPING_FILE, sample_entries
+from utils import delta, glean, workday
+from utils.config import Settings, UploadResult, use_settings
+
+SETTINGS = Settings(WORKDAY_REPORT_URL='https://workday.test/report', WORKDAY_API_KEY='key',
+                    GLEAN_BACKEND_DOMAIN='http://glean.test', GLEAN_API_KEY='key', UPLOAD_MAX_RETRIES=2)
+
+
+def schedule_processing(responses):
+    """Schedule processing against a stand-in API that answers with the given status codes, in order."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        status = responses[min(len(requests), len(responses)) - 1]
+        return httpx.Response(status, headers={'Retry-After': '0'} if status == 429 else {})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await glean._schedule_processing_async(client, {'Authorization': 'Bearer key'})
+
+    with use_settings(SETTINGS):
+        wait_time = asyncio.run(run())
+    return wait_time, requests
+
+
+def test_processing_request_is_retried_after_429():
+    wait_time, requests = schedule_processing([429, 200])
+    assert wait_time == '1 hour'
+    assert len(requests) == 2
+    assert requests[0].url.path == '/api/index/v1/processallemployeesandteams'
+
+
+def test_processing_request_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(glean, 'RETRY_BASE_DELAY', 0.01)
+    wait_time, requests = schedule_processing([503])
+    assert wait_time == '3 hours'
+    assert len(requests) == SETTINGS.UPLOAD_MAX_RETRIES + 1
+
+
+def upload_people_and_teams(monkeypatch, records_uploaded):
+    """Run a delta upload of people and teams whose uploads index the given number of records, and return how many
+    times processing was requested."""
+    scheduled = []
+
+    async def upload(data, type, process):
+        return UploadResult(True, records_uploaded, 'id', [], datetime.now())
+
+    async def schedule_processing():
+        scheduled.append(True)
+        return '1 hour'
+
+    monkeypatch.setattr(glean, 'delta_upload_entities_async', upload)
+    monkeypatch.setattr(glean, 'schedule_processing_async', schedule_processing)
+    asyncio.run(glean.upload_people_and_teams_async([], [], delta_sync=True))
+    return len(scheduled)
+
+
+def test_processing_is_requested_after_changes_are_uploaded(monkeypatch):
+    assert upload_people_and_teams(monkeypatch, records_uploaded=1) == 1
+
+
+def test_processing_is_not_requested_when_nothing_changed(monkeypatch):
+    assert upload_people_and_teams(monkeypatch, records_uploaded=0) == 0
+
+
+def test_delta_upload_succeeds_when_its_state_cannot_be_saved(tmp_path, monkeypatch, caplog):
+    people = [{'email': 'a@example.com', 'id': '1'}]
+    state_file = str(tmp_path / 'state.json')
+    delta.save_state(state_file, 'people', delta.build_state(people, 'people'))
+
+    def save_state(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(delta, 'save_state', save_state)
+    with use_settings(SETTINGS.model_copy(update={'DELTA_SYNC_STATE_FILE': state_file})):
+        result = asyncio.run(glean.delta_upload_entities_async(people, type='people'))
+    assert result.success and result.records_uploaded == 0
+    assert 'will send these changes again' in caplog.text
+
+
+def test_pages_are_filled_by_byte_budget():
+    records = [{'email': f'{i}@example.com', 'bio': 'x' * size} for i, size in enumerate([100, 100, 100, 1000, 10])]
+    encoded = [glean._dumps(record) for record in records]
+    max_bytes = glean.PAGE_ENVELOPE_BYTES + 2 * (len(encoded[0]) + 1)
+    pages = list(glean._iter_encoded_pages(records, batch_size=250, max_bytes=max_bytes))
+    # A record larger than the budget is sent in a page by itself
+    assert pages == [encoded[0:2], encoded[2:3], encoded[3:4], encoded[4:5]]
+    for page in pages:
+        body = glean._page_body('id', False, False, 'employees', page)
+        assert len(body) <= max_bytes or len(page) == 1
+    assert list(glean._iter_encoded_pages(records, batch_size=2)) == [encoded[0:2], encoded[2:4], encoded[4:5]]
+
+
+def test_byte_budget_must_leave_room_for_records():
+    with pytest.raises(ValidationError, match='BATCH_MAX_BYTES must be greater than'):
+        SETTINGS.model_validate({**SETTINGS.model_dump(), 'BATCH_MAX_BYTES': glean.PAGE_ENVELOPE_BYTES})
+
+
+def test_csv_export_with_no_data_keeps_the_previous_export(tmp_path):
+    mapping = glean.load_mapping(MAPPING_FILE)
+    records = workday.transform_people(sample_entries(), mapping)
+    output_file = str(tmp_path / 'people.csv.gz')
+    assert glean.create_csv(records, output_file, 'people', mapping, compress=True) == len(records)
+    previous = (tmp_path / 'people.csv.gz').read_bytes()
+
+    with pytest.raises(ValueError, match='No data'):
+        glean.create_csv([], output_file, 'people', mapping, compress=True)
+    assert (tmp_path / 'people.csv.gz').read_bytes() == previous
+    assert [p.name for p in tmp_path.iterdir()] == ['people.csv.gz']
+    with gzip.open(output_file, 'rt', encoding='utf-8') as f:
+        assert len(list(csv.DictReader(f))) == len(records)
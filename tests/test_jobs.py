@@ -0,0 +1,26 @@
+import json
+
+import sync_people
+from utils import http_client
+from utils.config import SyncJob
+
+
+def job(name, settings):
+    return SyncJob(name, settings.model_dump(exclude_unset=True))
+
+
+def test_failed_job_does_not_stop_the_others(tmp_path, workday, glean, sync_settings):
+    jobs = [
+        job('broken', sync_settings(FIELD_MAPPING_FILE=str(tmp_path / 'missing.json'), METRICS_FILE=str(tmp_path / 'broken.json'))),
+        job('people', sync_settings(METRICS_FILE=str(tmp_path / 'people.json'))),
+        SyncJob('invalid', {'WORKDAY_REPORT_URL': workday.url, 'OUTPUT_TYPE': 'spreadsheet'}),
+    ]
+    statuses = http_client.run(sync_people.run_jobs_async(jobs))
+    assert statuses == {'broken': 'failed', 'people': 'success', 'invalid': 'failed'}
+    assert glean.snapshot()['indexed']['bulkindexemployees'] == len(workday.entries)
+
+    # Each job records its own metrics
+    people = json.loads((tmp_path / 'people.json').read_text())
+    broken = json.loads((tmp_path / 'broken.json').read_text())
+    assert people['status'] == 'success' and people['counters']['records_transformed'] == len(workday.entries)
+    assert broken['status'] == 'failed' and 'records_transformed' not in broken['counters']
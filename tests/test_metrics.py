@@ -0,0 +1,37 @@
+import contextvars
+import json
+import time
+
+from utils import metrics, profiling
+
+
+def test_nested_stage_time_is_left_out_of_the_enclosing_stage():
+    run_metrics = metrics.RunMetrics()
+    with run_metrics.stage('upload'):
+        for _ in range(2):
+            with run_metrics.stage('serialize'):
+                time.sleep(0.05)
+    assert run_metrics.stages['serialize'] >= 0.1
+    assert run_metrics.stages['upload'] < 0.05
+
+
+def test_each_stage_keeps_its_own_peak(tmp_path):
+    run_metrics = metrics.RunMetrics()
+    with profiling.profile(str(tmp_path)):
+        with run_metrics.stage('upload'):
+            for size in (8_000_000, 1_000):
+                with run_metrics.stage('serialize'):
+                    data = bytearray(size)
+                    del data
+    summary = json.loads((tmp_path / 'profile.json').read_text())
+    assert summary['serialize']['runs'] == 2
+    # The peak of the first, larger page is not lost when the stage starts again for the second
+    assert summary['upload']['peak_traced_bytes'] >= 8_000_000
+    assert summary['serialize']['peak_traced_bytes'] >= 8_000_000
+    assert summary['upload']['seconds'] <= summary['serialize']['seconds'] + 0.05
+
+
+def test_each_context_has_its_own_metrics():
+    first, second = (contextvars.Context().run(metrics.get_metrics) for _ in range(2))
+    assert first is not second
+    assert metrics.get_metrics() is metrics.get_metrics()
@@ -0,0 +1,67 @@
+import pytest
+
+from utils import preflight
+from utils.config import PreflightAction
+
+
+def person(email, manager=None, person_id=None):
+    return {'email': email, 'managerEmail': manager, 'id': person_id}
+
+
+def test_hierarchy_without_problems_passes():
+    people = [person('ceo@example.com'), person('a@example.com', 'CEO@example.com'), person('b@example.com', 'a@example.com')]
+    assert not preflight.check_people(people)
+
+
+def test_identity_problems():
+    people = [person('a@example.com', person_id='1'), person(None), person('A@example.com'), person('b@example.com', person_id='1')]
+    report = preflight.check_people(people)
+    assert [(problem.check, problem.index) for problem in report.problems] == [
+        ('missing_email', 1), ('duplicate_email', 2), ('duplicate_id', 3)]
+
+
+def test_unknown_manager_invalidates_chain():
+    people = [person('a@example.com', 'nobody@example.com'), person('b@example.com', 'a@example.com'), person('c@example.com')]
+    report = preflight.check_people(people)
+    assert report.counts() == {'unknown_manager': 1, 'orphan_chain': 1}
+    assert report.offending() == {0, 1}
+
+
+def test_manager_with_identity_problem_invalidates_chain():
+    people = [person('a@example.com', person_id='1'), person('b@example.com', 'a@example.com', person_id='1'),
+              person('c@example.com', 'B@example.com', person_id='2')]
+    report = preflight.check_people(people)
+    assert [(problem.check, problem.index) for problem in report.problems] == [('duplicate_id', 1), ('orphan_chain', 2)]
+    assert report.problems[1].message == 'Chain of managers leads to a problem: b@example.com has a duplicate id (1).'
+
+
+def test_manager_cycle():
+    people = [person('a@example.com', 'b@example.com'), person('b@example.com', 'a@example.com'), person('c@example.com', 'a@example.com')]
+    report = preflight.check_people(people)
+    assert report.counts() == {'manager_cycle': 2, 'orphan_chain': 1}
+    assert report.problems[0].message == 'Manager cycle: a@example.com -> b@example.com -> a@example.com.'
+
+
+def test_long_manager_cycle_has_a_short_shared_description():
+    size = 200_000
+    people = [person(f'{i}@example.com', f'{(i + 1) % size}@example.com') for i in range(size)]
+    people.append(person('x@example.com', '0@example.com'))
+    report = preflight.check_people(people)
+    assert report.counts() == {'manager_cycle': size, 'orphan_chain': 1}
+    message = report.problems[0].message
+    assert message.endswith(f'... ({size} people).')
+    assert len(message) < 400
+    # Every person of the cycle refers to the same message rather than a copy of it
+    assert len({id(problem.message) for problem in report.problems[:size]}) == 1
+
+
+def test_actions():
+    people = [person('a@example.com'), person('b@example.com', 'nobody@example.com')]
+    teams = [{'id': 'web', 'members': [{'email': 'a@example.com'}, {'email': 'B@example.com'}]}]
+    quarantined = []
+    assert preflight.run_checks(people, PreflightAction.REPORT, quarantined) == people
+    assert [entry['position'] for entry in quarantined] == [1]
+    assert preflight.run_checks(people, PreflightAction.DROP, teams=teams) == [people[0]]
+    assert teams[0]['members'] == [{'email': 'a@example.com'}]
+    with pytest.raises(ValueError, match='Nothing was uploaded'):
+        preflight.run_checks(people, PreflightAction.FAIL)
@@ -0,0 +1,42 @@
+import sync_people
+from utils import http_client
+from utils.config import use_settings
+
+
+def run_sync(settings):
+    with use_settings(settings):
+        return http_client.run(sync_people.main_async())
+
+
+def test_unchanged_report_is_not_uploaded_again(tmp_path, workday, glean, sync_settings):
+    settings = sync_settings(REPORT_CACHE_FILE=str(tmp_path / 'report_cache.json'))
+    assert run_sync(settings) == 'success'
+    assert glean.snapshot()['indexed']['bulkindexemployees'] == len(workday.entries)
+    requests = glean.snapshot()['requests']
+
+    assert run_sync(settings) == 'unchanged'
+    assert workday.requests[-1]['if_none_match'] == workday.etag
+    assert glean.snapshot()['requests'] == requests
+
+
+def test_changed_report_is_uploaded(tmp_path, workday, glean, sync_settings):
+    settings = sync_settings(REPORT_CACHE_FILE=str(tmp_path / 'report_cache.json'))
+    assert run_sync(settings) == 'success'
+    workday.entries = workday.entries[:-1]
+    workday.version += 1
+    assert run_sync(settings) == 'success'
+    assert glean.snapshot()['indexed']['bulkindexemployees'] == len(workday.entries)
+
+
+def test_report_is_synced_again_to_a_new_output(tmp_path, monkeypatch, workday, glean, sync_settings):
+    monkeypatch.chdir(tmp_path)
+    cache_file = str(tmp_path / 'report_cache.json')
+    assert run_sync(sync_settings(REPORT_CACHE_FILE=cache_file, OUTPUT_TYPE='csv')) == 'success'
+    assert (tmp_path / 'people.csv').exists()
+    assert 'bulkindexemployees' not in glean.snapshot()['requests']
+
+    # The report is unchanged, but it has never been uploaded to the Glean tenant
+    assert run_sync(sync_settings(REPORT_CACHE_FILE=cache_file)) == 'success'
+    assert glean.snapshot()['indexed']['bulkindexemployees'] == len(workday.entries)
+    assert workday.requests[-1]['if_none_match'] is None
+    assert run_sync(sync_settings(REPORT_CACHE_FILE=cache_file)) == 'unchanged'
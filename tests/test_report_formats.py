@@ -0,0 +1,63 @@
+from xml.parsers import expat
+
+import pytest
+
+from utils import workday
+from utils.config import ReportFormat
+from utils.report_formats import parse_csv_entries, parse_xml_entries
+
+EXPECTED = [
+    {'workerEmail': 'a@example.com', 'workerType': 'Full-time', 'skills': ['Python', 'SQL'],
+     'workerTeams': [{'teamID': 'web', 'teamName': 'Web'}, {'teamID': 'ops', 'teamName': 'Ops'}]},
+    {'workerEmail': 'b@example.com'},
+]
+
+CSV_REPORT = ('\ufeffworkerEmail,workerType,skills,workerTeams/teamID,workerTeams/teamName\r\n'
+              'a@example.com,Full-time,"Python\r\nSQL","web\nops","Web\nOps"\r\n'
+              ',,,,\r\n'
+              'b@example.com\r\n').encode('utf-8')
+
+XML_REPORT = b'''<?xml version="1.0" encoding="UTF-8"?>
+<wd:Report_Data xmlns:wd="urn:com.workday.report/Workers">
+  <wd:Report_Entry>
+    <wd:workerEmail>a@example.com</wd:workerEmail>
+    <wd:workerType wd:Descriptor="Full-time"><wd:ID wd:type="WID">123</wd:ID></wd:workerType>
+    <wd:skills>Python</wd:skills>
+    <wd:skills>SQL</wd:skills>
+    <wd:workerTeams><wd:teamID>web</wd:teamID><wd:teamName>Web</wd:teamName></wd:workerTeams>
+    <wd:workerTeams><wd:teamID>ops</wd:teamID><wd:teamName>Ops</wd:teamName></wd:workerTeams>
+  </wd:Report_Entry>
+  <wd:Report_Entry>
+    <wd:workerEmail>b@example.com</wd:workerEmail>
+    <wd:terminationDate></wd:terminationDate>
+  </wd:Report_Entry>
+</wd:Report_Data>'''
+
+
+def chunked(body, size=7):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def test_csv_report_split_across_chunks():
+    assert list(parse_csv_entries(chunked(CSV_REPORT))) == EXPECTED
+
+
+def test_xml_report_split_across_chunks():
+    assert list(parse_xml_entries(chunked(XML_REPORT))) == EXPECTED
+
+
+@pytest.mark.parametrize('report_format', [ReportFormat.CSV, ReportFormat.XML])
+def test_formats_give_the_same_entries(report_format):
+    body = CSV_REPORT if report_format == ReportFormat.CSV else XML_REPORT
+    assert list(workday.parse_report_entries([body], report_format)) == EXPECTED
+
+
+def test_empty_csv_report_has_no_entries():
+    assert list(parse_csv_entries([])) == []
+
+
+def test_truncated_xml_report_is_an_error():
+    entries = parse_xml_entries([XML_REPORT[:-40]])
+    assert next(entries) == EXPECTED[0]
+    with pytest.raises(expat.ExpatError):
+        list(entries)
@@ -0,0 +1,73 @@
+import json
+
+from utils import quarantine, workday
+from utils.schema import validate_employee, validate_team
+
+MAPPING = {
+    'id': 'workerID',
+    'email': 'workerEmail',
+    'firstName': 'firstName',
+    'lastName': 'lastName',
+    'type': 'workerType',
+    'startDate': 'hireDate',
+    'endDate': 'terminationDate',
+    'teams': [{'__sourceField': 'workerTeams', 'id': 'teamID', 'name': 'teamName'}],
+}
+
+VALID = {'workerID': '1', 'workerEmail': 'a@example.com', 'firstName': 'A', 'lastName': 'B', 'workerType': 'Full-time',
+         'hireDate': '2020-01-01'}
+
+
+def transform(records, validate=True):
+    rejected = []
+    plan = workday.compile_mapping(MAPPING, validate=validate)
+    people = list(workday.iter_transform_people(records, plan, current_date='2024-01-01', rejected=rejected))
+    return people, rejected
+
+
+def test_valid_person_is_kept():
+    people, rejected = transform([VALID])
+    assert [person['email'] for person in people] == ['a@example.com']
+    assert people[0]['status'] == 'CURRENT'
+    assert rejected == []
+
+
+def test_malformed_dates_are_quarantined():
+    people, rejected = transform([VALID, dict(VALID, workerEmail='b@example.com', hireDate=20200101),
+                                  dict(VALID, workerEmail='c@example.com', terminationDate=20200101)])
+    assert [person['email'] for person in people] == ['a@example.com']
+    assert [entry['record']['email'] for entry in rejected] == ['b@example.com', 'c@example.com']
+    assert all(entry['type'] == 'people' and entry['problems'][0]['check'] == 'schema' for entry in rejected)
+
+
+def test_malformed_type_is_quarantined():
+    people, rejected = transform([dict(VALID, workerType=5)])
+    assert people == []
+    assert 'type' in rejected[0]['problems'][0]['message']
+
+
+def test_malformed_fields_do_not_abort_transform_without_validation():
+    people, _ = transform([dict(VALID, hireDate=20200101, workerType=5, firstName=None, lastName=None)], validate=False)
+    assert len(people) == 1
+
+
+def test_validate_employee_reports_each_problem():
+    errors = validate_employee({'email': None, 'startDate': '2020-13-01', 'teams': [{'id': 1}], 'type': 'PART_TIME'})
+    assert errors == ['email: missing', 'startDate: expected a date (YYYY-MM-DD), got str \'2020-13-01\'',
+                      'type: expected one of FULL_TIME, CONTRACTOR, NON_EMPLOYEE, got str \'PART_TIME\'',
+                      'teams[].id: expected a string, got int 1']
+
+
+def test_validate_team_requires_id_and_name():
+    assert validate_team({'id': 't', 'name': 'T', 'members': [{'email': 'a@example.com'}]}) == []
+    assert validate_team({'id': 't', 'members': [{}]}) == ['name: missing', 'members[].email: missing']
+
+
+def test_quarantine_file_holds_the_rejected_records_of_the_last_run(tmp_path):
+    quarantine_file = tmp_path / 'quarantine.jsonl'
+    _, rejected = transform([VALID, dict(VALID, workerID='2', workerEmail='b@example.com', hireDate='01/02/2020')])
+    quarantine.write(str(quarantine_file), rejected)
+    lines = [json.loads(line) for line in quarantine_file.read_text().splitlines()]
+    assert [(line['type'], line['record']['email']) for line in lines] == [('people', 'b@example.com')]
+    quarantine.write(str(quarantine_file), [])
+    assert quarantine_file.read_text() == ''
@@ -0,0 +1,41 @@
+import pytest
+
+from utils import staging
+
+RECORDS = [b'{"email":"a@example.com"}', b'{"email":"b@example.com"}']
+
+
+def test_staged_records_round_trip(tmp_path):
+    staged = staging.write(str(tmp_path), 'people', iter(RECORDS))
+    loaded = staging.load(str(tmp_path), 'people')
+    assert len(loaded) == 2
+    assert list(loaded.iter_serialized()) == RECORDS
+    assert [record['email'] for record in loaded] == ['a@example.com', 'b@example.com']
+    assert loaded.data_hash == staged.data_hash
+
+
+def test_missing_staged_records_are_an_error(tmp_path):
+    with pytest.raises(ValueError, match='No staged people records'):
+        staging.load(str(tmp_path), 'people')
+
+
+def test_interrupted_staging_leaves_no_records_to_upload(tmp_path):
+    staging.write(str(tmp_path), 'people', iter(RECORDS))
+
+    def interrupted():
+        yield RECORDS[0]
+        raise RuntimeError('transform failed')
+
+    with pytest.raises(RuntimeError):
+        staging.write(str(tmp_path), 'people', interrupted())
+    # The records staged before are no longer valid, and the partial ones were never written
+    with pytest.raises(ValueError, match='No staged people records'):
+        staging.load(str(tmp_path), 'people')
+
+
+def test_staged_records_that_do_not_match_their_manifest_are_an_error(tmp_path):
+    staged = staging.write(str(tmp_path), 'people', iter(RECORDS))
+    with open(staged.data_file, 'ab') as f:
+        f.write(b'{"email":"c@example.com"}\n')
+    with pytest.raises(ValueError, match='do not match their manifest'):
+        staging.load(str(tmp_path), 'people')
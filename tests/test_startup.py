@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+from bench_startup import IMPORT_BUDGET_MS, IMPORT_SCRIPT, run_child
+
+
+def test_import_is_within_budget_and_lazy():
+    # Timed in fresh processes, best of three, so that a single import slowed down by other work does not fail the test
+    results = [run_child(IMPORT_SCRIPT) for _ in range(3)]
+    import_ms = min(result['seconds'] for result in results) * 1000
+    assert import_ms <= IMPORT_BUDGET_MS, f"importing sync_people took {import_ms:.0f} ms (budget {IMPORT_BUDGET_MS} ms)"
+    assert [result['loaded'] for result in results] == [[], [], []]
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from conftest import MAPPING_FILE, sample_entries
+from utils import glean, http_client, workday
+from utils.config import use_settings
+from utils.workday import get_report_data_async
+
+
+@pytest.fixture
+def sharded(monkeypatch, workday):
+    """Shard the sample report by company, with the last worker of shard 'A' listed in shard 'B' too."""
+    entries = workday.entries
+    workday.shard_prompt = 'Company'
+    workday.shards = {'A': entries[:3], 'B': entries[2:]}
+    # Retry failed shards straight away
+    monkeypatch.setattr(random, 'uniform', lambda a, b: 0)
+    return workday
+
+
+def fetch_report(settings):
+    with use_settings(settings):
+        return http_client.run(get_report_data_async(dedupe_key='workerID'))
+
+
+def test_shards_are_merged_without_duplicate_workers(sharded, sync_settings, caplog):
+    report = fetch_report(sync_settings(WORKDAY_REPORT_SHARD_PROMPT='Company', WORKDAY_REPORT_SHARD_VALUES='A, B'))
+    assert report['Report_Entry'] == sharded.entries
+    assert sorted(request['shard'] for request in sharded.requests) == ['A', 'B']
+    assert 'Skipped 1 duplicate workers' in caplog.text
+
+
+def test_failed_shard_is_retried_on_its_own(sharded, sync_settings):
+    sharded.failures = {'B': 2}
+    report = fetch_report(sync_settings(WORKDAY_REPORT_SHARD_PROMPT='Company', WORKDAY_REPORT_SHARD_VALUES='A,B'))
+    assert report['Report_Entry'] == sharded.entries
+    assert sorted(request['shard'] for request in sharded.requests) == ['A', 'B', 'B', 'B']
+
+
+def test_shard_failing_every_retry_fails_the_fetch(sharded, sync_settings):
+    sharded.failures = {'B': 3}
+    settings = sync_settings(WORKDAY_REPORT_SHARD_PROMPT='Company', WORKDAY_REPORT_SHARD_VALUES='A,B', WORKDAY_SHARD_MAX_RETRIES=2)
+    with pytest.raises(Exception, match='503'):
+        fetch_report(settings)
+
+
+def test_parallel_transform_gives_the_serial_output(monkeypatch):
+    monkeypatch.setattr(workday, 'PARALLEL_TRANSFORM_MIN_RECORDS', 4)
+    monkeypatch.setattr(workday, 'PARALLEL_TRANSFORM_CHUNK_SIZE', 3)
+    plan = glean.load_mapping(MAPPING_FILE, validate=True)
+    entries = [dict(entry, workerID=f"{entry['workerID']}-{i}") for i in range(2) for entry in sample_entries()]
+    # An invalid worker, rejected in a worker process
+    entries.insert(5, dict(entries[0], workerID='no-email', workerEmail=None))
+
+    serial_rejected, parallel_rejected = [], []
+    serial = workday.transform_people(entries, plan, rejected=serial_rejected)
+    parallel = workday.transform_people(entries, plan, processes=2, rejected=parallel_rejected)
+    assert parallel == serial
+    assert len(serial) == len(entries) - 1
+    assert parallel_rejected == serial_rejected != []
@@ -0,0 +1,68 @@
+from typing import Any, Iterable, Optional
+from dataclasses import dataclass, asdict
+import hashlib
+import json
+import logging
+import threading
+import time
+from utils import files
+from utils.records import to_builtin_or_str
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+# People and teams may be uploaded at the same time, and their checkpoints share a file
+_file_lock = threading.Lock()
+
+@dataclass
+class UploadCheckpoint:
+    """Progress of a bulk upload, recorded after each page is acknowledged by the Glean API."""
+    upload_id: str
+    data_hash: str
+    batch_size: int
+    batch_max_bytes: Optional[int]
+    last_page: int
+    timestamp: float
+
+    def is_resumable(self, data_hash: str, batch_size: int, batch_max_bytes: Optional[int], max_age: int) -> bool:
+        """Return True if an upload of the same data (paged the same way) can continue from this checkpoint."""
+        return (self.data_hash == data_hash
+                and self.batch_size == batch_size
+                and self.batch_max_bytes == batch_max_bytes
+                and time.time() - self.timestamp <= max_age)
+
+def data_hash(records: Iterable[dict[str, Any]]) -> str:
+    """Return a stable hash of the data being uploaded."""
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        digest.update(json.dumps(record, sort_keys=True, separators=(',', ':'), default=to_builtin_or_str).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def _read(checkpoint_file: str) -> dict[str, Any]:
+    return files.read_json(checkpoint_file, "upload checkpoint file")
+
+def load_checkpoint(checkpoint_file: str, type: str) -> Optional[UploadCheckpoint]:
+    """Load the checkpoint of an unfinished upload of a data type, or None if there is none."""
+    checkpoint = _read(checkpoint_file).get(type)
+    if not checkpoint:
+        return None
+    try:
+        return UploadCheckpoint(**checkpoint)
+    except TypeError:
+        logger.warning(f"Upload checkpoint in '{checkpoint_file}' is not valid. Ignoring it.")
+        return None
+
+def save_checkpoint(checkpoint_file: str, type: str, checkpoint: UploadCheckpoint):
+    """Save the checkpoint of an upload of a data type, keeping the checkpoints of other data types."""
+    with _file_lock:
+        checkpoints = _read(checkpoint_file)
+        checkpoints[type] = asdict(checkpoint)
+        files.write_json(checkpoint_file, checkpoints)
+
+def clear_checkpoint(checkpoint_file: str, type: str):
+    """Remove the checkpoint of a data type once its upload has completed (or can no longer be resumed)."""
+    with _file_lock:
+        checkpoints = _read(checkpoint_file)
+        if checkpoints.pop(type, None) is not None:
+            files.write_json(checkpoint_file, checkpoints)
@@ -1,13 +1,19 @@
 from pydantic import HttpUrl, SecretStr, model_validator, ValidationError
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from enum import Enum
-from typing import Optional
+from typing import IO, Any, Callable, Iterator, Mapping, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import lru_cache
 from dataclasses import dataclass
 from datetime import datetime
+import json
 import os
 import logging
 
+# Bytes reserved in each page uploaded to Glean for the fields sent alongside the records (uploadId, isFirstPage, etc.)
+PAGE_ENVELOPE_BYTES = 256
+
 class AuthType(str, Enum):
     BASIC = 'basic'
     BEARER = 'bearer'
@@ -15,6 +21,7 @@ class AuthType(str, Enum):
 class DataType(str, Enum):
     PEOPLE = 'people'
     TEAMS = 'teams'
+    ALL = 'all'
 
 class OutputType(str, Enum):
     API = 'api'
@@ -27,6 +34,16 @@ class TestMode(str, Enum):
 class GleanApiVersion(str, Enum):
     V1 = 'v1'
 
+class ReportFormat(str, Enum):
+    JSON = 'json'
+    CSV = 'csv'
+    XML = 'xml'
+
+class PreflightAction(str, Enum):
+    REPORT = 'report'
+    FAIL = 'fail'
+    DROP = 'drop'
+
 @dataclass
 class UploadResult:
     success: bool
@@ -34,6 +51,44 @@ class UploadResult:
     upload_id: str
     warnings: list[str]
     timestamp: datetime
+    records_deleted: int = 0
+
+@dataclass
+class ReportDownload:
+    """A downloaded Workday report. The body is None if the report has not been modified since it was last fetched."""
+    body: Optional[IO[bytes]]
+    body_hash: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    report_format: ReportFormat = ReportFormat.JSON
+
+    @property
+    def not_modified(self) -> bool:
+        return self.body is None
+
+@dataclass(frozen=True)
+class TransformPlan:
+    """Field mapping compiled once into the steps needed to transform each Workday record."""
+    mapping: dict[str, Any]
+    fields: tuple[tuple[str, Callable[[dict[str, Any]], Any]], ...]
+    social_networks: tuple[tuple[str, str, str], ...]
+    additional_fields: tuple[str, ...]
+    email_key: Optional[str]
+    team_source_field: Optional[str]
+    team_id_key: Optional[str]
+    team_name_key: Optional[str]
+    team_extra_fields: tuple[tuple[str, str], ...]
+    # Types of transformed people and teams (and of the values nested in them): compact records or dicts
+    compact: bool
+    # Whether transformed people and teams are validated against the Glean schemas
+    validate: bool
+    person_type: Callable[[dict[str, Any]], Mapping[str, Any]]
+    team_type: Callable[..., Mapping[str, Any]]
+    team_member_type: Callable[..., Mapping[str, Any]]
+    additional_field_type: Callable[..., Mapping[str, Any]]
+    social_network_type: Callable[..., Mapping[str, Any]]
+    # Interns string values shared by many records, if records are compact
+    intern: Optional[Callable[[Any], Any]]
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
@@ -48,6 +103,12 @@ class Settings(BaseSettings):
     WORKDAY_API_KEY: Optional[SecretStr] = None
     WORKDAY_USERNAME: Optional[str] = None
     WORKDAY_PASSWORD: Optional[SecretStr] = None
+    WORKDAY_REPORT_SHARD_PROMPT: Optional[str] = None
+    WORKDAY_REPORT_SHARD_VALUES: Optional[str] = None
+    WORKDAY_SHARD_CONCURRENCY: int = 4
+    WORKDAY_SHARD_MAX_RETRIES: int = 3
+    WORKDAY_REPORT_FORMAT: ReportFormat = ReportFormat.JSON
+    WORKDAY_COMPRESSION: bool = True
 
     # Glean settings
     GLEAN_BACKEND_DOMAIN: Optional[str] = None
@@ -58,14 +119,43 @@ class Settings(BaseSettings):
     OUTPUT_TYPE: OutputType = OutputType.API
     DATA_TYPE: DataType = DataType.PEOPLE
     BATCH_SIZE: int = 250
+    BATCH_MAX_BYTES: Optional[int] = None
+    UPLOAD_CONCURRENCY: int = 1
+    UPLOAD_MAX_RETRIES: int = 5
+    UPLOAD_GZIP: bool = False
+    UPLOAD_CHECKPOINT_FILE: Optional[str] = None
+    UPLOAD_CHECKPOINT_MAX_AGE: int = 3600
+    DELTA_SYNC: bool = False
+    DELTA_SYNC_STATE_FILE: str = 'sync_state.json'
+    DELTA_SYNC_MAX_CHANGES: int = 500
+    REPORT_CACHE_FILE: Optional[str] = None
+    STREAMING_MODE: bool = False
+    PIPELINE_MODE: bool = False
+    PIPELINE_QUEUE_SIZE: int = 8
+    TRANSFORM_PROCESSES: int = 1
+    COMPACT_RECORDS: bool = False
+    CSV_GZIP: bool = False
+    METRICS_FILE: Optional[str] = None
+    METRICS_PROMETHEUS_FILE: Optional[str] = None
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    GLEAN_MAX_CONCURRENT_REQUESTS: Optional[int] = None
+    GLEAN_MAX_REQUESTS_PER_SECOND: Optional[float] = None
+    STAGING_DIR: Optional[str] = None
+    SCHEMA_VALIDATION: bool = False
+    PREFLIGHT_CHECK: Optional[PreflightAction] = None
+    QUARANTINE_FILE: Optional[str] = None
 
     # Debug and test settings
     DEBUG_MODE: bool = False
+    DEBUG_LOG_SAMPLE_SIZE: int = 5
     TEST_MODE: Optional[TestMode] = None
     TEST_DATA_FILE: Optional[str] = None
 
     @model_validator(mode='after')
     def validate_settings(self):
+        if self.BATCH_MAX_BYTES is not None and self.BATCH_MAX_BYTES <= PAGE_ENVELOPE_BYTES:
+            raise ValueError(f'BATCH_MAX_BYTES must be greater than {PAGE_ENVELOPE_BYTES}, to leave room for records in each page.')
         if self.TEST_MODE == TestMode.PUSH:
             self._validate_push_mode()
         elif self.TEST_MODE == TestMode.PULL:
@@ -89,31 +179,107 @@ class Settings(BaseSettings):
     def _validate_workday_settings(self, mode_description: str = ''):
         suffix = f' {mode_description}' if mode_description else ''
         if not self.WORKDAY_REPORT_URL:
-            raise ValueError(f'WORKDAY_REPORT_URL is required{suffix}.', error_type='value_error')
+            raise ValueError(f'WORKDAY_REPORT_URL is required{suffix}.')
         if self.WORKDAY_AUTH_TYPE == AuthType.BASIC:
             if not self.WORKDAY_USERNAME or not self.WORKDAY_PASSWORD:
-                raise ValueError(f'Username and password are required for Workday basic authentication{suffix}.', error_type='value_error')
+                raise ValueError(f'Username and password are required for Workday basic authentication{suffix}.')
         elif self.WORKDAY_AUTH_TYPE == AuthType.BEARER:
             if not self.WORKDAY_API_KEY:
-                raise ValueError(f'Workday API key is required for bearer authentication{suffix}.', error_type='value_error')
+                raise ValueError(f'Workday API key is required for bearer authentication{suffix}.')
+        if bool(self.WORKDAY_REPORT_SHARD_PROMPT) != bool(self.WORKDAY_REPORT_SHARD_VALUES):
+            raise ValueError(f'WORKDAY_REPORT_SHARD_PROMPT and WORKDAY_REPORT_SHARD_VALUES must be set together{suffix}.')
 
     def _validate_glean_settings(self, mode_description: str = ''):
         suffix = f' {mode_description}' if mode_description else ''
         if not self.GLEAN_BACKEND_DOMAIN or not self.GLEAN_API_KEY:
-            raise ValueError(f'GLEAN_BACKEND_DOMAIN and GLEAN_API_KEY are required{suffix}', error_type='value_error')
+            raise ValueError(f'GLEAN_BACKEND_DOMAIN and GLEAN_API_KEY are required{suffix}')
+
+def _error_messages(e: ValidationError) -> list[str]:
+    messages = []
+    for error in e.errors():
+        if 'ctx' in error and 'error' in error['ctx']:
+            messages.append(str(error['ctx']['error']))
+        elif error['loc']:
+            messages.append(f"{error['loc'][0]}: {error['msg']}")
+        else:
+            messages.append(error['msg'])
+    return messages
 
 @lru_cache
-def get_settings():
+def _load_settings() -> Settings:
     try:
         return Settings()
     except ValidationError as e:
-        for error in e.errors():
-            if 'ctx' in error and 'error' in error['ctx']:
-                logger.error(error['ctx']['error'])
-            else:
-                logger.error(error['msg'])
+        for message in _error_messages(e):
+            logger.error(message)
         raise ConfigurationError("Settings validation failed. Please check the configuration.")
 
+# Settings of the sync job run in the current context (see use_settings)
+_job_settings: ContextVar[Optional[Settings]] = ContextVar('job_settings', default=None)
+
+def get_settings() -> Settings:
+    """Return the settings of the sync job being run (see use_settings), or else the settings read from env/.env."""
+    settings = _job_settings.get()
+    return settings if settings is not None else _load_settings()
+
+# The settings read from env/.env are cached. Call get_settings.cache_clear() to read them again.
+get_settings.cache_clear = _load_settings.cache_clear
+
+@contextmanager
+def use_settings(settings: Settings) -> Iterator[Settings]:
+    """
+    Use the given settings (e.g. those of one sync job) wherever get_settings() is called in the current context.
+
+    The settings apply to the current thread or asyncio task, and to the tasks and threads it starts with a copy of its
+    context (e.g. with asyncio.to_thread), so several jobs with different settings can run in one process.
+    """
+    token = _job_settings.set(settings)
+    try:
+        yield settings
+    finally:
+        _job_settings.reset(token)
+
+@dataclass
+class SyncJob:
+    """A sync job run with other jobs in one process: a unique name, and the settings that differ from env/.env."""
+    name: str
+    overrides: dict[str, Any]
+
+    def load_settings(self) -> Settings:
+        """Return the settings of the job. Settings that the job does not set are read from env/.env."""
+        try:
+            return Settings(**self.overrides)
+        except ValidationError as e:
+            raise ConfigurationError(f"Settings of sync job '{self.name}' are invalid: {'; '.join(_error_messages(e))}")
+
+def load_jobs(jobs_file: str) -> list[SyncJob]:
+    """
+    Load sync jobs from a JSON file: a list of objects, each with a unique 'name' and the settings of the job (e.g.
+    WORKDAY_REPORT_URL, FIELD_MAPPING_FILE, GLEAN_BACKEND_DOMAIN, DATA_TYPE).
+
+    Environment variables in string values (e.g. "${ACME_GLEAN_API_KEY}") are expanded, so credentials can be kept out
+    of the file.
+    """
+    try:
+        with open(jobs_file, 'r') as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigurationError(f"Could not load the sync jobs file '{jobs_file}': {e}")
+
+    if not isinstance(entries, list) or not entries:
+        raise ConfigurationError(f"The sync jobs file '{jobs_file}' must contain a list of jobs.")
+
+    jobs = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get('name') or not isinstance(entry['name'], str):
+            raise ConfigurationError(f"Sync job {i + 1} in '{jobs_file}' must be an object with a 'name'.")
+        if any(job.name == entry['name'] for job in jobs):
+            raise ConfigurationError(f"Sync job name '{entry['name']}' is used more than once in '{jobs_file}'.")
+        overrides = {key: os.path.expandvars(value) if isinstance(value, str) else value
+                     for key, value in entry.items() if key != 'name'}
+        jobs.append(SyncJob(entry['name'], overrides))
+    return jobs
+
 class ConfigurationError(Exception):
     """Custom exception for configuration errors."""
     pass
\ No newline at end of file
@@ -0,0 +1,112 @@
+from typing import Any, Iterable, Optional
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import threading
+from utils import files
+from utils.records import to_builtin_or_str
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 2
+
+# People and teams may be uploaded at the same time, and their state shares a file
+_state_lock = threading.Lock()
+
+@dataclass
+class ChangeSet:
+    """Entities that have been added, changed or removed since the last successful sync."""
+    upserts: list[dict[str, Any]] = field(default_factory=list)
+    deletes: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.upserts) + len(self.deletes)
+
+def entity_key(record: dict[str, Any]) -> Optional[str]:
+    """Return the key used to track an entity between runs (its id, or its email if it has no id)."""
+    key = record.get('id') or record.get('email')
+    return str(key) if key is not None else None
+
+def delete_key(record: dict[str, Any], type: str) -> Optional[str]:
+    """Return the value used to delete an entity: the email for people, or the id for teams."""
+    return record.get('email') if type == 'people' else record.get('id')
+
+def content_hash(record: dict[str, Any]) -> str:
+    """Return a stable hash of the content of a transformed record."""
+    encoded = json.dumps(record, sort_keys=True, separators=(',', ':'), default=to_builtin_or_str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def team_fingerprint(team: dict[str, Any]) -> str:
+    """
+    Return a stable hash of the content of a transformed team that does not depend on the order of its members, so a
+    team is not seen as changed when its members are listed in a different order (e.g. when report shards arrive in a
+    different order). Cheaper than content_hash for large teams, as only member emails are hashed.
+    """
+    attributes = {key: value for key, value in team.items() if key != 'members'}
+    emails = sorted(str(member.get('email')) for member in team.get('members') or ())
+    encoded = json.dumps(attributes, sort_keys=True, separators=(',', ':'), default=to_builtin_or_str).encode('utf-8')
+    digest = hashlib.blake2b(encoded, digest_size=16)
+    digest.update('\n'.join(emails).encode('utf-8'))
+    return digest.hexdigest()
+
+def build_state(records: Iterable[dict[str, Any]], type: str) -> dict[str, list[str]]:
+    """Return the state of a set of records: entity key -> [content hash, delete key]."""
+    hash_record = team_fingerprint if type == 'teams' else content_hash
+    state = {}
+    for record in records:
+        key = entity_key(record)
+        if key is not None:
+            state[key] = [hash_record(record), delete_key(record, type)]
+    return state
+
+def diff_state(records: list[dict[str, Any]], current: dict[str, list[str]], previous: dict[str, list[str]]) -> ChangeSet:
+    """
+    Compare the current records with the state from the last successful sync.
+
+    Entities that are gone are deleted by the delete key they were uploaded with. So is an entity whose delete key
+    has changed (e.g. a person whose email has changed), as it is indexed again under its new one, unless another
+    entity now uses the old key.
+    """
+    changes = ChangeSet()
+    stale_delete_keys = []
+    for record in records:
+        key = entity_key(record)
+        if key is None:
+            continue
+        previous_entry = previous.get(key)
+        if previous_entry is None or previous_entry[0] != current[key][0]:
+            changes.upserts.append(record)
+            if previous_entry is not None and previous_entry[1] and previous_entry[1] != current[key][1]:
+                stale_delete_keys.append(previous_entry[1])
+    for key, (_, previous_delete_key) in previous.items():
+        if key not in current and previous_delete_key:
+            changes.deletes.append(previous_delete_key)
+    if stale_delete_keys:
+        current_delete_keys = {entry[1] for entry in current.values()}
+        changes.deletes.extend(delete_key for delete_key in stale_delete_keys if delete_key not in current_delete_keys)
+    return changes
+
+def load_state(state_file: str, type: str) -> Optional[dict[str, list[str]]]:
+    """Load the state of the last successful sync for a data type, or None if there is no usable state."""
+    state = files.read_json(state_file, "sync state file", "A full upload will be performed.")
+    if not state:
+        return None
+
+    if state.get('version') != STATE_VERSION:
+        logger.warning(f"Sync state file '{state_file}' has an unsupported version. A full upload will be performed.")
+        return None
+
+    return state.get(type)
+
+def save_state(state_file: str, type: str, entities: dict[str, list[str]]):
+    """Save the state of a successful sync for a data type, keeping the state of other data types."""
+    with _state_lock:
+        state = files.read_json(state_file, "sync state file", "It will be replaced.")
+        if state.get('version') != STATE_VERSION:
+            state = {}
+
+        state['version'] = STATE_VERSION
+        state[type] = entities
+        files.write_json(state_file, state, separators=(',', ':'))
@@ -0,0 +1,51 @@
+from typing import IO, Any, Iterator
+from contextlib import contextmanager
+import json
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def atomic_write(file_path: str, mode: str = 'w') -> Iterator[IO[Any]]:
+    """
+    Open a file to write (in text mode, or binary with mode='wb') that only replaces file_path once it has been
+    written in full, so that an interrupted run never leaves a truncated file behind (and a reader never sees a
+    partial one).
+    """
+    temp_file = f"{file_path}.tmp"
+    try:
+        with open(temp_file, mode) as f:
+            yield f
+        os.replace(temp_file, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+def write_json(file_path: str, data: Any, **kwargs: Any):
+    """Write data to a JSON file atomically (see atomic_write). Keyword arguments are passed to json.dump."""
+    with atomic_write(file_path) as f:
+        json.dump(data, f, **kwargs)
+
+def read_json(file_path: str, description: str, consequence: str = "Ignoring it.") -> dict[str, Any]:
+    """
+    Read a JSON object from a file written by write_json (e.g. an upload checkpoint file), or return an empty dict if
+    the file does not exist. A file that cannot be read or does not hold a JSON object is logged as a warning, naming
+    the file by its description and the consequence, and read as an empty dict.
+    """
+    try:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read {description} '{file_path}' ({e}). {consequence}")
+        return {}
+    if not isinstance(data, dict):
+        logger.warning(f"Could not read {description} '{file_path}' (not a JSON object). {consequence}")
+        return {}
+    return data
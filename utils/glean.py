@@ -1,24 +1,137 @@
-from typing import Any, Literal
+from typing import Any, Iterable, Iterator, Literal, Optional, Sized
+from collections import deque
+from collections.abc import Mapping
+from itertools import chain
+import asyncio
+import io
 import json
 import os
 import logging
-import requests
+import random
+import time
+import weakref
 import csv
-from datetime import datetime
+import gzip
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from uuid_extensions import uuid7
-from utils.config import UploadResult, DataType, GleanApiVersion, get_settings
+from utils.config import PAGE_ENVELOPE_BYTES, UploadResult, DataType, GleanApiVersion, TransformPlan, get_settings
+from utils.workday import compile_mapping
+from utils import delta, checkpoint, files, http_client, metrics, pipeline, staging
+from utils.lazy import lazy_import
+from utils.records import to_builtin
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
 logger = logging.getLogger(__name__)
 
-def load_mapping(mapping_file: str) -> dict[str, Any]:
-    """Load and return the field mapping from a JSON file."""
+httpx = lazy_import('httpx')
+
+# orjson is used to serialize records if it is installed, as it is several times faster than the json module
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=to_builtin)
+except ImportError:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=to_builtin)
+
+    def _dumps(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode('utf-8')
+
+# Directory that mapping files are looked up in
+_REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Status codes on which requests are retried (and the parallel upload mode reduces concurrency)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 120.0
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit the number of requests in flight, backing off when the server is throttling or failing.
+
+    The limit is halved each time a request is throttled (HTTP 429/5xx) and grows back by one request per window of
+    successful requests, up to the configured maximum.
+    """
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, throttled: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                logger.debug(f"Glean API is throttling. Reducing upload concurrency to {int(self.limit)}.")
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+class TenantLimiter:
+    """
+    Limit the requests sent to one Glean tenant by all uploads in the process (e.g. by several sync jobs uploading to
+    the same tenant): at most max_concurrency requests in flight, and at most requests_per_second requests a second.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, requests_per_second: Optional[float] = None):
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._interval = 1 / requests_per_second if requests_per_second else 0.0
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        if self._semaphore:
+            await self._semaphore.acquire()
+        try:
+            if self._interval:
+                # Requests are spaced evenly, so a burst is spread out rather than rejected by the tenant
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                self._next_start = start + self._interval
+                await asyncio.sleep(start - now)
+        except BaseException:
+            if self._semaphore:
+                self._semaphore.release()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        if self._semaphore:
+            self._semaphore.release()
+
+# Limiters of the Glean tenants requests are sent to, by event loop and then by GLEAN_BACKEND_DOMAIN
+_tenant_limiters: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, TenantLimiter]]' = weakref.WeakKeyDictionary()
+
+def set_tenant_limits(domain: str, max_concurrency: Optional[int] = None, requests_per_second: Optional[float] = None):
+    """Set the limits of requests sent to a Glean tenant from the running event loop, instead of those in its settings."""
+    _tenant_limiters.setdefault(asyncio.get_running_loop(), {})[domain] = TenantLimiter(max_concurrency, requests_per_second)
+
+def _tenant_limiter() -> TenantLimiter:
+    """Return the limiter of the Glean tenant being uploaded to, created from its settings when it is first used."""
+    settings = get_settings()
+    limiters = _tenant_limiters.setdefault(asyncio.get_running_loop(), {})
+    limiter = limiters.get(settings.GLEAN_BACKEND_DOMAIN)
+    if limiter is None:
+        limiter = limiters[settings.GLEAN_BACKEND_DOMAIN] = TenantLimiter(settings.GLEAN_MAX_CONCURRENT_REQUESTS, settings.GLEAN_MAX_REQUESTS_PER_SECOND)
+    return limiter
+
+def load_mapping(mapping_file: str, compact: bool = False, validate: bool = False) -> TransformPlan:
+    """
+    Load the field mapping from a JSON file and return it compiled into a transform plan (see compile_mapping).
+
+    Plans are cached until the file is modified, so later runs in the same process (e.g. a warm serverless instance)
+    don't load and compile the mapping again.
+    """
     try:
         # Mapping file will be located in parent directory so get correct path:
-        mapping_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', mapping_file)
-
-        with open(mapping_file_path, 'r') as f:
-            return json.load(f)
+        mapping_file_path = os.path.join(_REPO_DIR, mapping_file)
+        stat = os.stat(mapping_file_path)
+        return _load_mapping_file(mapping_file_path, stat.st_mtime_ns, stat.st_size, compact, validate)
     except FileNotFoundError:
         raise FileNotFoundError(f"Mapping file '{mapping_file}' not found.")
     except json.JSONDecodeError:
@@ -26,12 +139,196 @@ def load_mapping(mapping_file: str) -> dict[str, Any]:
     except Exception as e:
         raise Exception(f"An error occurred loading the mapping file: {e}")
 
-def bulk_upload_entities(data: list[dict[str, Any]], type: Literal['people', 'teams'] = 'people') -> UploadResult:
-    """Bulk upload the transformed people/teams data to the Glean Indexing API."""
+@lru_cache(maxsize=16)
+def _load_mapping_file(mapping_file_path: str, mtime_ns: int, size: int, compact: bool, validate: bool) -> TransformPlan:
+    with open(mapping_file_path, 'r') as f:
+        return compile_mapping(json.load(f), compact, validate)
+
+def _iter_encoded_pages(data: Iterable[dict[str, Any]], batch_size: int, max_bytes: Optional[int] = None) -> Iterator[list[bytes]]:
+    """
+    Serialize each record once and yield pages of serialized records.
+
+    Pages hold batch_size records, or if max_bytes is set, as many records as fit in max_bytes once serialized. A
+    record that is larger than max_bytes on its own is sent in a page by itself. Staged records are already
+    serialized, so they are read from the staging file as they are.
+    """
+    chunks = data.iter_serialized() if isinstance(data, staging.StagedRecords) else map(_dumps, data)
+    budget = max_bytes - PAGE_ENVELOPE_BYTES if max_bytes else None
+    page = []
+    page_bytes = 0
+    for chunk in chunks:
+        if page and (page_bytes + len(chunk) > budget if budget else len(page) >= batch_size):
+            yield page
+            page = []
+            page_bytes = 0
+        page.append(chunk)
+        page_bytes += len(chunk) + 1
+    if page:
+        yield page
+
+def stage_entities(data: Iterable[dict[str, Any]], type: Literal['people', 'teams'] = 'people') -> staging.StagedRecords:
+    """
+    Serialize transformed people/teams as they are sent to the Glean API and stage them in STAGING_DIR (see
+    staging.write). Uploads of the returned records read them from disk one page at a time.
+    """
+    return staging.write(get_settings().STAGING_DIR, type, map(_dumps, data))
+
+def _iter_pages(pages: Iterable[list[bytes]]) -> Iterator[tuple[list[bytes], bool]]:
+    """Yield (page, is_last_page) tuples, reading one page ahead of the page being yielded."""
+    pages = iter(pages)
+    page = next(pages, None)
+    while page is not None:
+        next_page = next(pages, None)
+        yield page, next_page is None
+        page = next_page
+
+def _page_body(upload_id: str, is_first_page: bool, is_last_page: bool, key: str, records: list[bytes]) -> bytes:
+    """Assemble the request body of a bulk upload page from records that have already been serialized."""
+    envelope = _dumps({
+        "uploadId": upload_id,
+        "isFirstPage": is_first_page,
+        "isLastPage": is_last_page,
+        "forceRestartUpload": is_first_page
+    })
+    return b''.join([envelope[:-1], b',"', key.encode('utf-8'), b'":[', b','.join(records), b']}'])
+
+def _retry_delay(response: Optional['httpx.Response'], attempt: int) -> float:
+    """Return how long to wait before a retry, honouring the Retry-After header if the server sent one."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(RETRY_MAX_DELAY, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                return min(RETRY_MAX_DELAY, max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds()))
+            except (TypeError, ValueError):
+                pass
+    # Exponential backoff with jitter, so that concurrent requests do not all retry at the same moment
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+async def _send_request_async(client: 'httpx.AsyncClient', url: str, headers: dict[str, str], body: Optional[bytes] = None,
+                              limiter: Optional[AdaptiveConcurrencyLimiter] = None, max_retries: int = 0,
+                              compress: bool = False) -> 'httpx.Response':
+    """
+    Send a single request (e.g. a page of a bulk upload) with a serialized JSON body, if any, to the Glean API.
+
+    Requests are sent with the shared async HTTP client, within the limits of the Glean tenant (see TenantLimiter).
+    Requests that fail with HTTP 429/5xx or a connection error are retried up to max_retries times. If a limiter is
+    given, the request is sent within its concurrency limit. If compress is set, the body is sent gzip-compressed.
+    """
+    headers = dict(headers)
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+    if compress and body is not None:
+        # Compressed in a thread, so other pages can be sent meanwhile
+        body = await asyncio.to_thread(gzip.compress, body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+
+    run_metrics = metrics.get_metrics()
+    run_metrics.observe('glean_request_bytes', len(body or b''))
+    started = time.perf_counter()
+
+    for attempt in range(1, max_retries + 2):
+        response = None
+        retryable = False
+        if limiter:
+            await limiter.acquire()
+        try:
+            async with _tenant_limiter():
+                response = await client.post(url, headers=headers, content=body)
+            retryable = response.status_code in RETRY_STATUS_CODES
+        except httpx.TransportError:
+            retryable = True
+            if attempt > max_retries:
+                raise
+        finally:
+            if limiter:
+                await limiter.release(retryable)
+        if not retryable or attempt > max_retries:
+            # Includes the time spent on retries, i.e. how long the page (or entity) took to be accepted
+            run_metrics.observe('glean_request_seconds', time.perf_counter() - started)
+            return response
+        run_metrics.add('glean_request_retries')
+        delay = _retry_delay(response, attempt)
+        reason = f"HTTP {response.status_code}" if response is not None else "a connection error"
+        logger.warning(f"Glean API request failed with {reason}. Retrying in {delay:.1f}s (retry {attempt}/{max_retries}).")
+        await asyncio.sleep(delay)
+
+def _api_url(endpoint: str) -> str:
+    """Return the URL of a Glean Indexing API endpoint."""
+    domain = get_settings().GLEAN_BACKEND_DOMAIN
+    # A full URL (e.g. http://localhost:8080) can be given to use a local stand-in of the API for testing
+    base_url = domain.rstrip('/') if domain.startswith(('http://', 'https://')) else f"https://{domain}"
+    return f"{base_url}/api/index/{GleanApiVersion.V1.value}/{endpoint}"
+
+def _upload_http_error(e: 'httpx.HTTPStatusError') -> Exception:
+    """Build the exception raised when a request to the Glean API fails."""
+    error_msgs = {
+        409: "Duplicate upload ID. Please try again with a new upload ID.",
+        429: "Glean API rate limit exceeded. Please wait a few minutes and try again.",
+        500: "The Glean API is currently unavailable. Please try again later.",
+        501: "The Glean API is currently unavailable. Please try again later.",
+        503: "The Glean API is currently unavailable. Please try again later.",
+        400: "The request data was rejected as being invalid or malformed. Please check the data and try again.",
+        401: "Unauthorized. Please check that the Glean Indexing API key is valid and has the ENTITIES scope assigned.",
+        405: "The Glean API rejected the request as it was not made using a supported method, or to a valid API endpoint. Check the request and try again."
+    }
+    error_msg = error_msgs.get(e.response.status_code, str(e.response.text))
+    logger.debug(f"API response: {e.response.text}")
+    return Exception(f"Upload to Glean failed (HTTP {e.response.status_code}): {error_msg}")
+
+def _auth_headers() -> dict[str, str]:
+    """Return the headers used to authenticate with the Glean Indexing API."""
+    return {'Authorization': f'Bearer {get_settings().GLEAN_API_KEY.get_secret_value()}'}
+
+async def _schedule_processing_async(client: 'httpx.AsyncClient', headers: dict[str, str]) -> str:
+    """Request immediate processing of the uploaded data and return how long it will take to be visible in Glean."""
+    # Retried like the pages of an upload, so a throttled request does not delay processing by hours
+    process_response = await _send_request_async(client, _api_url('processallemployeesandteams'), headers,
+                                                  max_retries=get_settings().UPLOAD_MAX_RETRIES)
+
+    if not process_response.is_success:
+        wait_time = "3 hours"
+        logger.warning(f"Request to schedule immediate processing of uploaded data failed (HTTP {process_response.status_code}). Data will be automatically processed after {wait_time}.")
+    else:
+        wait_time = "1 hour"
+        logger.info("Immediate processing of uploaded data scheduled successfully.")
+
+    return wait_time
+
+def _check_page_response(response: 'httpx.Response', warnings: list[str]):
+    """Raise an HTTP error if a page upload failed, or record the warning if it succeeded with one."""
+    if response.status_code == 400 and "Employees uploaded successfully" in response.text:
+        warnings.append(f"Glean API returned 400 on success with warning: {response.text}")
+    else:
+        response.raise_for_status()
+
+async def bulk_upload_entities_async(data: Iterable[dict[str, Any]], type: Literal['people', 'teams'] = 'people', process: bool = True) -> UploadResult:
+    """
+    Bulk upload the transformed people/teams data to the Glean Indexing API, from an event loop.
+
+    Requests are sent with the shared async HTTP client (see http_client.get_async_client). The data can be a list or
+    any iterable (e.g. a generator of transformed records). Iterables are consumed one page at a time, with a single
+    page of lookahead to determine which page is the last. Pages are read and serialized in a thread, so a stream that
+    blocks (e.g. on the Workday download) does not block the event loop. Each record is serialized once, and pages
+    hold BATCH_SIZE records or, if BATCH_MAX_BYTES is set, as many records as fit in that many bytes.
+
+    If UPLOAD_CONCURRENCY is greater than 1, the first page is sent on its own, the middle pages are sent concurrently
+    and the last page is only sent once every other page has been acknowledged.
+
+    If UPLOAD_CHECKPOINT_FILE is set and the data is a list or staged records, the upload ID and the last acknowledged page are recorded
+    after each page. A later upload of the same data continues from the checkpoint instead of starting again, unless
+    the checkpoint is older than UPLOAD_CHECKPOINT_MAX_AGE seconds.
+
+    If process is False, immediate processing of the uploaded data is not requested (see schedule_processing).
+    """
     warnings = []
     upload_id = uuid7(as_type='str')
     count = 0
-    is_first_page = True
+    upload_checkpoint = None
+    resume_from_page = -1
+    pending: deque[tuple[int, int, asyncio.Task]] = deque()
 
     try:
         settings = get_settings()
@@ -39,78 +336,120 @@ def bulk_upload_entities(data: list[dict[str, Any]], type: Literal['people', 'te
         # Adjust logging level based on settings
         logger.setLevel(logging.DEBUG if settings.DEBUG_MODE else logging.INFO)
 
-        if not data:
-            raise ValueError("No data to upload to Glean API.")
-        
         if type not in ['people', 'teams']:
             raise ValueError("Invalid data type for upload of entities to Glean. Must be 'people' or 'teams'.")
+
+        pages = _iter_pages(_iter_encoded_pages(data, settings.BATCH_SIZE, settings.BATCH_MAX_BYTES))
+        # Reading the next page of a stream also fetches, parses and transforms its records, so the pages of a stream
+        # are read as part of the upload rather than timed as the serialize stage
+        in_memory = isinstance(data, Sized)
+
+        async def read_page() -> Optional[tuple[list[bytes], bool]]:
+            if not in_memory:
+                return await asyncio.to_thread(next, pages, None)
+            with metrics.get_metrics().stage('serialize'):
+                return await asyncio.to_thread(next, pages, None)
+
+        first_page = await read_page()
+
+        if first_page is None:
+            raise ValueError("No data to upload to Glean API.")
+
+        # The total is only known up front if the data is not a stream
+        total = f"/{len(data)}" if isinstance(data, Sized) else ""
         
         api_endpoint = 'bulkindexemployees' if type == 'people' else 'bulkindexteams'
-        url = f"https://{settings.GLEAN_BACKEND_DOMAIN}/api/index/{GleanApiVersion.V1.value}/{api_endpoint}"
+        url = _api_url(api_endpoint)
 
-        headers = {'Authorization': f'Bearer {settings.GLEAN_API_KEY.get_secret_value()}'}
+        headers = _auth_headers()
 
-        logger.info(f"Starting upload of {len(data)} records to the Glean API: {url}")
-        logger.info(f"Upload ID: {upload_id}")
+        # Checkpointing needs the hash of all data up front, so it is only possible when the data is not a stream.
+        # Staged records were hashed as they were staged.
+        if settings.UPLOAD_CHECKPOINT_FILE and isinstance(data, (list, staging.StagedRecords)):
+            current_hash = data.data_hash if isinstance(data, staging.StagedRecords) else await asyncio.to_thread(checkpoint.data_hash, data)
+            previous = checkpoint.load_checkpoint(settings.UPLOAD_CHECKPOINT_FILE, type)
+            if previous and previous.is_resumable(current_hash, settings.BATCH_SIZE, settings.BATCH_MAX_BYTES, settings.UPLOAD_CHECKPOINT_MAX_AGE):
+                upload_id = previous.upload_id
+                resume_from_page = previous.last_page
+            elif previous:
+                logger.info("Upload checkpoint found, but it is stale or the data has changed. Restarting the upload.")
+            upload_checkpoint = checkpoint.UploadCheckpoint(upload_id, current_hash, settings.BATCH_SIZE, settings.BATCH_MAX_BYTES,
+                                                            resume_from_page, time.time())
 
-        for i in range(0, len(data), settings.BATCH_SIZE):
-            bulk_data = data[i:i+settings.BATCH_SIZE]
-            is_last_page = i + settings.BATCH_SIZE >= len(data)
+        concurrency = max(1, settings.UPLOAD_CONCURRENCY)
+        client = http_client.get_async_client()
+        limiter = AdaptiveConcurrencyLimiter(concurrency) if concurrency > 1 else None
 
-            payload = {
-                "uploadId": upload_id,
-                "isFirstPage": is_first_page,
-                "isLastPage": is_last_page,
-                "forceRestartUpload": is_first_page
-            }
+        if total:
+            logger.info(f"Starting upload of {len(data)} records to the Glean API: {url}")
+        else:
+            logger.info(f"Starting streamed upload of records to the Glean API: {url}")
+        logger.info(f"Upload ID: {upload_id}" + (f" (up to {concurrency} pages in flight)" if limiter else ""))
+        if resume_from_page >= 0:
+            logger.info(f"Resuming upload from checkpoint. Skipping {resume_from_page + 1} page(s) already acknowledged by the Glean API.")
 
-            payload['employees' if type == 'people' else 'teams'] = bulk_data
+        run_metrics = metrics.get_metrics()
 
-            response = requests.post(url, headers=headers, json=payload)
+        def complete(page_number: int, records: int, response: 'httpx.Response'):
+            nonlocal count
+            _check_page_response(response, warnings)
+            count += records
+            run_metrics.add(f'{DataType(type).value}_records_uploaded', records)
+            run_metrics.add(f'{DataType(type).value}_pages_uploaded')
+            logger.info(f"Uploaded {count}{total} records to Glean API.")
+            logger.debug(f"API code: {response.status_code}")
+            if upload_checkpoint:
+                upload_checkpoint.last_page = page_number
+                upload_checkpoint.timestamp = time.time()
+                checkpoint.save_checkpoint(settings.UPLOAD_CHECKPOINT_FILE, type, upload_checkpoint)
 
-            if response.status_code == 400 and "Employees uploaded successfully" in response.text:
-                warnings.append(f"Glean API returned 400 on success with warning: {response.text}")
+        page_number = 0
+        next_page = first_page
+        while next_page is not None:
+            bulk_data, is_last_page = next_page
+            if page_number <= resume_from_page:
+                count += len(bulk_data)
             else:
-                response.raise_for_status()
+                is_first_page = page_number == 0
+                body = _page_body(upload_id, is_first_page, is_last_page, 'employees' if type == 'people' else 'teams', bulk_data)
+                logger.debug(f"Page {page_number + 1}: {len(bulk_data)} records, {len(body)} bytes")
 
-            count += len(bulk_data)
-            is_first_page = False
+                if limiter and not is_first_page and not is_last_page:
+                    # Middle pages are sent concurrently. Bound the number of queued pages so a stream is not read ahead too far.
+                    task = asyncio.create_task(_send_request_async(client, url, headers, body, limiter, settings.UPLOAD_MAX_RETRIES, settings.UPLOAD_GZIP))
+                    pending.append((page_number, len(bulk_data), task))
+                    while len(pending) > concurrency * 2:
+                        page, records, task = pending.popleft()
+                        complete(page, records, await task)
+                else:
+                    # The last page is only sent once all other pages have been acknowledged
+                    while pending:
+                        page, records, task = pending.popleft()
+                        complete(page, records, await task)
+                    response = await _send_request_async(client, url, headers, body, limiter, settings.UPLOAD_MAX_RETRIES, settings.UPLOAD_GZIP)
+                    complete(page_number, len(bulk_data), response)
 
-            logger.info(f"Uploaded {count}/{len(data)} records to Glean API.")
-            logger.debug(f"API code: {response.status_code}")
+            page_number += 1
+            next_page = await read_page()
 
-        wait_time = "1 hour"
+        if upload_checkpoint:
+            checkpoint.clear_checkpoint(settings.UPLOAD_CHECKPOINT_FILE, type)
 
-        process_url = f"https://{settings.GLEAN_BACKEND_DOMAIN}/api/index/{GleanApiVersion.V1.value}/processallemployeesandteams"
-        process_response = requests.post(process_url, headers=headers)
+        wait_time = await _schedule_processing_async(client, headers) if process else None
 
-        if not process_response.ok:
-            wait_time = "3 hours"
-            logger.warning(f"Request to schedule immediate processing of uploaded data failed (HTTP {process_response.status_code}). Data will be automatically processed after {wait_time}.")
-        else:
-            logger.info("Immediate processing of uploaded data scheduled successfully.")
-
-    except requests.HTTPError as e:
-        error_msgs = {
-            409: "Duplicate upload ID. Please try again with a new upload ID.",
-            429: "Glean API rate limit exceeded. Please wait a few minutes and try again.",
-            500: "The Glean API is currently unavailable. Please try again later.",
-            501: "The Glean API is currently unavailable. Please try again later.",
-            503: "The Glean API is currently unavailable. Please try again later.",
-            400: "The request data was rejected as being invalid or malformed. Please check the data and try again.",
-            401: "Unauthorized. Please check that the Glean Indexing API key is valid and has the ENTITIES scope assigned.",
-            405: "The Glean API rejected the request as it was not made using a supported method, or to a valid API endpoint. Check the request and try again."
-        }
-        error_msg = error_msgs.get(e.response.status_code, str(e.response.text))
-        logger.debug(f"API response: {e.response.text}")
-        raise Exception(f"Upload to Glean failed (HTTP {e.response.status_code}): {error_msg}")
+    except httpx.HTTPStatusError as e:
+        # If the Glean API rejects the resumed upload, start again from the first page on the next run
+        if resume_from_page >= 0 and 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+            checkpoint.clear_checkpoint(settings.UPLOAD_CHECKPOINT_FILE, type)
+        raise _upload_http_error(e)
 
     except Exception as e:
         raise Exception(f"An error occurred uploading data to Glean API: {e}")
 
     else:
         logger.info(f"Data uploaded successfully to Glean API. Total records uploaded: {count}")
-        logger.info(f"Please allow {wait_time} for the data to be visible in the Glean app.")
+        if wait_time:
+            logger.info(f"Please allow {wait_time} for the data to be visible in the Glean app.")
         return UploadResult(
             success=True,
             records_uploaded=count,
@@ -118,43 +457,254 @@ def bulk_upload_entities(data: list[dict[str, Any]], type: Literal['people', 'te
             warnings=warnings,
             timestamp=datetime.now()
         )
-    
-def create_csv(data: list[dict[str, Any]], output_file: str, mode: str):
-    """Create a CSV file containing people or teams data."""
+
+    finally:
+        # If the upload failed, stop sending the pages still in flight
+        for _, _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, _, task in pending), return_exceptions=True)
+
+def bulk_upload_entities(data: Iterable[dict[str, Any]], type: Literal['people', 'teams'] = 'people', process: bool = True) -> UploadResult:
+    """Bulk upload the transformed people/teams data to the Glean Indexing API. Blocking version of bulk_upload_entities_async."""
+    return http_client.run(bulk_upload_entities_async(data, type=type, process=process))
+
+async def delta_upload_entities_async(data: Iterable[dict[str, Any]], type: Literal['people', 'teams'] = 'people', process: bool = True) -> UploadResult:
+    """
+    Upload only the people/teams that have changed since the last successful sync to the Glean Indexing API, from an
+    event loop.
+
+    A content hash of each entity is kept in DELTA_SYNC_STATE_FILE. Added and changed entities are sent to the
+    single-entity index endpoint and removed entities to the delete endpoint, up to UPLOAD_CONCURRENCY at a time. A
+    full bulk upload is performed instead if there is no state from a previous sync, or if the number of changes is
+    greater than DELTA_SYNC_MAX_CHANGES.
+
+    If process is False, immediate processing of the uploaded data is not requested (see schedule_processing).
+    """
+    warnings = []
+    upload_id = uuid7(as_type='str')
+    full_upload = False
+    changes = delta.ChangeSet()
+    wait_time = None
+
+    try:
+        settings = get_settings()
+
+        # Adjust logging level based on settings
+        logger.setLevel(logging.DEBUG if settings.DEBUG_MODE else logging.INFO)
+
+        if type not in ['people', 'teams']:
+            raise ValueError("Invalid data type for upload of entities to Glean. Must be 'people' or 'teams'.")
+
+        # Every record must be hashed (and may need to be bulk uploaded), so the data cannot be streamed
+        records = data if isinstance(data, list) else await asyncio.to_thread(list, data)
+
+        if not records:
+            raise ValueError("No data to upload to Glean API.")
+
+        current_state = await asyncio.to_thread(delta.build_state, records, type)
+        previous_state = await asyncio.to_thread(delta.load_state, settings.DELTA_SYNC_STATE_FILE, type)
+
+        if previous_state is None:
+            logger.info(f"No previous sync state found in {settings.DELTA_SYNC_STATE_FILE}. Performing a full upload.")
+            full_upload = True
+        else:
+            changes = await asyncio.to_thread(delta.diff_state, records, current_state, previous_state)
+            logger.info(f"{len(changes.upserts)} records added or changed and {len(changes.deletes)} removed since the last successful sync.")
+
+            if len(changes) > settings.DELTA_SYNC_MAX_CHANGES:
+                logger.info(f"Number of changes is greater than DELTA_SYNC_MAX_CHANGES ({settings.DELTA_SYNC_MAX_CHANGES}). Performing a full upload.")
+                full_upload = True
+
+        if changes and not full_upload:
+            if type == 'people':
+                index_url, delete_url = _api_url('indexemployee'), _api_url('deleteemployee')
+                index_payloads = [{'employee': record} for record in changes.upserts]
+                delete_payloads = [{'employeeEmail': email} for email in changes.deletes]
+            else:
+                index_url, delete_url = _api_url('indexteam'), _api_url('deleteteam')
+                index_payloads = [{'team': record} for record in changes.upserts]
+                delete_payloads = [{'id': team_id} for team_id in changes.deletes]
+
+            headers = _auth_headers()
+            client = http_client.get_async_client()
+            limiter = AdaptiveConcurrencyLimiter(settings.UPLOAD_CONCURRENCY)
+
+            logger.info(f"Starting delta upload to the Glean API. Run ID: {upload_id}")
+
+            requests_to_send = [(index_url, payload) for payload in index_payloads] + [(delete_url, payload) for payload in delete_payloads]
+            responses = await pipeline.gather_or_cancel(*(
+                _send_request_async(client, url, headers, _dumps(payload), limiter, settings.UPLOAD_MAX_RETRIES, settings.UPLOAD_GZIP)
+                for url, payload in requests_to_send))
+            for response in responses:
+                _check_page_response(response, warnings)
+            metrics.get_metrics().add(f'{DataType(type).value}_records_uploaded', len(changes.upserts))
+            metrics.get_metrics().add(f'{DataType(type).value}_records_deleted', len(changes.deletes))
+
+            if process:
+                wait_time = await _schedule_processing_async(client, headers)
+
+    except httpx.HTTPStatusError as e:
+        raise _upload_http_error(e)
+
+    except Exception as e:
+        raise Exception(f"An error occurred uploading data to Glean API: {e}")
+
+    if full_upload:
+        # Staged records are uploaded from the staging file, as they were already serialized
+        result = await bulk_upload_entities_async(data if isinstance(data, staging.StagedRecords) else records, type=type, process=process)
+    else:
+        if changes:
+            logger.info(f"Delta uploaded successfully to Glean API. Records indexed: {len(changes.upserts)}, records deleted: {len(changes.deletes)}")
+            if wait_time:
+                logger.info(f"Please allow {wait_time} for the data to be visible in the Glean app.")
+        else:
+            logger.info("No changes to upload to Glean API.")
+        result = UploadResult(
+            success=True,
+            records_uploaded=len(changes.upserts),
+            upload_id=upload_id,
+            warnings=warnings,
+            timestamp=datetime.now(),
+            records_deleted=len(changes.deletes)
+        )
+
+    # Only record the state once the upload has succeeded, so that failed changes are retried on the next run
     try:
-        if not data:
-            raise ValueError(f"No data to write to {mode} CSV.")
-
-        flattened_data = []
-        for item in data:
-            flattened_item = {}
-            for key, value in item.items():
-                if key == 'teams' and mode == 'people':
-                    continue
-                if isinstance(value, dict):
-                    for sub_key, sub_value in value.items():
-                        flattened_item[f'{sub_key}'] = sub_value
-                elif isinstance(value, list) and key == 'members':
-                    flattened_item[key] = ','.join([member['email'] for member in value])
-                else:
-                    flattened_item[key] = value
-            flattened_data.append(flattened_item)
+        await asyncio.to_thread(delta.save_state, settings.DELTA_SYNC_STATE_FILE, type, current_state)
+    except OSError as e:
+        # The upload itself succeeded. Sending the same changes again on the next run is harmless.
+        logger.warning(f"Could not save sync state file '{settings.DELTA_SYNC_STATE_FILE}' ({e}). The next run will send these changes again.")
+    return result
 
-        fieldnames = flattened_data[0].keys()
+def delta_upload_entities(data: Iterable[dict[str, Any]], type: Literal['people', 'teams'] = 'people', process: bool = True) -> UploadResult:
+    """Upload only the people/teams that have changed since the last successful sync. Blocking version of delta_upload_entities_async."""
+    return http_client.run(delta_upload_entities_async(data, type=type, process=process))
+
+async def schedule_processing_async() -> str:
+    """Request immediate processing of all data uploaded to the Glean API and return how long it will take to be visible."""
+    try:
+        return await _schedule_processing_async(http_client.get_async_client(), _auth_headers())
+    except Exception as e:
+        raise Exception(f"An error occurred scheduling processing of uploaded data: {e}")
+
+def schedule_processing() -> str:
+    """Request immediate processing of all uploaded data. Blocking version of schedule_processing_async."""
+    return http_client.run(schedule_processing_async())
+
+async def upload_people_and_teams_async(people: list[dict[str, Any]], teams: list[dict[str, Any]], delta_sync: bool = False) -> tuple[UploadResult, UploadResult]:
+    """
+    Upload people and teams data to the Glean Indexing API at the same time, then request processing of both at once.
+
+    Both uploads run concurrently on the event loop (with their own upload IDs, checkpoints and delta state), so the
+    total time is that of the slower upload. If either upload fails, the other is cancelled and processing is not
+    requested. Processing is not requested either if neither upload indexed or deleted any records (e.g. a delta sync
+    with no changes).
+    """
+    upload = delta_upload_entities_async if delta_sync else bulk_upload_entities_async
+    people_result, teams_result = await pipeline.gather_or_cancel(
+        upload(people, type=DataType.PEOPLE.value, process=False),
+        upload(teams, type=DataType.TEAMS.value, process=False)
+    )
+
+    if not any(result.records_uploaded or result.records_deleted for result in (people_result, teams_result)):
+        logger.info("Nothing was indexed or deleted, so processing of uploaded data was not requested.")
+        return people_result, teams_result
+
+    wait_time = await schedule_processing_async()
+    logger.info(f"Please allow {wait_time} for the data to be visible in the Glean app.")
+    return people_result, teams_result
+
+def upload_people_and_teams(people: list[dict[str, Any]], teams: list[dict[str, Any]], delta_sync: bool = False) -> tuple[UploadResult, UploadResult]:
+    """Upload people and teams data at the same time, then request processing of both. Blocking version of upload_people_and_teams_async."""
+    return http_client.run(upload_people_and_teams_async(people, teams, delta_sync=delta_sync))
+
+def csv_columns(mapping: TransformPlan, mode: str) -> list[str]:
+    """
+    Return the CSV columns for people or teams data, derived from the mapping so that they are known before any record.
+
+    Structured fields (e.g. structuredLocation) are split into a column per sub-field, and each social network and
+    additional field gets a column of its own.
+    """
+    if mode == 'teams':
+        return ['id', 'name', *(key for key, _ in mapping.team_extra_fields), 'members']
+
+    columns = []
+    for api_key, _ in mapping.fields:
+        customer_key = mapping.mapping.get(api_key)
+        if api_key == 'teams':
+            continue
+        elif isinstance(customer_key, dict):
+            columns.extend(customer_key.keys())
+        else:
+            columns.append(api_key)
+    columns.append('status')
+    columns.extend(f"{network_name}Url" for network_name, _, _ in mapping.social_networks)
+    columns.extend(mapping.additional_fields)
+    # An additional field may have the same name as a Glean field, so keep each column once
+    return list(dict.fromkeys(columns))
+
+def _csv_row(item: dict[str, Any], mode: str) -> dict[str, Any]:
+    """Flatten a transformed people/teams record into a CSV row."""
+    row = {}
+    for key, value in item.items():
+        if key == 'teams' and mode == 'people':
+            continue
+        if isinstance(value, Mapping):
+            row.update(value)
+        elif key == 'members':
+            row[key] = ','.join(member['email'] for member in value)
+        elif key == 'additionalFields':
+            for field in value:
+                row[field['key']] = ','.join(field['value'])
+        elif key == 'socialNetworks':
+            for profile in value:
+                row[f"{profile['name']}Url"] = profile['profileUrl']
+        elif isinstance(value, list):
+            row[key] = json.dumps(value, default=to_builtin)
+        else:
+            row[key] = value
+    return row
+
+def create_csv(data: Iterable[dict[str, Any]], output_file: str, mode: str, mapping: Optional[TransformPlan] = None,
+               compress: bool = False) -> int:
+    """
+    Create a CSV file containing people or teams data, and return the number of rows written.
+
+    The data can be a list or any iterable (e.g. a generator of transformed records). Rows are written as they are
+    read, so only one record is held in memory at a time. The columns are derived from the mapping if it is given, and
+    otherwise from the first record. If compress is set, the file is gzip-compressed.
+    """
+    try:
+        records = iter(data)
+        if mapping:
+            fieldnames = csv_columns(mapping, mode)
+        else:
+            first = next(records, None)
+            if first is None:
+                raise ValueError(f"No data to write to {mode} CSV.")
+            fieldnames = list(_csv_row(first, mode).keys())
+            records = chain([first], records)
+
+        count = 0
+        # The file only replaces the previous export once all records are written, so a run with no data (or one that
+        # fails part way) leaves the previous export in place
+        with files.atomic_write(output_file, 'wb') as f:
+            binary = gzip.GzipFile(filename=output_file, mode='wb', fileobj=f) if compress else f
+            with io.TextIOWrapper(binary, encoding='utf-8', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                for item in records:
+                    writer.writerow(_csv_row(item, mode))
+                    count += 1
+
+                if not count:
+                    raise ValueError(f"No data to write to {mode} CSV.")
+        metrics.get_metrics().add(f'{mode}_rows_exported', count)
 
-        print(f"\n\nFlattened data: {json.dumps(flattened_data)}")
-        print(f"\n\nField names: {fieldnames}")
-        
-        # with open(output_file, 'w', newline='') as csvfile:
-        #     writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        #     writer.writeheader()
-        #     for item in flattened_data:
-        #         writer.writerow(item)
-    
     except ValueError as e:
         raise ValueError(f"Error writing {mode} data to CSV: {e}")
     except Exception as e:
         raise Exception(f"An error occurred writing {mode} data to CSV: {e}")
     else:
-        logger.info(f"{mode.capitalize()} data written to {output_file} successfully.")
-        return True
\ No newline at end of file
+        logger.info(f"{mode.capitalize()} data written to {output_file} successfully. Rows written: {count}")
+        return count
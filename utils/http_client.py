@@ -0,0 +1,80 @@
+from typing import Any, Awaitable, Optional, TypeVar
+import asyncio
+import http.cookiejar
+import logging
+import threading
+import weakref
+from utils.config import get_settings
+from utils.lazy import lazy_import
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO level, which would log each uploaded page twice
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+httpx = lazy_import('httpx')
+
+T = TypeVar('T')
+
+# Event loop kept open between warm runs (see run_warm)
+_warm_runner: Optional[asyncio.Runner] = None
+_warm_lock = threading.Lock()
+
+# One client per event loop, as an httpx.AsyncClient (and its connections) cannot be used from another loop
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]' = weakref.WeakKeyDictionary()
+
+def get_async_client() -> 'httpx.AsyncClient':
+    """
+    Return the async HTTP client shared by all requests to Workday and Glean made from the running event loop.
+
+    Unless the client was opened with other limits (see open_async_client), connections are kept alive between
+    requests for HTTP_KEEPALIVE_EXPIRY seconds, and at most HTTP_MAX_CONNECTIONS are open at a time (requests beyond
+    that wait for a free connection).
+    """
+    client = _clients.get(asyncio.get_running_loop())
+    if client is None or client.is_closed:
+        settings = get_settings()
+        client = open_async_client(settings.HTTP_MAX_CONNECTIONS, settings.HTTP_KEEPALIVE_EXPIRY)
+    return client
+
+def open_async_client(max_connections: int, keepalive_expiry: float) -> 'httpx.AsyncClient':
+    """Open the shared HTTP client of the running event loop with the given limits (e.g. for several sync jobs)."""
+    limits = httpx.Limits(
+        max_connections=max(1, max_connections),
+        max_keepalive_connections=max(1, max_connections),
+        keepalive_expiry=keepalive_expiry
+    )
+    # Cookies are not kept, as the client is shared by sync jobs and runs with different credentials
+    cookies = http.cookiejar.CookieJar(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    # No timeout and following redirects, as with the requests library
+    client = _clients[asyncio.get_running_loop()] = httpx.AsyncClient(limits=limits, cookies=cookies, timeout=None, follow_redirects=True)
+    return client
+
+async def close_async_client():
+    """Close the HTTP client of the running event loop and its connections. Call before the loop is closed."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def run(coroutine: Awaitable[T]) -> T:
+    """Run a coroutine in a new event loop (e.g. from the sync API), closing the loop's HTTP client when it is done."""
+    async def run_and_close() -> Any:
+        try:
+            return await coroutine
+        finally:
+            await close_async_client()
+
+    return asyncio.run(run_and_close())
+
+def run_warm(coroutine: Awaitable[T]) -> T:
+    """
+    As run, but on an event loop that is kept open for later warm runs (e.g. later invocations of a serverless function
+    in the same instance), so that they reuse its HTTP client and idle connections rather than opening new ones.
+
+    Warm runs from several threads run one at a time.
+    """
+    global _warm_runner
+    with _warm_lock:
+        if _warm_runner is None:
+            _warm_runner = asyncio.Runner()
+        return _warm_runner.run(coroutine)
@@ -0,0 +1,21 @@
+from types import ModuleType
+from typing import Any
+import importlib
+
+class _LazyModule(ModuleType):
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes not copied from the module yet. Importing is thread-safe (the import system
+        # locks each module while it is imported), so threads that first use the module at the same time are fine.
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Return a stand-in for a module that imports it when one of its attributes is first used.
+
+    Heavy dependencies that only some runs need (e.g. requests, which is only used by STREAMING_MODE and
+    REPORT_CACHE_FILE) are imported this way, so they don't add to the start-up time of every run. Annotations that
+    refer to a lazily imported module must be quoted, or defining them imports it.
+    """
+    return _LazyModule(name)
@@ -0,0 +1,181 @@
+from typing import Any, Iterator, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from utils import files, profiling
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = 'workday_glean_sync'
+
+class RunMetrics:
+    """
+    Metrics of a single sync run: the time spent in each stage, counters (e.g. bytes fetched, upload retries) and
+    timings of individual requests (e.g. the latency of each uploaded page).
+
+    All methods are thread-safe, as the pipeline and parallel upload modes record metrics from several threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.counters: dict[str, float] = {}
+        self.timings: dict[str, list[float]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage of the run (and profile it, if the run is profiled). A stage that is entered more than once
+        accumulates its time. The time of a stage entered within another one (e.g. serializing each page of an upload)
+        is left out of the enclosing stage, so that stages do not overlap.
+        """
+        enclosing = _nested_seconds.get()
+        nested = [0.0]
+        token = _nested_seconds.set(nested)
+        start = time.perf_counter()
+        try:
+            with profiling.stage(name):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _nested_seconds.reset(token)
+            with self._lock:
+                # Nested stages of concurrent tasks can overlap each other, so their total may exceed the stage's own time
+                own = max(0.0, elapsed - nested[0])
+                self.stages[name] = self.stages.get(name, 0.0) + own
+                if enclosing is not None:
+                    enclosing[0] += elapsed
+            profiling.record_time(name, own)
+
+    def add(self, name: str, value: float = 1):
+        """Add to a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Record a single observation of a timing or size (e.g. the latency of one request)."""
+        with self._lock:
+            self.timings.setdefault(name, []).append(value)
+
+    def summary(self, status: str, data_type: Optional[str] = None) -> dict[str, Any]:
+        """Return the run summary as a JSON-serializable dict."""
+        with self._lock:
+            duration = time.perf_counter() - self._start
+            summary = {
+                'status': status,
+                'data_type': data_type,
+                'started_at': self.started_at.isoformat(),
+                'duration_seconds': round(duration, 3),
+                'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                'counters': dict(self.counters),
+                'timings': {name: _summarize(values) for name, values in self.timings.items()},
+                'peak_rss_bytes': peak_rss_bytes(),
+            }
+
+        transform_seconds = summary['stages'].get('transform')
+        records = self.counters.get('records_transformed')
+        if transform_seconds and records:
+            summary['transform_records_per_second'] = round(records / transform_seconds, 1)
+        return summary
+
+def _summarize(values: list[float]) -> dict[str, float]:
+    ordered = sorted(values)
+    def quantile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+    return {
+        'count': len(ordered),
+        'sum': round(sum(ordered), 6),
+        'min': round(ordered[0], 6),
+        'p50': round(quantile(0.5), 6),
+        'p95': round(quantile(0.95), 6),
+        'max': round(ordered[-1], 6),
+    }
+
+def peak_rss_bytes() -> Optional[int]:
+    """Return the peak resident set size of the process in bytes, or None if it cannot be determined."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Time spent in the stages entered within the current stage, if any (see RunMetrics.stage)
+_nested_seconds: ContextVar[Optional[list[float]]] = ContextVar('nested_stage_seconds', default=None)
+# Metrics of the run in the current context, so that sync jobs running in the same process each have their own
+# counters and stage timings (see reset_metrics)
+_metrics: ContextVar[Optional[RunMetrics]] = ContextVar('run_metrics', default=None)
+
+def get_metrics() -> RunMetrics:
+    """Return the metrics of the current run, starting them if no run has been started in the current context."""
+    run_metrics = _metrics.get()
+    if run_metrics is None:
+        run_metrics = reset_metrics()
+    return run_metrics
+
+def reset_metrics() -> RunMetrics:
+    """Start recording the metrics of a new run (in the current thread or asyncio task, and those it starts)."""
+    run_metrics = RunMetrics()
+    _metrics.set(run_metrics)
+    return run_metrics
+
+def _write_atomic(file_path: str, content: str):
+    # A reader (e.g. the Prometheus textfile collector) never sees a partial file
+    with files.atomic_write(file_path) as f:
+        f.write(content)
+
+def write_json(file_path: str, summary: dict[str, Any]):
+    """Write the run summary to a JSON file."""
+    _write_atomic(file_path, json.dumps(summary, indent=2) + '\n')
+
+def to_prometheus(summary: dict[str, Any]) -> str:
+    """Format the run summary in the Prometheus text exposition format (for the node_exporter textfile collector)."""
+    labels = f'data_type="{summary["data_type"]}"' if summary.get('data_type') else ''
+    def metric(name: str, value: Any, help: str, type: str = 'gauge', extra_labels: str = '') -> list[str]:
+        all_labels = ','.join(label for label in (labels, extra_labels) if label)
+        return [f'# HELP {PROMETHEUS_PREFIX}_{name} {help}', f'# TYPE {PROMETHEUS_PREFIX}_{name} {type}',
+                f'{PROMETHEUS_PREFIX}_{name}{{{all_labels}}} {value}']
+
+    lines = []
+    lines += metric('success', int(summary['status'] == 'success'), 'Whether the last sync run succeeded.')
+    lines += metric('last_run_timestamp_seconds', int(datetime.fromisoformat(summary['started_at']).timestamp()), 'Start time of the last sync run.')
+    lines += metric('duration_seconds', summary['duration_seconds'], 'Duration of the last sync run.')
+    if summary.get('peak_rss_bytes') is not None:
+        lines += metric('peak_rss_bytes', summary['peak_rss_bytes'], 'Peak resident set size of the last sync run.')
+
+    if summary['stages']:
+        lines += [f'# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent in each stage of the last sync run.',
+                  f'# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge']
+        for stage, seconds in summary['stages'].items():
+            stage_labels = ','.join(label for label in (labels, f'stage="{stage}"') if label)
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{{stage_labels}}} {seconds}')
+
+    for name, value in summary['counters'].items():
+        lines += metric(name, value, f'Value of {name} in the last sync run.')
+
+    for name, timing in summary['timings'].items():
+        lines += [f'# HELP {PROMETHEUS_PREFIX}_{name} Distribution of {name} in the last sync run.',
+                  f'# TYPE {PROMETHEUS_PREFIX}_{name} summary']
+        for key, quantile in (('p50', '0.5'), ('p95', '0.95')):
+            quantile_labels = ','.join(label for label in (labels, f'quantile="{quantile}"') if label)
+            lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{quantile_labels}}} {timing[key]}')
+        lines.append(f'{PROMETHEUS_PREFIX}_{name}_sum{{{labels}}} {timing["sum"]}')
+        lines.append(f'{PROMETHEUS_PREFIX}_{name}_count{{{labels}}} {timing["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(file_path: str, summary: dict[str, Any]):
+    """Write the run summary to a file in the Prometheus text exposition format."""
+    _write_atomic(file_path, to_prometheus(summary))
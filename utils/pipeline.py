@@ -0,0 +1,82 @@
+from typing import Any, Awaitable, Iterable, Iterator, TypeVar
+from itertools import islice
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+from utils import profiling
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_DONE = object()
+
+class _StageError:
+    """Wraps an exception raised by a background stage so it can be re-raised by the consumer."""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def threaded(iterable: Iterable[T], maxsize: int, name: str = 'pipeline-stage') -> Iterator[T]:
+    """
+    Consume an iterable in a background thread, yielding its items through a bounded queue.
+
+    The background thread runs at most maxsize items ahead of the consumer, so the stages on either side of the queue
+    overlap without the amount of buffered data growing. Exceptions raised by the iterable are re-raised by the
+    consumer. If the consumer stops early, the background thread is stopped as well.
+    """
+    items: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        # Wait for room in the queue, giving up if the consumer has gone away
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_StageError(e))
+
+    # The thread runs in a copy of the current context, so it sees the settings and metrics of the sync job running it.
+    # If the run is profiled, the thread is profiled as a stage of its own.
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(profiling.profiled(produce, name),), name=name, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Yield lists of up to size items from an iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+async def gather_or_cancel(*aws: Awaitable[T]) -> list[T]:
+    """As asyncio.gather, but if any awaitable fails, the others are cancelled before the error is raised."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,235 @@
+from typing import Any, Mapping, Optional
+from dataclasses import dataclass, field
+import logging
+from utils.config import PreflightAction
+from utils import metrics, quarantine
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+# Number of problems logged individually (all of them are written to QUARANTINE_FILE)
+MAX_LOGGED_PROBLEMS = 20
+# Number of people of a manager cycle named in its description, so that descriptions of long cycles stay short
+MAX_DESCRIBED_CYCLE_MEMBERS = 10
+
+@dataclass
+class Problem:
+    """A problem found in a transformed person by the pre-flight checks."""
+    check: str
+    index: int
+    key: Optional[str]
+    message: str
+
+@dataclass
+class PreflightReport:
+    """All problems found in a set of transformed people, in the order in which the people were transformed."""
+    records: int
+    problems: list[Problem] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.problems)
+
+    def offending(self) -> set[int]:
+        """Return the positions of the people with at least one problem."""
+        return {problem.index for problem in self.problems}
+
+    def counts(self) -> dict[str, int]:
+        """Return the number of problems found by each check."""
+        counts = {}
+        for problem in self.problems:
+            counts[problem.check] = counts.get(problem.check, 0) + 1
+        return counts
+
+    def summary(self) -> str:
+        counts = ', '.join(f"{count} {check.replace('_', ' ')}" for check, count in self.counts().items())
+        return f"{len(self.problems)} problems in {len(self.offending())} of {self.records} people ({counts})"
+
+# States of a person while the manager hierarchy is walked
+_UNVISITED, _VISITING, _VALID, _INVALID = range(4)
+
+def _normalize_email(email: Any) -> Optional[str]:
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+def check_people(people: list[Mapping[str, Any]]) -> PreflightReport:
+    """
+    Check the identities and manager hierarchy of a set of transformed people before they are uploaded.
+
+    Finds people with no email, people whose email or id is already used by an earlier person, people whose manager
+    is not one of the people, manager cycles, and people whose chain of managers leads to one of those problems
+    (orphan chains), so that they would no longer have a valid manager if it was dropped. A chain also leads to a
+    problem if it reaches a person with an identity problem (e.g. a duplicate id). Emails are compared
+    case-insensitively. A person who is their own manager is treated as the top of the hierarchy.
+
+    Each person and each link to a manager is visited once, so the checks take linear time.
+    """
+    report = PreflightReport(len(people))
+    problems = report.problems
+    # Description of the problem that makes each invalid person invalid. People with the same cause share the same
+    # description and message strings, so that long cycles and chains take memory in proportion to their length.
+    causes: dict[int, str] = {}
+
+    # Identities: the first person with an email or id keeps it
+    emails: dict[str, int] = {}
+    ids: dict[str, int] = {}
+    # First person with each email, including people with identity problems, so that the reports of a manager with an
+    # identity problem are not taken for reports of a manager who is not one of the people
+    all_emails: dict[str, int] = {}
+    valid_identity = [False] * len(people)
+    for index, person in enumerate(people):
+        email = _normalize_email(person.get('email'))
+        person_id = person.get('id')
+        person_id = str(person_id) if person_id not in (None, '') else None
+        key = email or person_id
+        valid = True
+        if email is None:
+            problems.append(Problem('missing_email', index, key, "Person has no email."))
+            valid = False
+        elif email in emails:
+            problems.append(Problem('duplicate_email', index, key, f"Email is already used by the person at position {emails[email]}."))
+            causes[index] = f"{key} has a duplicate email"
+            valid = False
+        if person_id is not None:
+            if person_id in ids:
+                problems.append(Problem('duplicate_id', index, key, f"Id '{person_id}' is already used by the person at position {ids[person_id]}."))
+                causes.setdefault(index, f"{key} has a duplicate id ({person_id})")
+                valid = False
+            else:
+                ids[person_id] = index
+        if email is not None:
+            all_emails.setdefault(email, index)
+        if valid:
+            emails[email] = index
+            valid_identity[index] = True
+
+    # Manager of each person with a valid identity: its position, None at the top of the hierarchy, or -1 if unknown.
+    # The manager is the person with a valid identity who has the email, or else the first person with the email.
+    managers: list[Optional[int]] = [None] * len(people)
+    for index, person in enumerate(people):
+        if valid_identity[index]:
+            manager_email = _normalize_email(person.get('managerEmail'))
+            manager = emails.get(manager_email, all_emails.get(manager_email, -1)) if manager_email else None
+            managers[index] = None if manager == index else manager
+
+    # Walk up the hierarchy from each person, stopping at the first person whose outcome is already known, so that
+    # each person is walked through once. A person is invalid if their chain of managers does not reach the top, and
+    # people with an identity problem are invalid from the start.
+    state = [_UNVISITED if valid else _INVALID for valid in valid_identity]
+    orphan_messages: dict[int, str] = {}
+    for start in range(len(people)):
+        if state[start] != _UNVISITED:
+            continue
+
+        path = []
+        node = start
+        while True:
+            state[node] = _VISITING
+            path.append(node)
+            manager = managers[node]
+            if manager is None:
+                outcome = _VALID
+                break
+            if manager == -1:
+                email = people[node].get('email')
+                manager_email = people[node].get('managerEmail')
+                problems.append(Problem('unknown_manager', node, email, f"Manager '{manager_email}' is not one of the people."))
+                causes[node] = f"{email} has an unknown manager ({manager_email})"
+                outcome = _INVALID
+                break
+            if state[manager] == _VISITING:
+                cycle = path[path.index(manager):]
+                description = _describe_cycle(people, cycle)
+                message = f"Manager cycle: {description}."
+                cause = f"manager cycle {description}"
+                for member in cycle:
+                    problems.append(Problem('manager_cycle', member, people[member].get('email'), message))
+                    causes[member] = cause
+                outcome = _INVALID
+                break
+            if state[manager] != _UNVISITED:
+                outcome = state[manager]
+                break
+            node = manager
+
+        # Everyone on the path shares the outcome of the person where the walk stopped
+        cause = causes.get(path[-1]) or causes.get(manager)
+        message = None
+        if outcome == _INVALID:
+            message = orphan_messages.get(id(cause))
+            if message is None:
+                message = orphan_messages[id(cause)] = f"Chain of managers leads to a problem: {cause}."
+        for node in path:
+            state[node] = outcome
+            if outcome == _INVALID and node not in causes:
+                causes[node] = cause
+                problems.append(Problem('orphan_chain', node, people[node].get('email'), message))
+
+    problems.sort(key=lambda problem: problem.index)
+    return report
+
+def _describe_cycle(people: list[Mapping[str, Any]], cycle: list[int]) -> str:
+    """Describe a manager cycle by the emails of its people, naming at most MAX_DESCRIBED_CYCLE_MEMBERS of them."""
+    emails = [str(people[member].get('email')) for member in cycle[:MAX_DESCRIBED_CYCLE_MEMBERS]]
+    if len(cycle) > MAX_DESCRIBED_CYCLE_MEMBERS:
+        return ' -> '.join(emails) + f" -> ... ({len(cycle)} people)"
+    return ' -> '.join(emails + [emails[0]])
+
+def log_report(report: PreflightReport):
+    """Log a summary of the problems found, and the first MAX_LOGGED_PROBLEMS of them."""
+    if not report:
+        logger.info(f"Pre-flight checks passed for {report.records} people.")
+        return
+    logger.warning(f"Pre-flight checks found {report.summary()}.")
+    for problem in report.problems[:MAX_LOGGED_PROBLEMS]:
+        logger.warning(f" - {problem.key} (position {problem.index}): {problem.message}")
+    if len(report.problems) > MAX_LOGGED_PROBLEMS:
+        logger.warning(f" - ... and {len(report.problems) - MAX_LOGGED_PROBLEMS} more.")
+
+def quarantine_entries(report: PreflightReport, people: list[Mapping[str, Any]]) -> list[dict[str, Any]]:
+    """Return the quarantine entry of each person with problems (see quarantine.entry)."""
+    problems_by_person: dict[int, list[Problem]] = {}
+    for problem in report.problems:
+        problems_by_person.setdefault(problem.index, []).append(problem)
+    return [quarantine.entry('people', people[index], ((problem.check, problem.message) for problem in person_problems), position=index)
+            for index, person_problems in problems_by_person.items()]
+
+def drop_offending(report: PreflightReport, people: list[Mapping[str, Any]],
+                   teams: Optional[list[Mapping[str, Any]]] = None) -> list[Mapping[str, Any]]:
+    """
+    Return the people without problems. The people that are dropped are also removed from the members of the teams,
+    unless another person kept has the same email.
+    """
+    offending = report.offending()
+    kept = [person for index, person in enumerate(people) if index not in offending]
+    if teams:
+        kept_emails = {_normalize_email(person.get('email')) for person in kept}
+        dropped_emails = {_normalize_email(people[index].get('email')) for index in offending} - kept_emails
+        if dropped_emails:
+            for team in teams:
+                members = team['members']
+                members[:] = [member for member in members if _normalize_email(member.get('email')) not in dropped_emails]
+    return kept
+
+def run_checks(people: list[Mapping[str, Any]], action: PreflightAction, quarantined: Optional[list[dict[str, Any]]] = None,
+               teams: Optional[list[Mapping[str, Any]]] = None) -> list[Mapping[str, Any]]:
+    """
+    Check the transformed people (see check_people) and log the problems found. The quarantine entries of the people
+    with problems are added to quarantined, if given. Depending on the action, the people are then returned unchanged (REPORT), a
+    ValueError is raised if there are any problems (FAIL), or the people with problems are dropped (DROP, see
+    drop_offending).
+    """
+    report = check_people(people)
+    log_report(report)
+    metrics.get_metrics().add('preflight_problems', len(report.problems))
+    if not report:
+        return people
+
+    if quarantined is not None:
+        quarantined.extend(quarantine_entries(report, people))
+    if action == PreflightAction.FAIL:
+        raise ValueError(f"Pre-flight checks found {report.summary()}. Nothing was uploaded.")
+    if action == PreflightAction.DROP:
+        kept = drop_offending(report, people, teams)
+        logger.warning(f"Dropped {len(people) - len(kept)} people with problems. {len(kept)} people remain.")
+        metrics.get_metrics().add('people_dropped', len(people) - len(kept))
+        return kept
+    return people
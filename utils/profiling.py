@@ -0,0 +1,208 @@
+from typing import Any, Callable, Iterator, Optional, TypeVar
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class Profiler:
+    """
+    Profiles each stage of a run (see metrics.RunMetrics.stage) while it is active (see start): the CPU time spent in
+    each function with cProfile, and the memory allocated with tracemalloc.
+
+    A stage is profiled in the thread that enters it and in the threads it hands work to with asyncio.to_thread (see
+    ProfilingExecutor) or pipeline.threaded. When stages overlap in the same thread (e.g. concurrent uploads on the
+    event loop), the time is counted in the stage entered first.
+
+    The following files are written to the directory for each stage:
+    - {stage}.prof: the CPU profile, in the pstats format (e.g. python -m pstats, snakeviz)
+    - {stage}.tracemalloc: the memory held when the stage first ended, by the line that allocated it, as a
+      tracemalloc snapshot (see tracemalloc.Snapshot.load)
+    and profile.json summarizes them: the time of each stage, not including the stages entered within it (see
+    metrics.RunMetrics.stage), and the peak memory traced while it ran (by the whole process, so including nested and
+    concurrent stages).
+
+    Snapshots are only taken once per stage, as they take a second or more for large reports. Use profiling for
+    diagnosis only: tracing every allocation makes the run several times slower.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles: dict[str, list[cProfile.Profile]] = {}
+        self._summary: dict[str, dict[str, Any]] = {}
+        # Number of runs of each stage in progress
+        self._active: dict[str, int] = {}
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile a stage, from the current thread and the threads it hands work to."""
+        first_run = self._begin(name)
+        token = _stage.set(name)
+        try:
+            with self.profile_thread(name):
+                yield
+        finally:
+            _stage.reset(token)
+            self._end(name)
+            if first_run:
+                tracemalloc.take_snapshot().dump(os.path.join(self.directory, f'{name}.tracemalloc'))
+
+    @contextmanager
+    def profile_thread(self, name: str) -> Iterator[None]:
+        """Profile the current thread as part of a stage, unless it is already profiled for another stage."""
+        active = getattr(self._local, 'active', None)
+        if active is not None and active[0] != name:
+            # cProfile profiles one stage at a time in each thread, so the time is counted in the active stage
+            yield
+            return
+
+        if active is None:
+            profile = self._thread_profile(name)
+            active = self._local.active = [name, profile, 0]
+            profile.enable()
+        # Overlapping runs of the stage in this thread (e.g. concurrent tasks) share its profile until the last one ends
+        active[2] += 1
+        try:
+            yield
+        finally:
+            active[2] -= 1
+            if active[2] == 0:
+                active[1].disable()
+                self._local.active = None
+
+    def _thread_profile(self, name: str) -> cProfile.Profile:
+        # Each thread has its own profile of each stage, as a profile can only be used by one thread at a time
+        profiles = getattr(self._local, 'profiles', None)
+        if profiles is None:
+            profiles = self._local.profiles = {}
+        profile = profiles.get(name)
+        if profile is None:
+            profile = profiles[name] = cProfile.Profile()
+            with self._lock:
+                self._profiles.setdefault(name, []).append(profile)
+        return profile
+
+    def profiled(self, name: str, function: Callable[..., T]) -> Callable[..., T]:
+        """Return a version of a function that profiles the thread it runs in as part of a stage."""
+        @functools.wraps(function)
+        def run(*args: Any, **kwargs: Any) -> T:
+            with self.profile_thread(name):
+                return function(*args, **kwargs)
+        return run
+
+    def _begin(self, name: str) -> bool:
+        with self._lock:
+            self._record_peak()
+            self._active[name] = self._active.get(name, 0) + 1
+            if name in self._summary:
+                return False
+            self._summary[name] = {'runs': 0, 'seconds': 0.0, 'peak_traced_bytes': 0}
+            return True
+
+    def _end(self, name: str):
+        with self._lock:
+            self._record_peak()
+            self._active[name] -= 1
+            if not self._active[name]:
+                del self._active[name]
+            self._summary[name]['runs'] += 1
+
+    def _record_peak(self):
+        # tracemalloc only keeps the peak of the whole process. It is recorded for every stage in progress before it
+        # is reset when a stage starts or ends, so each stage keeps its own peak while other stages start and end.
+        peak = tracemalloc.get_traced_memory()[1]
+        for name in self._active:
+            summary = self._summary[name]
+            summary['peak_traced_bytes'] = max(summary['peak_traced_bytes'], peak)
+        tracemalloc.reset_peak()
+
+    def add_time(self, name: str, seconds: float):
+        """Add to the time of a stage (as timed by metrics.RunMetrics.stage)."""
+        with self._lock:
+            if name in self._summary:
+                self._summary[name]['seconds'] += seconds
+
+    def stop(self):
+        """Stop tracing memory and write the profile of each stage."""
+        tracemalloc.stop()
+        summary = {}
+        for name, stage_summary in self._summary.items():
+            stats = None
+            for profile in self._profiles.get(name, []):
+                # A profile that recorded nothing (e.g. a thread that only waited) cannot be loaded into Stats
+                try:
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                except TypeError:
+                    continue
+            if stats is not None:
+                stats.dump_stats(os.path.join(self.directory, f'{name}.prof'))
+            summary[name] = {
+                'runs': stage_summary['runs'],
+                'seconds': round(stage_summary['seconds'], 3),
+                'peak_traced_bytes': stage_summary['peak_traced_bytes'],
+            }
+        with open(os.path.join(self.directory, 'profile.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Wrote the profile of {len(summary)} stages to: {self.directory}")
+
+class ProfilingExecutor(ThreadPoolExecutor):
+    """Thread pool that profiles each call it runs as part of the stage it was submitted from (see Profiler)."""
+    def submit(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> 'Future[T]':
+        profiler = _profiler.get()
+        name = _stage.get()
+        if profiler is not None and name is not None:
+            fn = profiler.profiled(name, fn)
+        return super().submit(fn, *args, **kwargs)
+
+# Profiler of the run in the current context, and the stage being run
+_profiler: ContextVar[Optional[Profiler]] = ContextVar('profiler', default=None)
+_stage: ContextVar[Optional[str]] = ContextVar('profiled_stage', default=None)
+
+@contextmanager
+def profile(directory: str) -> Iterator[Profiler]:
+    """Profile the stages of the run in the current context (see Profiler), writing the profiles to directory."""
+    profiler = Profiler(directory)
+    profiler.start()
+    token = _profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _profiler.reset(token)
+        profiler.stop()
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Profile a stage of the run, if it is profiled."""
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
+
+def record_time(name: str, seconds: float):
+    """Add to the time of a stage of the run, if it is profiled."""
+    profiler = _profiler.get()
+    if profiler is not None:
+        profiler.add_time(name, seconds)
+
+def profiled(function: Callable[..., T], name: str) -> Callable[..., T]:
+    """Return a version of a function that is profiled as part of a stage when run in another thread, if the run is profiled."""
+    profiler = _profiler.get()
+    return function if profiler is None else profiler.profiled(name, function)
@@ -0,0 +1,25 @@
+from typing import Any, Iterable, Mapping, Optional
+import json
+import logging
+from utils import files
+from utils.records import to_builtin_or_str
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+def entry(data_type: str, record: Mapping[str, Any], problems: Iterable[tuple[str, str]], position: Optional[int] = None) -> dict[str, Any]:
+    """Return the quarantine entry of a record with problems: its data type, the problems found (check and message) and the record."""
+    quarantine_entry = {'type': data_type}
+    if position is not None:
+        quarantine_entry['position'] = position
+    quarantine_entry['problems'] = [{'check': check, 'message': message} for check, message in problems]
+    quarantine_entry['record'] = record
+    return quarantine_entry
+
+def write(quarantine_file: str, entries: list[dict[str, Any]]):
+    """Write the quarantine entries of a run to a JSON Lines file (one per line), replacing those of the last run."""
+    with files.atomic_write(quarantine_file) as f:
+        for quarantine_entry in entries:
+            f.write(json.dumps(quarantine_entry, default=to_builtin_or_str) + '\n')
+    if entries:
+        logger.info(f"Wrote {len(entries)} records with problems to: {quarantine_file}")
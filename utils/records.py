@@ -0,0 +1,117 @@
+from typing import Any, Callable, Iterator
+from collections.abc import Mapping
+from dataclasses import make_dataclass
+from functools import lru_cache
+from keyword import iskeyword
+from operator import attrgetter
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+class Record(Mapping):
+    """
+    Compact, read-only representation of a transformed person or team (or of a value nested in one, e.g. a
+    structuredLocation).
+
+    A record behaves like a dict, but stores its values in slots rather than in a per-record hash table, which makes it
+    several times smaller. The keys are shared by all records of a record type (see record_type). Record types are
+    slotted dataclasses, so orjson serializes them natively, with the keys in order. Other serializers (e.g. the json
+    module) convert them to dicts with to_builtin.
+    """
+    __slots__ = ()
+    _keys: tuple[str, ...] = ()
+    _key_set: frozenset[str] = frozenset()
+    _values: Callable[['Record'], tuple[Any, ...]]
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._key_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._key_set else default
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._key_set
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        return repr(to_builtin(self))
+
+    def __reduce__(self):
+        # Record types are created at runtime, so they are pickled (e.g. by the parallel transform) by their keys
+        return _restore, (self._keys, self._values(self))
+
+@lru_cache(maxsize=None)
+def record_type(keys: tuple[str, ...]) -> Callable[..., Mapping[str, Any]]:
+    """
+    Return the record type with the given keys, in the order in which they are serialized. Records are created with
+    their values as positional arguments, e.g. record_type(('key', 'value'))('skills', ['Go']).
+
+    If a key cannot be the name of a slot (e.g. it is not an identifier, or it is the name of a Record method), the
+    returned type creates dicts instead.
+    """
+    if not all(key.isidentifier() and not iskeyword(key) and not key.startswith('_') and not hasattr(Record, key) for key in keys):
+        return dict_type(keys)
+
+    # attrgetter returns a tuple only if it gets more than one attribute
+    if len(keys) == 1:
+        values = staticmethod(lambda record, get=attrgetter(keys[0]): (get(record),))
+    else:
+        values = attrgetter(*keys) if keys else staticmethod(lambda record: ())
+
+    cls = make_dataclass('Record', keys, bases=(Record,), namespace={'__module__': __name__}, slots=True, eq=False, repr=False)
+    cls._keys = keys
+    cls._key_set = frozenset(keys)
+    cls._values = values
+    return cls
+
+def dict_type(keys: tuple[str, ...]) -> Callable[..., dict[str, Any]]:
+    """Return a type that creates plain dicts with the given keys, for use where records are not wanted."""
+    # Generated for the same reason as the constructors of record types: a dict display is much faster than dict(zip())
+    parameters = ', '.join(f'_{i}' for i in range(len(keys)))
+    items = ', '.join(f'{key!r}: _{i}' for i, key in enumerate(keys))
+    return eval(f'lambda {parameters}: {{{items}}}')
+
+def from_dict(item: dict[str, Any]) -> Mapping[str, Any]:
+    """Return a record with the keys and values of a dict."""
+    return record_type(tuple(item))(*item.values())
+
+def _restore(keys: tuple[str, ...], values: tuple[Any, ...]) -> Mapping[str, Any]:
+    return record_type(keys)(*values)
+
+def to_builtin(obj: Any) -> dict[str, Any]:
+    """Convert a record to a dict for serialization. Use as the default hook of json.dumps or orjson.dumps."""
+    if isinstance(obj, Record):
+        return dict(zip(obj._keys, obj._values(obj)))
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def to_builtin_or_str(obj: Any) -> Any:
+    """As to_builtin, but converts any other object that is not JSON serializable to a string (e.g. for hashing)."""
+    return to_builtin(obj) if isinstance(obj, Record) else str(obj)
+
+def interner() -> Callable[[Any], Any]:
+    """
+    Return a function that interns string values shared by many records, e.g. departments, cities and business units.
+
+    Values read from a Workday report are separate string objects, even if many records have the same value. Passing
+    them through the returned function keeps a single copy of each distinct value once the report has been released.
+    Lists of strings are interned item by item, and other values are returned unchanged.
+    """
+    values: dict[str, str] = {}
+    setdefault = values.setdefault
+
+    def intern(value: Any) -> Any:
+        if type(value) is str:
+            return setdefault(value, value)
+        if type(value) is list:
+            return [setdefault(item, item) if type(item) is str else item for item in value]
+        return value
+
+    return intern
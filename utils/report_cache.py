@@ -0,0 +1,49 @@
+from typing import Any, Optional
+from dataclasses import dataclass, asdict
+import hashlib
+import json
+import logging
+from utils import files
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ReportCacheEntry:
+    """The Workday report that was used by the last successful sync of a data type."""
+    url: str
+    mapping_hash: str
+    body_hash: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Where the records were sent (see output_target). Entries saved before it was recorded never match.
+    output_target: Optional[str] = None
+
+    def matches(self, url: str, mapping_hash: str, output_target: str) -> bool:
+        """Return True if the entry is for the same report URL, field mapping and output."""
+        return self.url == url and self.mapping_hash == mapping_hash and self.output_target == output_target
+
+def mapping_hash(mapping: dict[str, Any]) -> str:
+    """Return a hash of the field mapping, so that a changed mapping is never treated as an unchanged report."""
+    return hashlib.sha256(json.dumps(mapping, sort_keys=True).encode('utf-8')).hexdigest()
+
+def output_target(output_type: str, glean_domain: Optional[str]) -> str:
+    """Return where a sync sends its records: 'csv' for CSV files, or the Glean tenant it uploads to."""
+    return 'csv' if output_type == 'csv' else f"api:{glean_domain}"
+
+def load_cache(cache_file: str, data_type: str) -> Optional[ReportCacheEntry]:
+    """Load the report cache entry for a data type, or None if there is none."""
+    entry = files.read_json(cache_file, "report cache file").get(data_type)
+    if not entry:
+        return None
+    try:
+        return ReportCacheEntry(**entry)
+    except TypeError:
+        logger.warning(f"Report cache entry in '{cache_file}' is not valid. Ignoring it.")
+        return None
+
+def save_cache(cache_file: str, data_type: str, entry: ReportCacheEntry):
+    """Save the report cache entry for a data type, keeping the entries of other data types."""
+    entries = files.read_json(cache_file, "report cache file")
+    entries[data_type] = asdict(entry)
+    files.write_json(cache_file, entries)
@@ -0,0 +1,158 @@
+from typing import Any, Iterable, Iterator
+from collections import deque
+from xml.parsers import expat
+import csv
+import io
+
+REPORT_ENTRY_TAG = 'Report_Entry'
+# Separates the name of a group from the name of a field of the group in the header of a CSV report
+CSV_GROUP_SEPARATOR = '/'
+
+class ChunkStream(io.RawIOBase):
+    """Read-only binary stream over an iterable of byte chunks (e.g. a streamed HTTP response)."""
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b'')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        # The current chunk is read from an offset rather than sliced, as a whole report may be a single chunk
+        while self._position >= len(self._pending):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+            self._position = 0
+        size = min(len(buffer), len(self._pending) - self._position)
+        buffer[:size] = self._pending[self._position:self._position + size]
+        self._position += size
+        return size
+
+def parse_csv_entries(chunks: Iterable[bytes]) -> Iterator[dict[str, Any]]:
+    """
+    Incrementally parse a Workday Report in CSV format and yield the Report_Entry items, one per row.
+
+    The header row names the fields. Empty cells are left out, as in the JSON format. A column named group/field holds
+    a field of a group that can occur several times per worker (e.g. workerTeams/teamID): each line of the cell is the
+    field of one instance of the group, so the group is read as a list of dicts (e.g. [{'teamID': ...}, ...]), as in
+    the JSON format. Any other cell with several lines holds a field with several values (e.g. additional fields), and
+    is read as a list of its lines, as the XML format reads a field that occurs several times.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(ChunkStream(chunks), io.DEFAULT_BUFFER_SIZE * 8), encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    fields = []
+    groups: dict[str, list[tuple[int, str]]] = {}
+    for column, name in enumerate(header):
+        group, separator, field = name.partition(CSV_GROUP_SEPARATOR)
+        if separator:
+            groups.setdefault(group, []).append((column, field))
+        else:
+            fields.append((column, name))
+    # Rows are usually as long as the header, which lets cells be read without checking each column
+    columns = len(header)
+
+    for row in reader:
+        if not any(row):
+            continue
+        if len(row) < columns:
+            row += [''] * (columns - len(row))
+        entry = {name: _cell_values(value) if '\n' in value else value for column, name in fields if (value := row[column])}
+        for group, group_fields in groups.items():
+            values = [(field, row[column].splitlines()) for column, field in group_fields if row[column]]
+            if values:
+                instances = max(len(lines) for _, lines in values)
+                entry[group] = [{field: lines[i] for field, lines in values if i < len(lines) and lines[i]}
+                                for i in range(instances)]
+        yield entry
+
+def _cell_values(cell: str) -> Any:
+    # The values of a field with several values, one per line of its cell, leaving out empty lines
+    values = [line for line in cell.splitlines() if line]
+    return values if len(values) > 1 else ''.join(values)
+
+def parse_xml_entries(chunks: Iterable[bytes]) -> Iterator[dict[str, Any]]:
+    """
+    Incrementally parse a Workday Report in XML format and yield the Report_Entry items.
+
+    Both the simple XML format (format=simplexml) and the default, namespaced Workday XML format are read. Each field
+    element becomes a key named after the element (without its namespace). A field that occurs several times is read as
+    a list of its values, and a group (an element with fields of its own, e.g. workerTeams) as a list of dicts, as in
+    the JSON format. Reference fields are read as their Descriptor attribute, as in the JSON format. Empty fields are
+    left out. Only the Report_Entry items parsed from the current chunk are held in memory.
+    """
+    # Entries are built directly from the parser events rather than from an element tree, which is about twice as fast
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.buffer_text = True
+    # Local name of each element name (namespace}name) seen
+    names: dict[str, str] = {}
+    # Elements open in the current Report_Entry: [name, fields (None until it has any), text, descriptor]
+    stack: list[list[Any]] = []
+    entries: deque[dict[str, Any]] = deque()
+
+    def start(name: str, attributes: dict[str, str]):
+        local = names.get(name)
+        if local is None:
+            local = names[name] = name.rpartition('}')[2]
+        if not stack and local != REPORT_ENTRY_TAG:
+            return
+        descriptor = None
+        for key, value in attributes.items():
+            # Reference fields (e.g. a worker type) are described by a Descriptor attribute in the default XML format
+            if key.rpartition('}')[2] == 'Descriptor':
+                descriptor = value
+        stack.append([local, None, '', descriptor])
+
+    def character_data(data: str):
+        if stack:
+            stack[-1][2] += data
+
+    def end(name: str):
+        if not stack:
+            return
+        local, fields, text, descriptor = stack.pop()
+        if not stack:
+            entries.append(fields or {})
+            return
+        value = descriptor if descriptor is not None else fields if fields is not None else text
+        if not value:
+            return
+
+        parent = stack[-1]
+        parent_fields = parent[1]
+        if parent_fields is None:
+            parent_fields = parent[1] = {}
+        if isinstance(value, dict):
+            # A group is a list of dicts, however many times it occurs
+            group = parent_fields.get(local)
+            if group is None:
+                parent_fields[local] = [value]
+            else:
+                group.append(value)
+        elif local in parent_fields:
+            # A field that occurs several times is a list of its values
+            values = parent_fields[local]
+            if isinstance(values, list):
+                values.append(value)
+            else:
+                parent_fields[local] = [values, value]
+        else:
+            parent_fields[local] = value
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = character_data
+
+    for chunk in chunks:
+        parser.Parse(chunk, False)
+        while entries:
+            yield entries.popleft()
+    parser.Parse(b'', True)
+    while entries:
+        yield entries.popleft()
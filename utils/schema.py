@@ -0,0 +1,140 @@
+from typing import Any, Callable
+from collections.abc import Mapping
+import re
+
+# Schemas of the people and teams accepted by the Glean Indexing API, as far as the connector sets them. Fields that
+# are not listed are not checked, and fields that are not required may be null.
+STRING = {'type': 'string'}
+DATE = {'type': 'date'}
+STRING_LIST = {'type': 'list', 'items': STRING}
+ADDITIONAL_FIELDS = {'type': 'list', 'items': {'type': 'object', 'fields': {
+    'key': {'type': 'string', 'required': True},
+    'value': STRING_LIST,
+}}}
+
+EMPLOYEE_SCHEMA = {'type': 'object', 'fields': {
+    'email': {'type': 'string', 'required': True},
+    'id': STRING,
+    'firstName': STRING,
+    'lastName': STRING,
+    'preferredName': STRING,
+    'pronoun': STRING,
+    'title': STRING,
+    'department': STRING,
+    'businessUnit': STRING,
+    'managerEmail': STRING,
+    'managerId': STRING,
+    'phoneNumber': STRING,
+    'bio': STRING,
+    'photoUrl': STRING,
+    'profileUrl': STRING,
+    'startDate': DATE,
+    'endDate': DATE,
+    'type': {'type': 'enum', 'values': ('FULL_TIME', 'CONTRACTOR', 'NON_EMPLOYEE')},
+    'status': {'type': 'enum', 'values': ('CURRENT', 'FUTURE', 'EX')},
+    'structuredLocation': {'type': 'object', 'fields': {key: STRING for key in (
+        'address', 'city', 'state', 'country', 'region', 'zipCode', 'timezone', 'deskLocation', 'countryCode')}},
+    'teams': {'type': 'list', 'items': {'type': 'object', 'fields': {'id': STRING, 'name': STRING, 'url': STRING}}},
+    'socialNetworks': {'type': 'list', 'items': {'type': 'object', 'fields': {
+        'name': {'type': 'string', 'required': True},
+        'profileName': STRING,
+        'profileUrl': {'type': 'string', 'required': True},
+    }}},
+    'additionalFields': ADDITIONAL_FIELDS,
+}}
+
+TEAM_SCHEMA = {'type': 'object', 'fields': {
+    'id': {'type': 'string', 'required': True},
+    'name': {'type': 'string', 'required': True},
+    'members': {'type': 'list', 'items': {'type': 'object', 'fields': {'email': {'type': 'string', 'required': True}}}},
+    'additionalFields': ADDITIONAL_FIELDS,
+}}
+
+_DATE_PATTERN = re.compile(r'\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])')
+
+# A check appends a message to the list of errors for each problem with a value
+Check = Callable[[Any, list[str]], None]
+
+def _describe(value: Any) -> str:
+    text = repr(value)
+    return f"{type(value).__name__} {text if len(text) <= 40 else text[:37] + '...'}"
+
+def _compile(spec: dict[str, Any], path: str) -> Check:
+    kind = spec['type']
+    if kind == 'string':
+        def check(value: Any, errors: list[str]):
+            if not isinstance(value, str):
+                errors.append(f"{path}: expected a string, got {_describe(value)}")
+    elif kind == 'date':
+        fullmatch = _DATE_PATTERN.fullmatch
+        def check(value: Any, errors: list[str]):
+            if not isinstance(value, str) or not fullmatch(value):
+                errors.append(f"{path}: expected a date (YYYY-MM-DD), got {_describe(value)}")
+    elif kind == 'enum':
+        values = frozenset(spec['values'])
+        expected = ', '.join(spec['values'])
+        def check(value: Any, errors: list[str]):
+            if value not in values:
+                errors.append(f"{path}: expected one of {expected}, got {_describe(value)}")
+    elif kind == 'list' and spec['items'] == STRING:
+        def check(value: Any, errors: list[str]):
+            if not isinstance(value, list):
+                errors.append(f"{path}: expected a list, got {_describe(value)}")
+                return
+            for item in value:
+                if not isinstance(item, str):
+                    errors.append(f"{path}[]: expected a string, got {_describe(item)}")
+    elif kind == 'list':
+        check_item = _compile(spec['items'], f"{path}[]")
+        def check(value: Any, errors: list[str]):
+            if not isinstance(value, list):
+                errors.append(f"{path}: expected a list, got {_describe(value)}")
+                return
+            for item in value:
+                check_item(item, errors)
+    elif kind == 'object':
+        # Optional string fields (most of them) are checked inline, as calling a check for each of them costs more
+        # than the check itself
+        string_fields = tuple(key for key, field in spec['fields'].items() if field == STRING)
+        fields = tuple((key, field.get('required', False), _compile(field, f"{path}.{key}" if path else key))
+                       for key, field in spec['fields'].items() if field != STRING)
+        def check(value: Any, errors: list[str]):
+            # Most records are dicts, which are checked for first as it is much faster than checking for a Mapping
+            if not isinstance(value, (dict, Mapping)):
+                errors.append(f"{path}: expected an object, got {_describe(value)}")
+                return
+            get = value.get
+            for key in string_fields:
+                field_value = get(key)
+                if field_value is not None and not isinstance(field_value, str):
+                    errors.append(f"{path}.{key}: expected a string, got {_describe(field_value)}" if path else
+                                  f"{key}: expected a string, got {_describe(field_value)}")
+            for key, required, check_field in fields:
+                field_value = get(key)
+                if field_value is None:
+                    if required:
+                        errors.append(f"{path}.{key}: missing" if path else f"{key}: missing")
+                else:
+                    check_field(field_value, errors)
+    else:
+        raise ValueError(f"Unknown schema type '{kind}'.")
+    return check
+
+def compile_schema(schema: dict[str, Any]) -> Callable[[Mapping[str, Any]], list[str]]:
+    """
+    Compile a schema (e.g. EMPLOYEE_SCHEMA) into a function that returns the problems with a record, or an empty list
+    if it is valid.
+
+    The schema is walked once here, so validating a record only runs the checks of the fields it has values for.
+    """
+    check = _compile(schema, '')
+
+    def validate(record: Mapping[str, Any]) -> list[str]:
+        errors = []
+        check(record, errors)
+        return errors
+
+    return validate
+
+validate_employee = compile_schema(EMPLOYEE_SCHEMA)
+validate_team = compile_schema(TEAM_SCHEMA)
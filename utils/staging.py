@@ -0,0 +1,109 @@
+from typing import Any, Iterable, Iterator, Optional
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import os
+from utils import files
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StagingManifest:
+    """Summary of the records staged for a data type, written once all of them are on disk."""
+    data_type: str
+    records: int
+    bytes: int
+    data_hash: str
+    staged_at: str
+    upload_id: Optional[str] = None
+    uploaded_at: Optional[str] = None
+
+class StagedRecords:
+    """
+    Transformed people or teams staged on disk (see write), in the order in which they were transformed.
+
+    Each record is stored on its own line of a JSON Lines file, serialized exactly as it is sent to the Glean API, so
+    uploads read pages of records from the file without serializing them again (see iter_serialized), and the file
+    shows what was sent. Iterating yields the records as dicts, e.g. for delta sync.
+    """
+    def __init__(self, data_file: str, manifest: StagingManifest):
+        self.data_file = data_file
+        self.manifest = manifest
+
+    @property
+    def data_hash(self) -> str:
+        return self.manifest.data_hash
+
+    def __len__(self) -> int:
+        return self.manifest.records
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return map(json.loads, self.iter_serialized())
+
+    def iter_serialized(self) -> Iterator[bytes]:
+        """Yield the serialized records, reading the file sequentially."""
+        with open(self.data_file, 'rb') as f:
+            for line in f:
+                yield line[:-1]
+
+def _paths(staging_dir: str, data_type: str) -> tuple[str, str]:
+    return os.path.join(staging_dir, f'{data_type}.jsonl'), os.path.join(staging_dir, f'{data_type}.manifest.json')
+
+def _write_manifest(manifest_file: str, manifest: StagingManifest):
+    files.write_json(manifest_file, asdict(manifest), indent=2)
+
+def write(staging_dir: str, data_type: str, records: Iterable[bytes]) -> StagedRecords:
+    """
+    Stage serialized records of a data type in staging_dir, replacing any records staged before, and return them.
+
+    Records are appended to the file as they arrive, so a stream of records is staged without holding it in memory.
+    The manifest is only written once every record is on disk, so records staged by an interrupted run are never
+    mistaken for complete ones.
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    data_file, manifest_file = _paths(staging_dir, data_type)
+    # The previous records stop being valid as soon as they start being replaced
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    digest = hashlib.blake2b(digest_size=16)
+    count = 0
+    size = 0
+    with files.atomic_write(data_file, 'wb') as f:
+        for record in records:
+            line = record + b'\n'
+            f.write(line)
+            digest.update(line)
+            count += 1
+            size += len(line)
+
+    manifest = StagingManifest(data_type, count, size, digest.hexdigest(), datetime.now(timezone.utc).isoformat())
+    _write_manifest(manifest_file, manifest)
+    logger.info(f"Staged {count} {data_type} records ({size / (1024 * 1024):.1f} MiB) in: {data_file}")
+    return StagedRecords(data_file, manifest)
+
+def load(staging_dir: str, data_type: str) -> StagedRecords:
+    """Return the records of a data type staged by an earlier run. Raises ValueError if none were staged completely."""
+    data_file, manifest_file = _paths(staging_dir, data_type)
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = StagingManifest(**json.load(f))
+        size = os.path.getsize(data_file)
+    except FileNotFoundError:
+        raise ValueError(f"No staged {data_type} records found in '{staging_dir}'. Run a sync with STAGING_DIR set first.")
+    except (OSError, ValueError, TypeError) as e:
+        raise ValueError(f"Could not read the staged {data_type} records in '{staging_dir}': {e}")
+
+    if size != manifest.bytes:
+        raise ValueError(f"Staged {data_type} records in '{data_file}' do not match their manifest ({size} bytes, expected {manifest.bytes}).")
+    logger.info(f"Loaded {manifest.records} {data_type} records staged at {manifest.staged_at} from: {data_file}")
+    return StagedRecords(data_file, manifest)
+
+def mark_uploaded(staged: StagedRecords, upload_id: Optional[str]):
+    """Record in the manifest that the staged records have been uploaded to Glean, and with which upload ID."""
+    staged.manifest.upload_id = upload_id
+    staged.manifest.uploaded_at = datetime.now(timezone.utc).isoformat()
+    _write_manifest(_paths(os.path.dirname(staged.data_file), staged.manifest.data_type)[1], staged.manifest)
@@ -1,168 +1,915 @@
-from typing import Any
+from typing import IO, Any, Callable, Iterable, Iterator, Optional, Union
+from collections import deque
+from itertools import chain
+from operator import methodcaller
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import asyncio
+import codecs
+import hashlib
+import http.cookiejar
+import json
 import logging
-import requests
+import multiprocessing
+import random
+import tempfile
 import time
-from utils.config import get_settings, AuthType
+from utils.config import get_settings, AuthType, ReportDownload, ReportFormat, TransformPlan
+from utils import http_client, metrics, pipeline, quarantine, report_formats
+from utils.lazy import lazy_import
+from utils.records import dict_type, from_dict, interner, record_type
+from utils.schema import validate_employee, validate_team
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s %(asctime)s: %(message)s', datefmt='%b %d %H:%M:%S %Z')
 logger = logging.getLogger(__name__)
 
-def get_report_data() -> dict[str, Any]:
-    """Fetch and return data from the Workday Report."""
-    try:
-        settings = get_settings()
-
-        if settings.WORKDAY_AUTH_TYPE == AuthType.BASIC:
-            response = requests.get(
-                settings.WORKDAY_REPORT_URL, 
-                auth=(settings.WORKDAY_USERNAME, settings.WORKDAY_PASSWORD.get_secret_value())
-            )
-        else:  # Bearer authentication
-            response = requests.get(
-                settings.WORKDAY_REPORT_URL, 
-                headers={'Authorization': f'Bearer {settings.WORKDAY_API_KEY.get_secret_value()}'}
-            )
-        
-        response.raise_for_status()
-        return response.json()
+httpx = lazy_import('httpx')
+requests = lazy_import('requests')
+
+REPORT_ENTRY_KEY = 'Report_Entry'
+STREAM_CHUNK_SIZE = 64 * 1024
+# Downloaded reports larger than this are spooled to a temporary file on disk rather than kept in memory
+DOWNLOAD_SPOOL_SIZE = 16 * 1024 * 1024
+
+SOCIAL_NETWORK_PROFILE_NAMES = {'linkedin': 'LinkedIn', 'whatsapp': 'WhatsApp', 'imessage': 'iMessage'}
+
+_json_decoder = json.JSONDecoder()
+
+# Reports smaller than this are always transformed in-process, as starting a process pool would take longer
+PARALLEL_TRANSFORM_MIN_RECORDS = 20000
+# Number of records sent to a worker process at a time
+PARALLEL_TRANSFORM_CHUNK_SIZE = 2000
+
+# Fields whose values are (nearly) unique to each person, so they are not worth interning
+UNIQUE_FIELDS = {'id', 'email', 'preferredName', 'bio', 'phoneNumber', 'photoUrl', 'profileUrl'}
+
+# Value of the format query parameter of the Workday Report URL for each report format
+REPORT_FORMAT_PARAMS = {ReportFormat.JSON: 'json', ReportFormat.CSV: 'csv', ReportFormat.XML: 'simplexml'}
+
+# Status codes on which a report shard is fetched again
+SHARD_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Session used for blocking report downloads, kept for later runs in the same process so that they reuse its connections
+_session: Optional['requests.Session'] = None
+
+def _get_session() -> 'requests.Session':
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        # Only connections are reused: cookies set by one run (or sync job) must not be sent with the requests of another
+        _session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    return _session
+
+def report_url(url: Optional[str] = None) -> str:
+    """Return the URL of the Workday Report (or of one shard of it) with its format parameter set to WORKDAY_REPORT_FORMAT."""
+    settings = get_settings()
+    url = str(url or settings.WORKDAY_REPORT_URL)
+    report_format = REPORT_FORMAT_PARAMS[settings.WORKDAY_REPORT_FORMAT]
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if dict(query).get('format') == report_format:
+        return url
+    query = [(key, value) for key, value in query if key != 'format'] + [('format', report_format)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def _request_headers(headers: Optional[dict[str, str]]) -> dict[str, str]:
+    headers = dict(headers or {})
+    # Both HTTP clients ask for a compressed response (gzip) by default, and decompress it as it is read
+    if not get_settings().WORKDAY_COMPRESSION:
+        headers['Accept-Encoding'] = 'identity'
+    return headers
+
+def _request_report(stream: bool = False, headers: Optional[dict[str, str]] = None, url: Optional[str] = None) -> 'requests.Response':
+    """Send the request for the Workday Report (or one shard of it) and return the response."""
+    settings = get_settings()
+    headers = _request_headers(headers)
+    url = report_url(url)
+
+    if settings.WORKDAY_AUTH_TYPE == AuthType.BASIC:
+        response = _get_session().get(
+            url, 
+            auth=(settings.WORKDAY_USERNAME, settings.WORKDAY_PASSWORD.get_secret_value()),
+            headers=headers,
+            stream=stream
+        )
+    else:  # Bearer authentication
+        headers['Authorization'] = f'Bearer {settings.WORKDAY_API_KEY.get_secret_value()}'
+        response = _get_session().get(
+            url, 
+            headers=headers,
+            stream=stream
+        )
     
-    except requests.HTTPError as e:
-        error_msgs = {
-            429: "Workday API rate limit exceeded. Skipping this run.",
-            500: "The Workday endpoint is currently unavailable. Please try again later.",
-            501: "The Workday endpoint is currently unavailable. Please try again later.",
-            503: "The Workday endpoint is currently unavailable. Please try again later.",
-            400: "Invalid request. Please check the request data and try again.",
-            401: "Unauthorized request. Please check that the credentials or API key used are valid and try again."
-        }
-        error_msg = error_msgs.get(e.response.status_code, str(e.response.text))
-        logger.debug(f"Workday API response ({e.response.status_code}): {e.response.text}")
-        raise Exception(f"Fetching the Workday data failed (HTTP {e.response.status_code}): {error_msg}")
+    response.raise_for_status()
+    # Time until the response headers were received, i.e. how long Workday took to run the report
+    metrics.get_metrics().observe('workday_request_seconds', response.elapsed.total_seconds())
+    return response
+
+async def _request_report_async(client: 'httpx.AsyncClient', stream: bool = False, headers: Optional[dict[str, str]] = None,
+                                url: Optional[str] = None) -> 'httpx.Response':
+    """As _request_report, but sent with the shared async HTTP client. A streamed response must be closed with aclose()."""
+    settings = get_settings()
+    headers = _request_headers(headers)
+    url = report_url(url)
+    auth = None
+
+    if settings.WORKDAY_AUTH_TYPE == AuthType.BASIC:
+        auth = (settings.WORKDAY_USERNAME, settings.WORKDAY_PASSWORD.get_secret_value())
+    else:  # Bearer authentication
+        headers['Authorization'] = f'Bearer {settings.WORKDAY_API_KEY.get_secret_value()}'
+
+    started = time.perf_counter()
+    response = await client.send(client.build_request('GET', url, headers=headers), auth=auth, stream=True)
+    # Time until the response headers were received, i.e. how long Workday took to run the report
+    metrics.get_metrics().observe('workday_request_seconds', time.perf_counter() - started)
+
+    # The body of an error response is read for the error message
+    if not stream or response.is_error:
+        await response.aread()
+    response.raise_for_status()
+    return response
+
+def _report_http_error(e: Union['requests.HTTPError', 'httpx.HTTPStatusError']) -> Exception:
+    """Build the exception raised when the Workday Report request fails."""
+    error_msgs = {
+        429: "Workday API rate limit exceeded. Skipping this run.",
+        500: "The Workday endpoint is currently unavailable. Please try again later.",
+        501: "The Workday endpoint is currently unavailable. Please try again later.",
+        503: "The Workday endpoint is currently unavailable. Please try again later.",
+        400: "Invalid request. Please check the request data and try again.",
+        401: "Unauthorized request. Please check that the credentials or API key used are valid and try again."
+    }
+    error_msg = error_msgs.get(e.response.status_code, str(e.response.text))
+    logger.debug(f"Workday API response ({e.response.status_code}): {e.response.text}")
+    return Exception(f"Fetching the Workday data failed (HTTP {e.response.status_code}): {error_msg}")
+
+def _shard_urls() -> dict[str, str]:
+    """Return the URL of each shard of the Workday Report (by prompt value), or an empty dict if it is not sharded."""
+    settings = get_settings()
+    if not settings.WORKDAY_REPORT_SHARD_PROMPT or not settings.WORKDAY_REPORT_SHARD_VALUES:
+        return {}
+
+    url = urlsplit(str(settings.WORKDAY_REPORT_URL))
+    query = [(key, value) for key, value in parse_qsl(url.query, keep_blank_values=True)
+             if key != settings.WORKDAY_REPORT_SHARD_PROMPT]
+    values = [value.strip() for value in settings.WORKDAY_REPORT_SHARD_VALUES.split(',') if value.strip()]
+    return {value: urlunsplit(url._replace(query=urlencode(query + [(settings.WORKDAY_REPORT_SHARD_PROMPT, value)])))
+            for value in values}
+
+def _download(url: Optional[str] = None, headers: Optional[dict[str, str]] = None) -> ReportDownload:
+    """Download the report from a URL to a spooled temporary file, hashing the body as it is received."""
+    with _request_report(stream=True, headers=headers, url=url) as response:
+        if response.status_code == 304:
+            return ReportDownload(body=None, body_hash=None, etag=None, last_modified=None)
+
+        digest = hashlib.sha256()
+        body = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+            body.write(chunk)
+        _record_transfer(body.tell(), response.raw.tell())
+        body.seek(0)
+
+        return ReportDownload(
+            body=body,
+            body_hash=digest.hexdigest(),
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            report_format=get_settings().WORKDAY_REPORT_FORMAT
+        )
+
+async def _download_async(client: 'httpx.AsyncClient', url: str) -> ReportDownload:
+    """As _download (without conditional requests), but sent with the shared async HTTP client."""
+    response = await _request_report_async(client, stream=True, url=url)
+    try:
+        digest = hashlib.sha256()
+        body = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+        async for chunk in response.aiter_bytes(chunk_size=STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+            body.write(chunk)
+        _record_transfer(body.tell(), response.num_bytes_downloaded)
+        body.seek(0)
+
+        return ReportDownload(
+            body=body,
+            body_hash=digest.hexdigest(),
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            report_format=get_settings().WORKDAY_REPORT_FORMAT
+        )
+    finally:
+        await response.aclose()
+
+async def _download_shard_async(client: 'httpx.AsyncClient', prompt_value: str, url: str) -> ReportDownload:
+    """Download a single shard of the Workday Report, retrying it on its own if Workday throttles or fails it."""
+    max_retries = get_settings().WORKDAY_SHARD_MAX_RETRIES
+    for attempt in range(1, max_retries + 2):
+        try:
+            return await _download_async(client, url)
+        except (httpx.HTTPStatusError, httpx.TransportError) as e:
+            status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            if attempt > max_retries or (status_code is not None and status_code not in SHARD_RETRY_STATUS_CODES):
+                raise
+            delay = min(60, 2 ** attempt) * random.uniform(0.5, 1.0)
+            reason = f"HTTP {status_code}" if status_code else "a connection error"
+            logger.warning(f"Fetching Workday report shard '{prompt_value}' failed with {reason}. Retrying in {delay:.1f}s (retry {attempt}/{max_retries}).")
+            await asyncio.sleep(delay)
+
+async def _download_shards_async() -> list[ReportDownload]:
+    """Download all shards of the Workday Report concurrently, in the order the prompt values are configured."""
+    settings = get_settings()
+    shard_urls = _shard_urls()
+    logger.info(f"Fetching {len(shard_urls)} Workday report shards by '{settings.WORKDAY_REPORT_SHARD_PROMPT}', up to {settings.WORKDAY_SHARD_CONCURRENCY} at a time.")
+
+    client = http_client.get_async_client()
+    semaphore = asyncio.Semaphore(max(1, settings.WORKDAY_SHARD_CONCURRENCY))
+
+    async def download_shard(value: str, url: str) -> ReportDownload:
+        async with semaphore:
+            return await _download_shard_async(client, value, url)
+
+    tasks = {value: asyncio.create_task(download_shard(value, url)) for value, url in shard_urls.items()}
+    try:
+        downloads = []
+        for value, task in tasks.items():
+            try:
+                downloads.append(await task)
+            except httpx.HTTPStatusError:
+                raise
+            except Exception as e:
+                raise Exception(f"Fetching Workday report shard '{value}' failed: {e}")
+        return downloads
+    finally:
+        # If a shard failed, stop fetching the others
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+def _download_shards() -> list[ReportDownload]:
+    """Download all shards of the Workday Report concurrently (see _download_shards_async)."""
+    return http_client.run(_download_shards_async())
+
+def _iter_shard_entries(downloads: list[ReportDownload], dedupe_key: Optional[str]) -> Iterator[dict[str, Any]]:
+    """Yield the Report_Entry items of each shard in turn, skipping workers already seen in an earlier shard."""
+    seen = set()
+    duplicates = 0
+    for download in downloads:
+        for entry in read_report_entries(download.body, download.report_format):
+            entry_id = entry.get(dedupe_key) if dedupe_key else None
+            if entry_id is not None:
+                if entry_id in seen:
+                    duplicates += 1
+                    continue
+                seen.add(entry_id)
+            yield entry
+    if duplicates:
+        logger.info(f"Skipped {duplicates} duplicate workers that appeared in more than one report shard.")
+
+async def get_report_data_async(dedupe_key: Optional[str] = None) -> dict[str, Any]:
+    """
+    Fetch and return data from the Workday Report, from an event loop.
+
+    The report is fetched with the shared async HTTP client (see http_client.get_async_client) and parsed in a thread,
+    so the event loop is never blocked. If the report is sharded by a prompt (WORKDAY_REPORT_SHARD_PROMPT), the shards
+    are fetched concurrently and merged into a single Report_Entry list, skipping duplicate workers by the dedupe_key
+    field (the mapped 'id' field).
+    """
+    try:
+        run_metrics = metrics.get_metrics()
+        if _shard_urls():
+            with run_metrics.stage('fetch'):
+                downloads = await _download_shards_async()
+            with run_metrics.stage('parse'):
+                entries = await asyncio.to_thread(lambda: list(_iter_shard_entries(downloads, dedupe_key)))
+                return {REPORT_ENTRY_KEY: entries}
+
+        with run_metrics.stage('fetch'):
+            response = await _request_report_async(http_client.get_async_client())
+            _record_transfer(len(response.content), response.num_bytes_downloaded)
+        with run_metrics.stage('parse'):
+            report_format = get_settings().WORKDAY_REPORT_FORMAT
+            if report_format == ReportFormat.JSON:
+                return await asyncio.to_thread(response.json)
+            entries = await asyncio.to_thread(lambda: list(parse_report_entries([response.content], report_format)))
+            return {REPORT_ENTRY_KEY: entries}
+
+    except httpx.HTTPStatusError as e:
+        raise _report_http_error(e)
 
     except Exception as e:
         raise Exception(f"An error occurred fetching the Workday report: {e}")
-    
-def transform_teams(input_data: list[dict[str, Any]], mapping: dict[str, Any]) -> list[dict[str, Any]]:
-    """Transform and return teams data."""
-    teams = {}
-    team_field = mapping['teams'][0]['__sourceField']
-    team_name_key = mapping['teams'][0]['name']
-    team_id_key = mapping['teams'][0]['id']
-    email_key = mapping['email']
-
-    for item in input_data:
-        email = item.get(email_key)
-        for team in item.get(team_field, []):
-            team_id = team.get(team_id_key)
-            if team_id:
-                if team_id not in teams:
-                    teams[team_id] = {
-                        'id': team_id,
-                        'name': team.get(team_name_key),
-                        'members': []
-                    }
-                    for key, value in mapping['teams'][0].items():
-                        if not key.startswith('__') and key not in ['id', 'name']:
-                            teams[team_id][key] = team.get(value)
-                
-                teams[team_id]['members'].append(dict(email=email))
-
-    return list(teams.values())
-
-def transform_people(input_data: list[dict[str, Any]], mapping: dict[str, Any]) -> list[dict[str, Any]]:
-    """Transform and return people data."""
-    transformed_data = []
-    all_additional_fields = set()
-    
-    # First pass: collect all additional fields
-    for item in input_data:
-        for field in mapping.get('additionalFields', []):
-            if field in item:
-                all_additional_fields.add(field)
-    
-    for item in input_data:
-        transformed_item = {}
-        social_networks = []
-        additional_fields = []
-
-        for api_key, customer_key in mapping.items():
-            if api_key == 'additionalFields':
-                continue  # We'll handle this separately
-            elif api_key.endswith('Url') and api_key not in ['photoUrl', 'profileUrl']:
-                process_social_network(api_key, customer_key, item, social_networks)
-            elif isinstance(customer_key, dict):
-                transformed_item[api_key] = process_structured_field(item, customer_key)
-            elif isinstance(customer_key, list):
-                transformed_item[api_key] = process_list_field(item, customer_key)
+
+def get_report_data(dedupe_key: Optional[str] = None) -> dict[str, Any]:
+    """Fetch and return data from the Workday Report. Blocking version of get_report_data_async."""
+    return http_client.run(get_report_data_async(dedupe_key))
+
+def stream_report_data(prefetch_chunks: int = 0, dedupe_key: Optional[str] = None) -> Iterator[dict[str, Any]]:
+    """
+    Fetch the Workday Report and yield each Report_Entry item as it is received.
+
+    If prefetch_chunks is set, the report is downloaded in a background thread that runs up to that many chunks ahead
+    of the parser, so that the download continues while earlier records are being processed.
+
+    If the report is sharded, all shards are downloaded concurrently to spooled temporary files first, and their items
+    are then yielded in turn with duplicate workers skipped.
+    """
+    try:
+        if _shard_urls():
+            yield from _iter_shard_entries(_download_shards(), dedupe_key)
+            return
+
+        with _request_report(stream=True) as response:
+            chunks = _count_bytes(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), response.raw.tell)
+            if prefetch_chunks:
+                chunks = pipeline.threaded(chunks, prefetch_chunks, name='workday-fetch')
+            yield from parse_report_entries(chunks, get_settings().WORKDAY_REPORT_FORMAT)
+
+    except (requests.HTTPError, httpx.HTTPStatusError) as e:
+        raise _report_http_error(e)
+
+    except Exception as e:
+        raise Exception(f"An error occurred fetching the Workday report: {e}")
+
+def _count_bytes(chunks: Iterable[bytes], transferred: Callable[[], int]) -> Iterator[bytes]:
+    """
+    Pass chunks of a streamed report through, adding their size to the bytes fetched from Workday once they have all
+    been read. transferred returns the number of bytes received so far (before decompression).
+    """
+    fetched = 0
+    try:
+        for chunk in chunks:
+            fetched += len(chunk)
+            yield chunk
+    finally:
+        _record_transfer(fetched, transferred())
+
+def _record_transfer(fetched: int, transferred: int):
+    """Add the size of a downloaded report to the run metrics, both decompressed (fetched) and as received (transferred)."""
+    run_metrics = metrics.get_metrics()
+    run_metrics.add('workday_bytes_fetched', fetched)
+    run_metrics.add('workday_bytes_transferred', transferred)
+
+def download_report(etag: Optional[str] = None, last_modified: Optional[str] = None, dedupe_key: Optional[str] = None) -> ReportDownload:
+    """
+    Download the Workday Report, hashing the body as it is received.
+
+    If the ETag or Last-Modified value from a previous download is given, a conditional request is made and no body is
+    returned if Workday responds that the report has not been modified. The body is spooled to a temporary file once
+    it grows beyond DOWNLOAD_SPOOL_SIZE, so large reports are not held in memory.
+
+    If the report is sharded, the shards are fetched concurrently and merged into a single report body. Conditional
+    requests are not used for sharded reports, but an unchanged report still has an unchanged hash.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        if _shard_urls():
+            with metrics.get_metrics().stage('fetch'):
+                return _merge_shards(_download_shards(), dedupe_key)
+
+        with metrics.get_metrics().stage('fetch'):
+            download = _download(headers=headers)
+        if download.not_modified:
+            return ReportDownload(body=None, body_hash=None, etag=etag, last_modified=last_modified)
+        return download
+
+    except (requests.HTTPError, httpx.HTTPStatusError) as e:
+        raise _report_http_error(e)
+
+    except Exception as e:
+        raise Exception(f"An error occurred fetching the Workday report: {e}")
+
+def _merge_shards(downloads: list[ReportDownload], dedupe_key: Optional[str]) -> ReportDownload:
+    """Merge downloaded report shards (in any report format) into a single report body in the JSON Workday Report format."""
+    digest = hashlib.sha256()
+    body = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+
+    def write(data: bytes):
+        digest.update(data)
+        body.write(data)
+
+    write(b'{"' + REPORT_ENTRY_KEY.encode('utf-8') + b'":[')
+    for i, entry in enumerate(_iter_shard_entries(downloads, dedupe_key)):
+        write((',' if i else '').encode('utf-8') + json.dumps(entry, separators=(',', ':')).encode('utf-8'))
+    write(b']}')
+    body.seek(0)
+
+    return ReportDownload(body=body, body_hash=digest.hexdigest(), etag=None, last_modified=None)
+
+def load_report_file(file_path: str) -> Iterator[dict[str, Any]]:
+    """Yield each Report_Entry item from a local file in the Workday Report format."""
+    with open(file_path, 'rb') as f:
+        yield from read_report_entries(f)
+
+def read_report_entries(f: IO[bytes], report_format: ReportFormat = ReportFormat.JSON) -> Iterator[dict[str, Any]]:
+    """Yield each Report_Entry item from an open binary file in the Workday Report format."""
+    return parse_report_entries(iter(lambda: f.read(STREAM_CHUNK_SIZE), b''), report_format)
+
+def read_report(f: IO[bytes], report_format: ReportFormat = ReportFormat.JSON) -> list[dict[str, Any]]:
+    """Return all Report_Entry items from an open binary file in the Workday Report format."""
+    if report_format == ReportFormat.JSON:
+        # Parsing the whole document at once is faster than parsing it incrementally
+        return json.load(f)[REPORT_ENTRY_KEY]
+    return list(read_report_entries(f, report_format))
+
+def parse_report_entries(chunks: Iterable[bytes], report_format: ReportFormat = ReportFormat.JSON) -> Iterator[dict[str, Any]]:
+    """
+    Incrementally parse a Workday Report (in JSON, or in CSV or XML, see report_formats) and yield the Report_Entry
+    items as dicts, with the same keys and values whatever the format of the report.
+    """
+    if report_format == ReportFormat.CSV:
+        return report_formats.parse_csv_entries(chunks)
+    if report_format == ReportFormat.XML:
+        return report_formats.parse_xml_entries(chunks)
+    return _parse_json_entries(chunks)
+
+def _parse_json_entries(chunks: Iterable[bytes]) -> Iterator[dict[str, Any]]:
+    """
+    Incrementally parse a Workday Report JSON document and yield the Report_Entry items.
+
+    Only a single Report_Entry item (plus the unparsed remainder of the current chunk) is held in memory at any time.
+    Any other top-level keys in the report are parsed and discarded.
+    """
+    chunks = iter(chunks)
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            text = decoder.decode(b'', final=True)
+        else:
+            text = decoder.decode(chunk)
+        buffer = buffer[pos:] + text
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        # Skip whitespace and return the next significant character without consuming it
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                raise ValueError("Unexpected end of Workday report data.")
+
+    def expect(chars: str) -> str:
+        nonlocal pos
+        char = next_char()
+        if char not in chars:
+            raise ValueError(f"Malformed Workday report data: expected one of '{chars}' but found '{char}'.")
+        pos += 1
+        return char
+
+    def decode_value() -> Any:
+        nonlocal pos
+        next_char()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                value, end = None, -1
+            # A value at the very end of the buffer (e.g. a number) may be incomplete until more data is read
+            if end != -1 and (end < len(buffer) or eof):
+                pos = end
+                return value
+            if not fill():
+                raise ValueError("Malformed Workday report data: could not decode JSON.")
+
+    expect('{')
+    if next_char() == '}':
+        return
+    while True:
+        key = decode_value()
+        expect(':')
+        if key == REPORT_ENTRY_KEY:
+            expect('[')
+            if next_char() == ']':
+                pos += 1
             else:
-                transformed_item[api_key] = item.get(customer_key)
+                while True:
+                    yield decode_value()
+                    if expect(',]') == ']':
+                        break
+        else:
+            decode_value()
+        if expect(',}') == '}':
+            return
+
+def compile_mapping(mapping: dict[str, Any], compact: bool = False, validate: bool = False) -> TransformPlan:
+    """
+    Compile the field mapping into a transform plan.
 
-        # Handle additional fields
-        for field in all_additional_fields:
-            value = item.get(field)
-            if value:
-                if not isinstance(value, list):
-                    value = [str(value)]
-                additional_fields.append({
-                    'key': field,
-                    'value': value
-                })
+    All decisions that depend only on the mapping (field kinds, social network names, team attributes) are made here
+    once, so that transforming each record is a straight run through the plan.
 
-        transformed_item['additionalFields'] = additional_fields
+    If compact is set, people and teams are transformed into compact records (see utils.records) rather than dicts,
+    and values shared by many records (e.g. departments and cities) are interned.
 
-        handle_missing_name(transformed_item)
-        process_status(transformed_item)
-        process_type(transformed_item)
+    If validate is set, transformed people and teams are checked against the Glean schemas (see utils.schema), and
+    those that are invalid are left out of the output.
+    """
+    fields = []
+    social_networks = []
+    intern = interner() if compact else None
+    make_type = record_type if compact else dict_type
 
-        if social_networks:
-            transformed_item['socialNetworks'] = social_networks
+    for api_key, customer_key in mapping.items():
+        if api_key == 'additionalFields':
+            continue
+        elif api_key.endswith('Url') and api_key not in ['photoUrl', 'profileUrl']:
+            network_name = api_key[:-3].lower()
+            profile_name = SOCIAL_NETWORK_PROFILE_NAMES.get(network_name, network_name.title())
+            social_networks.append((network_name, profile_name, customer_key))
+        elif isinstance(customer_key, dict):
+            fields.append((api_key, _compile_structured_field(customer_key, intern)))
+        elif isinstance(customer_key, list):
+            fields.append((api_key, _compile_list_field(api_key, customer_key, intern)))
+        elif intern and api_key not in UNIQUE_FIELDS:
+            fields.append((api_key, _compile_interned_field(customer_key, intern)))
+        else:
+            fields.append((api_key, methodcaller('get', customer_key)))
 
-        transformed_data.append(transformed_item)
+    team_source_field = team_id_key = team_name_key = None
+    team_extra_fields = ()
+    if mapping.get('teams'):
+        team_mapping = mapping['teams'][0]
+        team_source_field = team_mapping.get('__sourceField')
+        team_id_key = team_mapping.get('id')
+        team_name_key = team_mapping.get('name')
+        team_extra_fields = tuple((key, value) for key, value in team_mapping.items()
+                                  if not key.startswith('__') and key not in ['id', 'name'])
 
-    return transformed_data
+    team_keys = ('id', 'name', 'members') + tuple(key for key, _ in team_extra_fields)
+
+    return TransformPlan(
+        mapping=mapping,
+        fields=tuple(fields),
+        social_networks=tuple(social_networks),
+        additional_fields=tuple(mapping.get('additionalFields', [])),
+        email_key=mapping.get('email'),
+        team_source_field=team_source_field,
+        team_id_key=team_id_key,
+        team_name_key=team_name_key,
+        team_extra_fields=team_extra_fields,
+        compact=compact,
+        validate=validate,
+        person_type=from_dict if compact else _identity,
+        team_type=make_type(team_keys),
+        team_member_type=make_type(('email',)),
+        additional_field_type=make_type(('key', 'value')),
+        social_network_type=make_type(('name', 'profileName', 'profileUrl')),
+        intern=intern
+    )
+
+def _as_plan(mapping: Union[TransformPlan, dict[str, Any]]) -> TransformPlan:
+    """Return the transform plan for a mapping, compiling it if required."""
+    return mapping if isinstance(mapping, TransformPlan) else compile_mapping(mapping)
+
+def _identity(value: Any) -> Any:
+    return value
+
+def _compile_interned_field(customer_key: str, intern: Callable[[Any], Any]) -> Callable[[dict[str, Any]], Any]:
+    """Return an extractor for a field whose values are shared by many people, e.g. department."""
+    get = methodcaller('get', customer_key)
+
+    def extract(item: dict[str, Any]) -> Any:
+        return intern(get(item))
+
+    return extract
+
+def _compile_structured_field(customer_key: dict[str, str], intern: Optional[Callable[[Any], Any]]) -> Callable[[dict[str, Any]], dict[str, Any]]:
+    """Return an extractor for a structured field, e.g. structuredLocation. Values are interned if intern is given."""
+    if intern:
+        sub_customer_keys = tuple(customer_key.values())
+        structured_type = record_type(tuple(customer_key.keys()))
+
+        def extract(item: dict[str, Any]) -> dict[str, Any]:
+            get = item.get
+            return structured_type(*[intern(get(sub_customer_key)) for sub_customer_key in sub_customer_keys])
+    else:
+        sub_fields = tuple(customer_key.items())
+
+        def extract(item: dict[str, Any]) -> dict[str, Any]:
+            get = item.get
+            return {sub_api_key: get(sub_customer_key) for sub_api_key, sub_customer_key in sub_fields}
+
+    return extract
+
+def _compile_list_field(api_key: str, customer_key: list[dict[str, str]], intern: Optional[Callable[[Any], Any]]) -> Callable[[dict[str, Any]], list[dict[str, Any]]]:
+    """Return an extractor for a list field, e.g. teams. Values are interned if intern is given."""
+    if not customer_key or '__sourceField' not in customer_key[0]:
+        raise ValueError(f"The mapping for list field '{api_key}' must define a '__sourceField'.")
 
-def process_social_network(api_key: str, customer_key: str, item: dict[str, Any], social_networks: list[dict[str, str]]):
-    """Process and add social network data."""
-    network_name = api_key[:-3].lower()
-    profile_name = {'linkedin': 'LinkedIn', 'whatsapp': 'WhatsApp', 'imessage': 'iMessage'}.get(network_name, network_name.title())
-    url = item.get(customer_key)
-    if url:
-        social_networks.append({
-            'name': network_name,
-            'profileName': profile_name,
-            'profileUrl': url
-        })
-
-def process_list_field(item: dict[str, Any], customer_key: list[dict[str, str]]) -> list[dict[str, Any]]:
-    """Process and return list field data."""
     source_field = customer_key[0]['__sourceField']
-    source_list = item.get(source_field, [])
-    if isinstance(source_list, list):
-        return [{sub_api_key: source_item.get(sub_customer_key) 
-                 for sub_api_key, sub_customer_key in customer_key[0].items() 
-                 if not sub_api_key.startswith('__')} 
+    sub_fields = tuple((sub_api_key, sub_customer_key) for sub_api_key, sub_customer_key in customer_key[0].items()
+                       if not sub_api_key.startswith('__'))
+    sub_customer_keys = tuple(sub_customer_key for _, sub_customer_key in sub_fields)
+    item_type = record_type(tuple(sub_api_key for sub_api_key, _ in sub_fields))
+
+    def extract(item: dict[str, Any]) -> list[dict[str, Any]]:
+        source_list = item.get(source_field, [])
+        if not isinstance(source_list, list):
+            return []
+        if intern:
+            return [item_type(*[intern(source_item.get(sub_customer_key)) for sub_customer_key in sub_customer_keys])
+                    for source_item in source_list]
+        return [{sub_api_key: source_item.get(sub_customer_key) for sub_api_key, sub_customer_key in sub_fields}
                 for source_item in source_list]
+
+    return extract
+
+class TeamIndex:
+    """
+    Teams collected from the Workday report, indexed by team ID.
+
+    The attributes of each team are resolved the first time it is seen, and its members are kept by email (in the
+    order they were first seen), so a worker listed more than once (e.g. in several report shards) is only a member
+    of a team once. Memberships of workers with no email are left out and counted. The teams of each worker are
+    indexed as well (see teams_of), when first looked up rather than as the report is read.
+    """
+    def __init__(self, plan: TransformPlan):
+        if not plan.team_source_field:
+            raise ValueError("The mapping does not define a 'teams' field with a '__sourceField'.")
+        self.plan = plan
+        # Team ID -> (name, extra attributes)
+        self._attributes: dict[str, tuple[Any, tuple[Any, ...]]] = {}
+        # Team ID -> member email -> member
+        self._members: dict[str, dict[Any, Any]] = {}
+        # Member email -> team IDs, built from the members when first needed
+        self._worker_teams: Optional[dict[Any, list[str]]] = None
+        self.duplicate_memberships = 0
+        self.memberships_without_email = 0
+
+    def __len__(self) -> int:
+        return len(self._attributes)
+
+    def collect(self, input_data: Iterable[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        """Yield each item of the input data unchanged, adding its team memberships to the index."""
+        plan = self.plan
+        team_field = plan.team_source_field
+        team_name_key = plan.team_name_key
+        team_id_key = plan.team_id_key
+        extra_keys = tuple(value for _, value in plan.team_extra_fields)
+        email_key = plan.email_key
+        intern = plan.intern or _identity
+        team_member_type = plan.team_member_type
+        attributes = self._attributes
+        members = self._members
+
+        self._worker_teams = None
+        duplicates = 0
+        without_email = 0
+        try:
+            for item in input_data:
+                email = item.get(email_key)
+                for team in item.get(team_field, []):
+                    team_id = team.get(team_id_key)
+                    if not team_id:
+                        continue
+                    team_members = members.get(team_id)
+                    if team_members is None:
+                        team_id = intern(team_id)
+                        attributes[team_id] = (intern(team.get(team_name_key)), tuple(intern(team.get(key)) for key in extra_keys))
+                        team_members = members[team_id] = {}
+                    # Members are identified by their email, so a worker without one cannot be a member
+                    if email is None:
+                        without_email += 1
+                    elif email in team_members:
+                        duplicates += 1
+                    else:
+                        team_members[email] = team_member_type(email)
+
+                yield item
+        finally:
+            self.duplicate_memberships += duplicates
+            self.memberships_without_email += without_email
+
+    def teams_of(self, email: Any) -> list[str]:
+        """Return the IDs of the teams a worker is a member of, in the order the teams were first seen."""
+        if self._worker_teams is None:
+            worker_teams: dict[Any, list[str]] = {}
+            for team_id, team_members in self._members.items():
+                for member_email in team_members:
+                    worker_teams.setdefault(member_email, []).append(team_id)
+            self._worker_teams = worker_teams
+        return list(self._worker_teams.get(email, ()))
+
+    def teams(self) -> list[dict[str, Any]]:
+        """Return the transformed teams, in the order they were first seen."""
+        team_type = self.plan.team_type
+        return [team_type(team_id, name, list(self._members[team_id].values()), *extras)
+                for team_id, (name, extras) in self._attributes.items()]
+
+def transform_teams(input_data: Iterable[dict[str, Any]], mapping: Union[TransformPlan, dict[str, Any]],
+                    rejected: Optional[list[dict[str, Any]]] = None) -> list[dict[str, Any]]:
+    """
+    Transform and return teams data. The input data is consumed in a single pass.
+
+    If the plan validates records, invalid teams are left out, and their quarantine entries are added to rejected (if
+    given).
+    """
+    plan = _as_plan(mapping)
+    index = TeamIndex(plan)
+    # Consumed without a Python loop, as there is nothing to do with each item here
+    deque(index.collect(input_data), maxlen=0)
+    _record_team_metrics(index)
+    return _validate_teams(index.teams(), plan, rejected)
+
+def transform_people_and_teams(input_data: Iterable[dict[str, Any]], mapping: Union[TransformPlan, dict[str, Any]],
+                               processes: int = 1, rejected: Optional[list[dict[str, Any]]] = None) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Transform and return both people and teams data, consuming the input data in a single pass.
+
+    If processes is greater than 1, people are transformed in a process pool as for transform_people, while teams are
+    collected in this process as the records are handed out to the workers. Invalid records are handled as for
+    transform_people and transform_teams.
+    """
+    plan = _as_plan(mapping)
+    index = TeamIndex(plan)
+    people = transform_people(index.collect(input_data), plan, processes=processes, rejected=rejected)
+    _record_team_metrics(index)
+    return people, _validate_teams(index.teams(), plan, rejected)
+
+def _validate_teams(teams: list[dict[str, Any]], plan: TransformPlan, rejected: Optional[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """Return the valid teams, if the plan validates records (see _reject)."""
+    if not plan.validate:
+        return teams
+    valid = []
+    for team in teams:
+        errors = validate_team(team)
+        if errors:
+            _reject('teams', team, errors, rejected)
+        else:
+            valid.append(team)
+    return valid
+
+def _reject(data_type: str, record: dict[str, Any], errors: list[str], rejected: Optional[list[dict[str, Any]]]):
+    """Log a record that is left out as it does not match the Glean schema, and add its quarantine entry to rejected."""
+    key = record.get('email') if data_type == 'people' else record.get('id')
+    logger.warning(f"Leaving out {'employee' if data_type == 'people' else 'team'} {key}, as it is invalid: {'; '.join(errors)}")
+    metrics.get_metrics().add(f'{data_type}_rejected')
+    if rejected is not None:
+        rejected.append(quarantine.entry(data_type, record, (('schema', error) for error in errors)))
+
+def _record_team_metrics(index: TeamIndex):
+    run_metrics = metrics.get_metrics()
+    run_metrics.add('teams_transformed', len(index))
+    if index.duplicate_memberships:
+        logger.info(f"Ignored {index.duplicate_memberships} duplicate team memberships in the Workday report.")
+        run_metrics.add('duplicate_team_memberships', index.duplicate_memberships)
+    if index.memberships_without_email:
+        logger.warning(f"Left out {index.memberships_without_email} team memberships of workers with no email in the Workday report.")
+        run_metrics.add('team_memberships_without_email', index.memberships_without_email)
+
+def transform_people(input_data: Iterable[dict[str, Any]], mapping: Union[TransformPlan, dict[str, Any]], processes: int = 1,
+                     rejected: Optional[list[dict[str, Any]]] = None) -> list[dict[str, Any]]:
+    """
+    Transform and return people data.
+
+    If processes is greater than 1, the records are split into chunks that are transformed in a pool of that many
+    worker processes, and the output is returned in the same order as the input. Inputs of fewer than
+    PARALLEL_TRANSFORM_MIN_RECORDS records are transformed in-process.
+
+    If the plan validates records, invalid people are left out, and their quarantine entries are added to rejected (if
+    given).
+    """
+    plan = _as_plan(mapping)
+    if processes <= 1:
+        return list(iter_transform_people(input_data, plan, rejected=rejected))
+
+    # Only read as far as needed to tell whether the input is large enough to be worth starting a pool for
+    head = []
+    records = iter(input_data)
+    for item in records:
+        head.append(item)
+        if len(head) >= PARALLEL_TRANSFORM_MIN_RECORDS:
+            break
     else:
-        return []
+        return list(iter_transform_people(head, plan, rejected=rejected))
+
+    return _parallel_transform_people(chain(head, records), plan, processes, rejected)
+
+# Transform plan of a worker process in the parallel transform, set once when the worker starts
+_worker_plan: Optional[TransformPlan] = None
+_worker_date: Optional[str] = None
+
+def _init_transform_worker(mapping: dict[str, Any], compact: bool, validate: bool, current_date: str):
+    global _worker_plan, _worker_date
+    _worker_plan = compile_mapping(mapping, compact, validate)
+    _worker_date = current_date
+
+def _transform_people_chunk(chunk: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    rejected = []
+    return list(iter_transform_people(chunk, _worker_plan, current_date=_worker_date, rejected=rejected)), rejected
+
+def _parallel_transform_people(input_data: Iterable[dict[str, Any]], plan: TransformPlan, processes: int,
+                               rejected: Optional[list[dict[str, Any]]] = None) -> list[dict[str, Any]]:
+    """Transform people data in chunks in a process pool, returning the output in the same order as the input."""
+    # Workers are not forked from this process, as it usually runs other threads (the transform itself runs in a thread
+    # next to the event loop) and a fork copies locks held by those threads. They are started by a fork server where
+    # available, which preloads this module, and spawned otherwise. The plan holds closures that cannot be pickled, so
+    # each worker compiles the mapping once when it starts.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context('spawn')
+    initargs = (plan.mapping, plan.compact, plan.validate, time.strftime('%Y-%m-%d'))
+
+    logger.info(f"Transforming records in {processes} processes.")
+    transformed_data = []
+    rejected_count = 0
+    with context.Pool(processes, initializer=_init_transform_worker, initargs=initargs) as pool:
+        for chunk, chunk_rejected in pool.imap(_transform_people_chunk, pipeline.batched(input_data, PARALLEL_TRANSFORM_CHUNK_SIZE)):
+            transformed_data.extend(chunk)
+            rejected_count += len(chunk_rejected)
+            if rejected is not None:
+                rejected.extend(chunk_rejected)
+    # Metrics recorded by the worker processes are not seen by this process
+    metrics.get_metrics().add('records_transformed', len(transformed_data))
+    if rejected_count:
+        metrics.get_metrics().add('people_rejected', rejected_count)
+    return transformed_data
+
+def iter_transform_people(input_data: Iterable[dict[str, Any]], mapping: Union[TransformPlan, dict[str, Any]],
+                          current_date: Optional[str] = None, rejected: Optional[list[dict[str, Any]]] = None) -> Iterator[dict[str, Any]]:
+    """
+    Transform people data one record at a time, consuming the input data in a single pass.
+
+    If the plan validates records, invalid people are left out, and their quarantine entries are added to rejected (if
+    given).
+    """
+    plan = _as_plan(mapping)
+    fields = plan.fields
+    social_networks = plan.social_networks
+    additional_field_names = plan.additional_fields
+    person_type = plan.person_type
+    additional_field_type = plan.additional_field_type
+    social_network_type = plan.social_network_type
+    intern = plan.intern or _identity
+    validate = plan.validate
+    current_date = current_date or time.strftime('%Y-%m-%d')
+
+    transformed = 0
+    try:
+        for item in input_data:
+            transformed_item = {api_key: extract(item) for api_key, extract in fields}
+
+            # Fields missing from the record are skipped, so no separate pass is needed to discover which fields are present
+            transformed_item['additionalFields'] = [
+                additional_field_type(field, intern(value) if isinstance(value, list) else [intern(str(value))])
+                for field in additional_field_names if (value := item.get(field))
+            ]
+
+            handle_missing_name(transformed_item)
+            process_status(transformed_item, current_date)
+            process_type(transformed_item)
+
+            profiles = [
+                social_network_type(network_name, profile_name, url)
+                for network_name, profile_name, customer_key in social_networks if (url := item.get(customer_key))
+            ]
+            if profiles:
+                transformed_item['socialNetworks'] = profiles
+
+            if validate and (errors := validate_employee(transformed_item)):
+                _reject('people', transformed_item, errors, rejected)
+                continue
 
-def process_structured_field(item: dict[str, Any], customer_key: dict[str, str]) -> dict[str, Any]:
-    """Process and return structured field data."""
-    return {sub_api_key: item.get(sub_customer_key) 
-            for sub_api_key, sub_customer_key in customer_key.items()}
+            transformed += 1
+            # The record is built as a dict, as the keys that are set depend on the data, and then stored compactly
+            yield person_type(transformed_item)
+    finally:
+        metrics.get_metrics().add('records_transformed', transformed)
 
 def handle_missing_name(transformed_item: dict[str, Any]):
     """Handle missing name data."""
     if not transformed_item.get('firstName') and not transformed_item.get('lastName'):
-        name_parts = transformed_item.get('preferredName', '').split()
+        preferred_name = transformed_item.get('preferredName')
+        name_parts = preferred_name.split() if isinstance(preferred_name, str) else []
         if name_parts:
             transformed_item['firstName'] = name_parts[0]
             transformed_item['lastName'] = ' '.join(name_parts[1:]) or ' '
 
-def process_status(transformed_item: dict[str, Any]):
-    """Process and set employee status."""
+def process_status(transformed_item: dict[str, Any], current_date: Optional[str] = None):
+    """Process and set employee status. Dates that are not strings are ignored (and rejected by schema validation)."""
     hire_date = transformed_item.get('startDate')
     end_date = transformed_item.get('endDate')
-    current_date = time.strftime('%Y-%m-%d')
+    hire_date = hire_date if isinstance(hire_date, str) else None
+    end_date = end_date if isinstance(end_date, str) else None
+    current_date = current_date or time.strftime('%Y-%m-%d')
     
     if end_date and end_date < current_date:
         transformed_item['status'] = 'EX'
@@ -172,7 +919,10 @@ def process_status(transformed_item: dict[str, Any]):
 def process_type(transformed_item: dict[str, Any]):
     """Process and set employee type."""
     type_value = transformed_item.get('type', 'FULL_TIME')
-    if type_value is not None:
+    if type_value is not None and not isinstance(type_value, str):
+        # Left as is, so that schema validation rejects it
+        logger.warning(f"Invalid 'type' value {type_value!r} for employee {transformed_item.get('email')}. Skipping for this employee.")
+    elif type_value is not None:
         type_value = type_value.replace('-', '_').replace(' ', '_').upper()
         if type_value in ['FULL_TIME', 'CONTRACTOR', 'NON_EMPLOYEE']:
             transformed_item['type'] = type_value